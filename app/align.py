@@ -0,0 +1,87 @@
+import numpy as np,pandas as pd
+from datetime import datetime
+from typing import Optional,List,Tuple
+from app.config import Config
+from app.helpers import FMT_DT
+
+FILL_POLICIES = ("ffill","nearest","none")
+
+def grid_step(interval:int) -> int:
+  """Grid step in seconds for a dataset `interval` (minutes); 0 falls back to `Config.grid_seconds`."""
+  return int(interval) * 60 if interval else Config.grid_seconds
+
+def make_grid(date:str,time_start:str,time_end:str,step:int) -> pd.DatetimeIndex:
+  """Fixed grid for one day from `time_start` to `time_end` (inclusive) every `step` seconds."""
+  start = pd.Timestamp(datetime.strptime(f"{date} {time_start}",f"{FMT_DT} %H:%M:%S"),tz=Config.utc)
+  end = pd.Timestamp(datetime.strptime(f"{date} {time_end}",f"{FMT_DT} %H:%M:%S"),tz=Config.utc)
+  return pd.date_range(start,end,freq=f"{int(step)}s",name="dt")
+
+def align_series(ts:np.ndarray,values:np.ndarray,grid:np.ndarray,fill:str = "ffill",max_staleness:Optional[float] = None) -> np.ndarray:
+  """
+  Resample one irregular series onto `grid` with as-of semantics.
+
+  Args:
+    ts: Sorted sample timestamps as int64 epoch-nanoseconds
+    values: Sample values, same length as `ts`
+    grid: Grid timestamps as int64 epoch-nanoseconds
+    fill: "ffill" takes the last sample at or before each grid step,
+          "nearest" the closest sample on either side, "none" exact matches only
+    max_staleness: Maximum distance in seconds between a grid step and the
+          sample used for it; farther samples leave NaN (default: unbounded)
+
+  Returns:
+    float64 array with one value per grid step
+  """
+  if fill not in FILL_POLICIES: raise ValueError(f"fill should be one of {FILL_POLICIES}, got {fill!r}")
+  out = np.full(len(grid),np.nan)
+  if not len(ts) or not len(grid): return out
+
+  last = len(ts) - 1
+  if fill == "ffill":
+    idx = np.searchsorted(ts,grid,side="right") - 1
+    valid = idx >= 0
+    idx = np.clip(idx,0,last)
+    age = grid - ts[idx]
+  elif fill == "nearest":
+    right = np.searchsorted(ts,grid,side="left")
+    left = np.clip(right - 1,0,last)
+    right = np.clip(right,0,last)
+    idx = np.where(np.abs(ts[right] - grid) < np.abs(grid - ts[left]),right,left)
+    valid = np.ones(len(grid),dtype=bool)
+    age = np.abs(grid - ts[idx])
+  else:
+    idx = np.clip(np.searchsorted(ts,grid,side="left"),0,last)
+    valid = ts[idx] == grid
+    age = np.zeros(len(grid),dtype=np.int64)
+
+  if max_staleness is not None: valid &= age <= int(max_staleness * 1e9)
+  out[valid] = values[idx[valid]]
+  return out
+
+def align_day(frames:dict,columns:List[str],grid:pd.DatetimeIndex,fill:str = "ffill",
+              max_staleness:Optional[float] = None,carry:Optional[dict] = None) -> Tuple[pd.DataFrame,dict]:
+  """
+  Align one day of per-column frames onto `grid`.
+
+  `frames` maps each column to a single-column DataFrame indexed by tz-aware
+  `dt` (or None when the day has no data). `carry` holds the last raw sample
+  `(ts_ns, value)` per column from the previous day so as-of lookups continue
+  across day boundaries; the updated carry is returned with the aligned frame.
+  """
+  carry = dict(carry or {})
+  grid_ns = grid.asi8
+  data = {}
+  for col in columns:
+    frame = frames.get(col)
+    if frame is not None and not frame.empty:
+      ts = frame.index.asi8
+      values = frame.iloc[:,0].to_numpy(dtype=np.float64)
+      keep = ~np.isnan(values)
+      ts,values = ts[keep],values[keep]
+    else: ts,values = np.empty(0,dtype=np.int64),np.empty(0)
+    if col in carry:
+      ts = np.concatenate([[carry[col][0]],ts])
+      values = np.concatenate([[carry[col][1]],values])
+    data[col] = align_series(ts,values,grid_ns,fill,max_staleness)
+    if len(ts): carry[col] = (int(ts[-1]),float(values[-1]))
+  return pd.DataFrame(data,index=grid,columns=columns),carry
@@ -0,0 +1,247 @@
+import os,struct,pathlib,threading,time,random,requests as req
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from typing import Optional,Union
+from app.config import Config
+from app.metrics import HISTORIAN_LATENCY,HISTORIAN_PAYLOAD,HISTORIAN_REQUESTS,HISTORIAN_RETRIES,endpoint_of
+try: import fcntl
+except ImportError: fcntl = None
+
+class CircuitOpenError(req.exceptions.RequestException):
+  """Raised without touching the network while the historian circuit is open."""
+
+class DeadlineError(req.exceptions.Timeout):
+  """Raised without touching the network when no token or in-flight slot frees up before the caller's deadline."""
+
+class SharedState:
+  """
+  A few floats shared by every process of the host through the file `path`,
+  read and written under an exclusive `fcntl` lock; kept in this process
+  when `path` is None or `fcntl` is missing (non-POSIX).
+  """
+  def __init__(self,path:Optional[Union[str,pathlib.Path]],defaults:tuple):
+    self.path = pathlib.Path(path) if path and fcntl else None
+    self.defaults = [float(v) for v in defaults]
+    self.format = f"<{len(defaults)}d"
+    self._values = list(self.defaults)
+    self._lock = threading.Lock()
+    if self.path: self.path.parent.mkdir(parents=True,exist_ok=True)
+
+  @contextmanager
+  def update(self):
+    """The current values as a list to change in place; written back when the block succeeds."""
+    with self._lock:
+      if self.path is None:
+        yield self._values
+        return
+      with open(os.open(self.path,os.O_RDWR | os.O_CREAT,0o644),"r+b") as f:
+        fcntl.flock(f,fcntl.LOCK_EX)
+        raw = f.read()
+        values = list(struct.unpack(self.format,raw)) if len(raw) == struct.calcsize(self.format) else list(self.defaults)
+        yield values
+        f.seek(0)
+        f.write(struct.pack(self.format,*values))
+        f.truncate()
+
+class TokenBucket:
+  """
+  Token bucket: `rate` tokens per second, at most `burst` stored; with `path`,
+  one bucket shared by every process of the host (see `SharedState`).
+  """
+  def __init__(self,rate:float,burst:int,path:Optional[Union[str,pathlib.Path]] = None):
+    self.rate = rate
+    self.burst = burst
+    # tokens, time of the last update (wall clock: comparable across processes)
+    self.state = SharedState(path,(burst,time.time()))
+
+  def acquire(self,timeout:Optional[float] = None) -> Optional[float]:
+    """Take one token, sleeping until one is available; returns the seconds waited, or None after `timeout` seconds without one."""
+    waited = 0.0
+    while True:
+      with self.state.update() as state:
+        now = time.time()
+        state[0] = min(self.burst,state[0] + max(now - state[1],0) * self.rate)
+        state[1] = now
+        if state[0] >= 1:
+          state[0] -= 1
+          return waited
+        delay = (1 - state[0]) / self.rate
+      if timeout is not None and waited + delay > timeout: return None
+      time.sleep(delay)
+      waited += delay
+
+class Slots:
+  """
+  At most `n` concurrent holders across the processes of the host: each holds
+  one `flock`ed slot file under `root`, freed with its process if it dies.
+  A `threading.BoundedSemaphore` when `root` is None or `fcntl` is missing.
+  """
+  def __init__(self,n:int,root:Optional[Union[str,pathlib.Path]] = None):
+    self.n = n
+    self.root = pathlib.Path(root) if root and fcntl else None
+    self._local = threading.BoundedSemaphore(n)
+    if self.root: self.root.mkdir(parents=True,exist_ok=True)
+
+  def acquire(self,timeout:Optional[float] = None):
+    """Wait for a free slot and return it, to be handed back to `release`; None after `timeout` seconds without one."""
+    if self.root is None: return self._local.acquire(timeout=-1 if timeout is None else max(timeout,0)) or None
+    end = None if timeout is None else time.monotonic() + timeout
+    while True:
+      for i in random.sample(range(self.n),self.n):
+        f = open(self.root/f"slot-{i}","a")
+        try:
+          fcntl.flock(f,fcntl.LOCK_EX | fcntl.LOCK_NB)
+          return f
+        except BlockingIOError: f.close()
+      if end is not None and time.monotonic() >= end: return None
+      time.sleep(0.005)
+
+  def release(self,slot):
+    if self.root is None: self._local.release()
+    else: slot.close()
+
+class CircuitBreaker:
+  """
+  Classic closed / open / half-open breaker; with `path`, one breaker shared
+  by every process of the host (see `SharedState`).
+
+  After `threshold` consecutive failures the circuit opens and calls are
+  rejected for `reset_timeout` seconds; then a single trial call is let
+  through (half-open) and its outcome closes or re-opens the circuit.
+  """
+  CLOSED,OPEN,HALF_OPEN = "closed","open","half_open"
+  STATES = (CLOSED,OPEN,HALF_OPEN)
+
+  def __init__(self,threshold:int,reset_timeout:float,path:Optional[Union[str,pathlib.Path]] = None):
+    self.threshold = threshold
+    self.reset_timeout = reset_timeout
+    # state index, consecutive failures, opened at (wall clock), trial call in flight
+    self.shared = SharedState(path,(0,0,0,0))
+
+  @property
+  def state(self) -> str:
+    with self.shared.update() as state: return self.STATES[int(state[0])]
+
+  def allow(self) -> bool:
+    with self.shared.update() as state:
+      if state[0] == 0: return True
+      if state[0] == 1 and time.time() - state[2] >= self.reset_timeout: state[0],state[3] = 2,0
+      if state[0] == 2 and not state[3]:
+        state[3] = 1
+        return True
+      return False
+
+  def record_success(self):
+    with self.shared.update() as state: state[0],state[1],state[3] = 0,0,0
+
+  def record_failure(self):
+    with self.shared.update() as state:
+      state[1] += 1
+      if state[0] == 2 or state[1] >= self.threshold: state[0],state[2],state[3] = 1,time.time(),0
+
+class HistorianClient:
+  """
+  Gateway for every historian HTTP call made by `app.pull`.
+
+  Requests share one keep-alive session per host and pass, in order, a
+  circuit breaker, a token-bucket rate limit and an in-flight concurrency
+  cap. Callers keep their own retry loops but sleep through `backoff`, which
+  is exponential with jitter so concurrent pulls don't retry in lockstep.
+
+  With `state_dir`, the breaker, the bucket and the in-flight cap live in
+  files there, shared by the API and every job worker process of the host,
+  so `rate` and `max_inflight` are global limits; without it they are per
+  process. `stats` counters are always per process.
+  """
+  def __init__(self,rate:float,burst:int,max_inflight:int,threshold:int,reset_timeout:float,max_backoff:float,
+               state_dir:Optional[Union[str,pathlib.Path]] = None):
+    state_dir = pathlib.Path(state_dir) if state_dir else None
+    self.bucket = TokenBucket(rate,burst,state_dir and state_dir/"bucket")
+    self.breaker = CircuitBreaker(threshold,reset_timeout,state_dir and state_dir/"breaker")
+    self.inflight = Slots(max_inflight,state_dir and state_dir/"inflight")
+    self.max_backoff = max_backoff
+    self.counters = dict(requests=0,throttled=0,retried=0,short_circuited=0,failures=0)
+    self._sessions = {}
+    self._lock = threading.Lock()
+
+  def _count(self,name:str):
+    with self._lock: self.counters[name] += 1
+
+  def session(self,url:Optional[str] = None) -> req.Session:
+    """Shared keep-alive session for the host of `url` (default: Config.url)."""
+    host = urlsplit(url or Config.url).netloc
+    with self._lock:
+      session = self._sessions.get(host)
+      if session is None:
+        session = req.Session()
+        adapter = HTTPAdapter(pool_connections=1,pool_maxsize=max(Config.pull_workers,Config.realtime_workers),max_retries=0)
+        session.mount("https://",adapter)
+        session.mount("http://",adapter)
+        session.verify = False
+        self._sessions[host] = session
+    return session
+
+  def post(self,url:str,session:Optional[req.Session] = None,deadline:Optional[float] = None,**kwargs) -> req.Response:
+    """
+    POST through the breaker, the rate limit and the in-flight cap. With
+    `deadline` (a `time.perf_counter()` value), waiting for a token or a slot
+    stops there with `DeadlineError`, and the request `timeout` is capped at
+    the time left.
+    """
+    endpoint = endpoint_of(url)
+    left = lambda: None if deadline is None else deadline - time.perf_counter()
+    if not self.breaker.allow():
+      self._count("short_circuited")
+      HISTORIAN_REQUESTS.labels(endpoint,"short_circuited").inc()
+      raise CircuitOpenError(f"Circuit open for {urlsplit(url).netloc}: historian is failing, retry later")
+    waited = self.bucket.acquire(left())
+    slot = None if waited is None else self.inflight.acquire(left())
+    if slot is not None and deadline is not None and left() <= 0:
+      self.inflight.release(slot)
+      slot = None
+    if slot is None:
+      HISTORIAN_REQUESTS.labels(endpoint,"deadline").inc()
+      raise DeadlineError(f"Timed out waiting for a historian {'slot' if waited is not None else 'token'} before the deadline")
+    if waited > 0: self._count("throttled")
+    if deadline is not None: kwargs["timeout"] = min(kwargs.get("timeout") or float("inf"),left())
+    try:
+      self._count("requests")
+      t0 = time.perf_counter()
+      try:
+        result = (session or self.session(url)).post(url,**kwargs)
+        HISTORIAN_PAYLOAD.labels(endpoint).observe(len(result.content))
+      except Exception as e:
+        # any error must be recorded, or a half-open trial would never end and short-circuit every later call
+        self._count("failures")
+        self.breaker.record_failure()
+        outcome = ("timeout" if isinstance(e,req.exceptions.Timeout) else "connection_error" if isinstance(e,req.exceptions.ConnectionError)
+                   else "error")
+        HISTORIAN_REQUESTS.labels(endpoint,outcome).inc()
+        raise
+      finally: HISTORIAN_LATENCY.labels(endpoint).observe(time.perf_counter() - t0)
+    finally: self.inflight.release(slot)
+    if result.status_code >= 500:
+      self._count("failures")
+      self.breaker.record_failure()
+    else: self.breaker.record_success()
+    HISTORIAN_REQUESTS.labels(endpoint,str(result.status_code)).inc()
+    return result
+
+  def backoff(self,attempt:int,base:float,url:Optional[str] = None):
+    """Sleep before retry `attempt + 1`: base * 2**attempt (capped), with equal jitter."""
+    self._count("retried")
+    HISTORIAN_RETRIES.labels(endpoint_of(url or Config.url)).inc()
+    delay = min(self.max_backoff,base * 2 ** attempt)
+    time.sleep(delay / 2 + random.uniform(0,delay / 2))
+
+  def stats(self) -> dict:
+    with self._lock: counters = dict(self.counters)
+    return dict(**counters,circuit=self.breaker.state)
+
+
+
+
+CLIENT = HistorianClient(rate=Config.historian_rate,burst=Config.historian_burst,max_inflight=Config.historian_inflight,
+                         threshold=Config.historian_breaker_threshold,reset_timeout=Config.historian_breaker_reset,
+                         max_backoff=Config.historian_max_backoff,state_dir=Config.dir/"storages"/"cache"/"historian")
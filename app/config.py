@@ -3,17 +3,40 @@ from datetime import timedelta,timezone
 from dataclasses import dataclass
 
 DELAY = int(os.environ.get("DELAY",0))
-WORKER = False if str(os.environ.get("WORKER") == "0") else True
+# run the job dispatcher in the API process; with WORKER=0, start it separately (`python -m app.jobs`)
+WORKER = os.environ.get("WORKER","1") != "0"
 
 @dataclass
 class Config:
   dir_app = pathlib.Path(__file__).parent
   dir = pathlib.Path(__file__).parent.parent
-  url   :str = "https://10.3.13.1/beta2/application/api"
-  token :str = "8bcd07bfd39cee93071bd10ed3ac1234"
-  key   :str = "f029c429282463ae3088bd25e9e4be72"
+  url   :str = os.environ.get("IP","https://10.3.13.1/beta2/application/api")
+  token :str = os.environ.get("TOKEN","8bcd07bfd39cee93071bd10ed3ac1234")
+  key   :str = os.environ.get("KEY","f029c429282463ae3088bd25e9e4be72")
   verbose = bool(os.environ.get("VERBOSE",False))
   utc = timezone(timedelta(hours=7))
+  pull_workers :int = int(os.environ.get("PULL_WORKERS",8))
+  realtime_workers :int = int(os.environ.get("REALTIME_WORKERS",64))
+  pull_retry_rounds :int = int(os.environ.get("PULL_RETRY_ROUNDS",2))
+  pull_retry_delay :float = float(os.environ.get("PULL_RETRY_DELAY",1.0))
+  historian_rate :float = float(os.environ.get("HISTORIAN_RATE",50))
+  historian_burst :int = int(os.environ.get("HISTORIAN_BURST",20))
+  historian_inflight :int = int(os.environ.get("HISTORIAN_INFLIGHT",16))
+  historian_breaker_threshold :int = int(os.environ.get("HISTORIAN_BREAKER_THRESHOLD",10))
+  historian_breaker_reset :float = float(os.environ.get("HISTORIAN_BREAKER_RESET",30))
+  historian_max_backoff :float = float(os.environ.get("HISTORIAN_MAX_BACKOFF",10))
+  job_workers :int = int(os.environ.get("JOB_WORKERS",2))
+  job_poll :float = float(os.environ.get("JOB_POLL",1.0))
+  job_lease :float = float(os.environ.get("JOB_LEASE",60))
+  tag_refetch_after :float = float(os.environ.get("TAG_REFETCH_AFTER",60))
+  grid_seconds :int = int(os.environ.get("GRID_SECONDS",60))
+  fill_policy :str = os.environ.get("FILL_POLICY","ffill")
+  max_staleness :float = float(os.environ.get("MAX_STALENESS",0)) or None
+  db_url :str = os.environ.get("DATABASE_URL","sqlite:///./storages/rtdb/data.db")
+  db_pool_size :int = int(os.environ.get("DB_POOL_SIZE",10))
+  db_max_overflow :int = int(os.environ.get("DB_MAX_OVERFLOW",20))
+  db_busy_timeout :float = float(os.environ.get("DB_BUSY_TIMEOUT",30))
+  db_wal :bool = os.environ.get("DB_WAL","1") != "0"
 
 COLOR_MAP : dict = {
     "DEBUG": "\033[36m",    # Cyan
@@ -1,12 +1,81 @@
-import logging
+import logging,time
+from contextlib import contextmanager
 from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.config import Config
 from app.database.orm import Dataset,ModelML
+from app.metrics import DB_SESSION
 # Gunakan path absolut yang lebih aman
-DATABASE_URL = "sqlite:///./storages/rtdb/data.db"
+DATABASE_URL = Config.db_url
+
+
+def make_engine(url:str = None,pool_size:int = None,max_overflow:int = None,busy_timeout:float = None,wal:bool = None):
+  """
+  Engine for `url` (default `Config.db_url`), tuned for concurrent pull writers and API readers.
+
+  SQLite runs in WAL mode, so readers never block the writer nor the writer
+  the readers, with `synchronous=NORMAL` (safe in WAL, fsync only at
+  checkpoints) and a busy timeout so writers queue for the lock instead of
+  failing with "database is locked". Transactions are begun by SQLAlchemy;
+  sessions from `session_scope(write=True)` take the write lock up front
+  (`BEGIN IMMEDIATE`), so a read-then-write transaction can't fail to upgrade
+  when another writer committed in between. Pool size and overflow apply to
+  file databases (`Config.db_pool_size`, `Config.db_max_overflow`).
+  """
+  url = url or Config.db_url
+  pool = dict(pool_size=pool_size or Config.db_pool_size,max_overflow=Config.db_max_overflow if max_overflow is None else max_overflow)
+  if not url.startswith("sqlite"): return create_engine(url,echo=False,pool_pre_ping=True,**pool)
+  busy_timeout = Config.db_busy_timeout if busy_timeout is None else busy_timeout
+  memory = is_memory(url)
+  engine = create_engine(url,echo=False,connect_args={"check_same_thread":False,"timeout":busy_timeout},
+                         **(dict(poolclass=StaticPool) if memory else pool))
+  return tune_sqlite(engine,busy_timeout,Config.db_wal if wal is None else wal,memory)
+
+def make_async_engine(url:str = None,pool_size:int = None,max_overflow:int = None,busy_timeout:float = None,wal:bool = None):
+  """
+  Async engine (aiosqlite) on the database of `make_engine`, for the API handlers.
+
+  Same pragmas and transaction handling as `make_engine`; queries run on
+  aiosqlite's connection threads, so awaiting them never blocks the event loop.
+  """
+  url = async_url(url or Config.db_url)
+  pool = dict(pool_size=pool_size or Config.db_pool_size,max_overflow=Config.db_max_overflow if max_overflow is None else max_overflow)
+  if not url.startswith("sqlite"): return create_async_engine(url,echo=False,pool_pre_ping=True,**pool)
+  busy_timeout = Config.db_busy_timeout if busy_timeout is None else busy_timeout
+  memory = is_memory(url)
+  engine = create_async_engine(url,echo=False,connect_args={"timeout":busy_timeout},**(dict(poolclass=StaticPool) if memory else pool))
+  tune_sqlite(engine.sync_engine,busy_timeout,Config.db_wal if wal is None else wal,memory)
+  return engine
+
+def async_url(url:str) -> str:
+  """`sqlite:///...` as `sqlite+aiosqlite:///...`; other URLs must already name an async driver."""
+  return url.replace("sqlite:","sqlite+aiosqlite:",1) if url.startswith("sqlite:") else url
+
+def is_memory(url:str) -> bool: return url.split(":",1)[1] in ("//","///:memory:")
+
+def tune_sqlite(engine,busy_timeout:float,wal:bool,memory:bool):
+  """Pragmas on every new connection and SQLAlchemy-issued `BEGIN` (see `make_engine`)."""
+  @event.listens_for(engine,"connect")
+  def on_connect(dbapi_conn,_):
+    dbapi_conn.isolation_level = None
+    cursor = dbapi_conn.cursor()
+    if wal and not memory: cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+    cursor.close()
+
+  @event.listens_for(engine,"begin")
+  def on_begin(conn): conn.exec_driver_sql("BEGIN IMMEDIATE" if conn.get_execution_options().get("sqlite_immediate") else "BEGIN")
+
+  return engine
 
 # Buat engine global
-engine = create_engine(DATABASE_URL, echo=False)
+engine = make_engine()
+async_engine = make_async_engine()
 
 # Konfigurasi logging untuk SQLAlchemy
 logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
@@ -14,7 +83,54 @@ logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
 
 def get_session():
   """Dependency untuk mendapatkan session database."""
-  with Session(engine) as session: yield session
+  t0 = time.perf_counter()
+  try:
+    with Session(engine) as session: yield session
+  finally: DB_SESSION.observe(time.perf_counter() - t0)
+
+
+def get_write_session():
+  """Like `get_session`, for handlers that write: the transaction takes the write lock up front (see `session_scope`)."""
+  with session_scope(write=True) as session: yield session
+
+
+async def get_async_session():
+  """Dependency for async handlers: an `AsyncSession` whose objects stay readable after commit."""
+  async for session in _async_session(async_engine): yield session
+
+
+async def get_async_write_session():
+  """Like `get_async_session`, for handlers that write: the transaction takes the write lock up front (see `session_scope`)."""
+  async for session in _async_session(async_engine.execution_options(sqlite_immediate=True)): yield session
+
+
+async def _async_session(bind):
+  t0 = time.perf_counter()
+  try:
+    async with AsyncSession(bind,expire_on_commit=False) as session: yield session
+  finally: DB_SESSION.observe(time.perf_counter() - t0)
+
+
+@contextmanager
+def session_scope(write:bool = False,bind = None):
+  """
+  Short-lived session for one unit of work: commits on success, rolls back on error.
+
+  Objects stay readable after the block (no expiry on commit). With `write`,
+  the transaction holds the SQLite write lock from its first statement.
+  """
+  bind = bind or engine
+  if write: bind = bind.execution_options(sqlite_immediate=True)
+  t0 = time.perf_counter()
+  try:
+    with Session(bind,expire_on_commit=False) as session:
+      try:
+        yield session
+        session.commit()
+      except BaseException:
+        session.rollback()
+        raise
+  finally: DB_SESSION.observe(time.perf_counter() - t0)
 
 
 def init_db(drop_existing: bool = False):
@@ -33,4 +149,3 @@ def init_db(drop_existing: bool = False):
 
 if __name__ == "__main__":
   init_db()
-
@@ -2,14 +2,22 @@ from sqlalchemy.orm import query
 from sqlmodel import SQLModel, Field, Column, JSON,Session,select,Relationship,delete,func
 from app.database.schemas import (
   MetaDataset,PreprocessingSchema,DatasetResponseSchema,
-  TaskType,StatusProcess,ModelResponseSchema,ViewModels
+  TaskType,StatusProcess,ModelResponseSchema,ViewModels,JobResponseSchema
 )
 from sqlalchemy import Boolean,String
+from sqlalchemy.orm import selectinload
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import Optional,List,Union,Any
-import sqlalchemy as sa,pandas as pd,os,pathlib
+from datetime import datetime
+import sqlalchemy as sa,pandas as pd,os,pathlib,json,base64,time
 from app.config import Config
+from app.storage import dataset_store
+
+SORTABLE = ("id","name","start_date","end_date","status","task_type")
 
 class Dataset(SQLModel, table=True):
+  # task_type/status filters of the list and /datasets/filter endpoints
+  __table_args__ = (sa.Index("ix_dataset_task_type_status","task_type","status"),sa.Index("ix_dataset_status","status"))
   id: int = Field(default=None, primary_key=True, nullable=False)
   task_type: TaskType = Field(sa_column=Column(sa.Enum(TaskType), nullable=False))
   description:str = Field(sa_column=Column(String,default=""))
@@ -36,7 +44,7 @@ class Dataset(SQLModel, table=True):
     return DatasetResponseSchema(names=self.name,description=self.description,task_type=self.task_type.name,
                                  features=self.features,target=self.target,
                                  start_date=self.start_date,end_date=self.end_date,
-                                 meta=self.meta,is_valid=self.is_valid,interval=self.interval,
+                                 meta=self.meta or None,is_valid=self.is_valid,interval=self.interval,
                                  status=self.status.name,top_model=self.top_model,models=self.get_models())
   
   @classmethod
@@ -45,16 +53,18 @@ class Dataset(SQLModel, table=True):
     n_datas = len(datas)
     return { "recordsTotal":total, "recordsFiltered": n_datas, "data":datas }
 
-  def open_dataframe(self):
-    path = Config.dir/self.name/"data.csv"
-    if not os.path.exists(path): return None
-    return pd.read_csv(path)
+  @classmethod
+  async def ato_responses(cls,datas,db:AsyncSession):
+    total = (await db.exec(select(func.count(cls.id)))).one()
+    return { "recordsTotal":total, "recordsFiltered": len(datas), "data":datas }
+
+  def open_dataframe(self,columns:Optional[List[str]] = None,start = None,end = None):
+    store = dataset_store(self.name)
+    if not store.exists(): return None
+    return store.read(columns=columns,start=start,end=end)
 
   def check_path(self) -> bool:
-    path  = Config.dir/self.name
-    if not os.path.exists(path): return False
-    if not os.path.exists(path/"data.csv"):return False
-    return True
+    return dataset_store(self.name).exists()
 
   def save(self, db: Session):
     """
@@ -69,12 +79,26 @@ class Dataset(SQLModel, table=True):
     db.commit()
     db.refresh(self)
 
+  async def asave(self,db:AsyncSession) -> "Dataset":
+    """Async `save`; returns the persistent instance with its models loaded."""
+    target = self
+    if self.id is not None:
+      existing = await db.get(Dataset,self.id)
+      if existing:
+        for field,value in self.model_dump().items(): setattr(existing,field,value)
+        target = existing
+    if target is self: db.add(self)
+    await db.commit()
+    await db.refresh(target)
+    await db.refresh(target,["models"])
+    return target
+
   def get_models(self):
     if not self.models : return []
     else: 
       return [
           ViewModels(name=i.name,evaluation=i.evaluation,algorithm=i.algorithm,
-                     description=TaskType.get_description_model(i.dataset.task_type,i.algorithm),path=i.path).model_dump()\
+                     description=TaskType.get_description_model(self.task_type,i.algorithm),path=i.path).model_dump()\
         for i in self.models if i.is_active]
 
   @classmethod
@@ -87,16 +111,98 @@ class Dataset(SQLModel, table=True):
   def get_by_name(cls,name,db:Session,*fields): return db.exec(cls._stmt(*fields).where(cls.name == name)).first()
 
   @classmethod
-  def get_by_task_type(cls,task_type,db:Session,*fields):
-    query = cls._stmt(*fields).where(cls.task_type.contains(task_type))
-    return db.exec(query).all()
+  def get_by_task_type(cls,task_type:str,db:Session,*fields):
+    """Datasets of the `TaskType.family` of `task_type`, through `ix_dataset_task_type_status`."""
+    return db.exec(cls._stmt(*fields).where(cls.task_type.in_(TaskType.family(task_type)))).all()
+
+  @classmethod
+  def delete_by_task_type(cls,task_type:str,db:Session) -> List[str]:
+    """Delete the datasets of `get_by_task_type` and their models in one transaction; returns their names."""
+    rows = cls.get_by_task_type(task_type,db,cls.id,cls.name)
+    ids = [row.id for row in rows]
+    if ids:
+      db.exec(delete(ModelML).where(ModelML.dataset_id.in_(ids)))
+      db.exec(delete(cls).where(cls.id.in_(ids)))
+      db.commit()
+    return [row.name for row in rows]
+
+  # Async variants for the API: lazy loads can't run on an AsyncSession, so whole rows come with their models
+  @classmethod
+  def _eager(cls,query,fields): return query if fields else query.options(selectinload(cls.models))
+
+  @classmethod
+  async def aget_by_name(cls,name,db:AsyncSession,*fields):
+    return (await db.exec(cls._eager(cls._stmt(*fields).where(cls.name == name),fields))).first()
+
+  @classmethod
+  async def aget_by_task_type(cls,task_type:str,db:AsyncSession,*fields):
+    return (await db.exec(cls._eager(cls._stmt(*fields).where(cls.task_type.in_(TaskType.family(task_type))),fields))).all()
+
+  @classmethod
+  def filters(cls,status:Optional[StatusProcess] = None,task_type:Optional[TaskType] = None,
+              date_from:Optional[str] = None,date_to:Optional[str] = None,search:Optional[str] = None) -> list:
+    """WHERE clauses for the dataset list; `date_from`/`date_to` (YYYYMMDD) keep datasets overlapping that range."""
+    conds = []
+    if status: conds.append(cls.status == status)
+    if task_type: conds.append(cls.task_type == task_type)
+    if date_from: conds.append(cls.end_date >= date_from)
+    if date_to: conds.append(cls.start_date <= date_to)
+    if search: conds.append(sa.or_(cls.name.ilike(f"%{search}%"),cls.description.ilike(f"%{search}%")))
+    return conds
+
+  @classmethod
+  def page(cls,db:Session,after:Optional[str] = None,limit:int = 50,sort:str = "id",desc:bool = False,**filters) -> dict:
+    """
+    One page of datasets (with their models) in the DataTables shape plus the `next` cursor.
+
+    Pages are keyset-paginated on `(sort, id)`: `after` is the `next` cursor of
+    the previous page, so deep pages cost the same as the first one and rows
+    inserted meanwhile do not shift them. Both counts come from one query and
+    models are loaded with one extra `selectinload` query, whatever the page size.
+    """
+    counts,query = cls._page(after,limit,sort,desc,**filters)
+    return cls._page_result(db.exec(counts).one(),db.exec(query).all(),limit,sort)
+
+  @classmethod
+  async def apage(cls,db:AsyncSession,after:Optional[str] = None,limit:int = 50,sort:str = "id",desc:bool = False,**filters) -> dict:
+    """Async `page`."""
+    counts,query = cls._page(after,limit,sort,desc,**filters)
+    return cls._page_result((await db.exec(counts)).one(),(await db.exec(query)).all(),limit,sort)
+
+  @classmethod
+  def _page(cls,after:Optional[str],limit:int,sort:str,desc:bool,**filters) -> tuple:
+    """The counts and rows statements of one page."""
+    conds = cls.filters(**filters)
+    column = getattr(cls,sort)
+    counts = select(func.count(cls.id),func.count(cls.id).filter(sa.and_(*conds)) if conds else func.count(cls.id))
+    query = select(cls).where(*conds).options(selectinload(cls.models))
+    if after:
+      value,last = decode_cursor(after,column)
+      query = query.where(sa.or_(column < value,sa.and_(column == value,cls.id < last)) if desc else
+                          sa.or_(column > value,sa.and_(column == value,cls.id > last)))
+    return counts,query.order_by(*((column.desc(),cls.id.desc()) if desc else (column,cls.id))).limit(limit + 1)
+
+  @classmethod
+  def _page_result(cls,counts,rows,limit:int,sort:str) -> dict:
+    (total,filtered),more,rows = counts,len(rows) > limit,rows[:limit]
+    return {"recordsTotal":total,"recordsFiltered":filtered,"data":[row.to_response() for row in rows],
+            "next":encode_cursor(getattr(rows[-1],sort),rows[-1].id) if more else None}
+
+  @classmethod
+  def _all_stmt(cls):
+    return cls._stmt(cls.task_type,cls.name,cls.description,cls.features,
+                     cls.target,cls.start_date,cls.end_date,
+                     cls.interval, cls.status,cls.is_valid,cls.top_model)
 
   @classmethod
-  def get_all(cls, db: Session,to_response:bool=True):
-    rows = db.exec(cls._stmt(cls.task_type,cls.name,cls.description,cls.features,
-                             cls.target,cls.start_date,cls.end_date,
-                             cls.interval, cls.status,cls.is_valid,cls.top_model
-                             )).all()
+  def get_all(cls, db: Session,to_response:bool=True): return cls._summaries(db.exec(cls._all_stmt()).all(),to_response)
+
+  @classmethod
+  async def aget_all(cls,db:AsyncSession,to_response:bool=True):
+    return cls._summaries((await db.exec(cls._all_stmt())).all(),to_response)
+
+  @classmethod
+  def _summaries(cls,rows,to_response:bool):
     if not rows: return None
     if to_response:
       return [
@@ -123,6 +229,8 @@ class Dataset(SQLModel, table=True):
     db.commit()
 
 class ModelML(SQLModel, table=True):
+  # models of a dataset (`Dataset.models`, active ones in `get_models`) and lookups by status
+  __table_args__ = (sa.Index("ix_modelml_dataset_id_is_active","dataset_id","is_active"),sa.Index("ix_modelml_status","status"))
   id: int = Field(primary_key=True, nullable=False)
   dataset_id: int = Field(foreign_key="dataset.id")
   name: str = Field(nullable=False)
@@ -171,6 +279,161 @@ class ModelML(SQLModel, table=True):
   @classmethod
   def get_by_name(cls,name,db:Session,*fields): return db.exec(cls._stmt(*fields).where(cls.name == name)).first()
 
+  @classmethod
+  async def aget_by_name(cls,name,db:AsyncSession,*fields):
+    query = cls._stmt(*fields).where(cls.name == name)
+    return (await db.exec(query if fields else query.options(selectinload(cls.dataset)))).first()
+
+  async def asave(self,db:AsyncSession) -> "ModelML":
+    """Async `save`; returns the persistent instance with its dataset loaded."""
+    target = self
+    if self.id is not None:
+      existing = await db.get(ModelML,self.id)
+      if existing:
+        for field,value in self.model_dump().items(): setattr(existing,field,value)
+        target = existing
+    if target is self: db.add(self)
+    await db.commit()
+    await db.refresh(target)
+    await db.refresh(target,["dataset"])
+    return target
+
+def encode_cursor(value,id:int) -> str:
+  return base64.urlsafe_b64encode(json.dumps([getattr(value,"name",value),id]).encode()).decode()
+
+def decode_cursor(cursor:str,column) -> tuple:
+  """(sort value, id) of a cursor from `encode_cursor`; enum values come back as members of the column's enum."""
+  try:
+    value,id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    enum = getattr(column.type,"enum_class",None)
+    return (enum[value] if enum else value),int(id)
+  except (ValueError,TypeError,KeyError) as e: raise ValueError(f"Invalid cursor: {cursor}") from e
+
+JOB_FINISHED = (StatusProcess.SUCCESS_PULL,StatusProcess.ERROR_PULL,StatusProcess.CANCELLED)
+
+class Job(SQLModel, table=True):
+  id: int = Field(default=None, primary_key=True, nullable=False)
+  kind: str = Field(sa_column=Column(String, nullable=False)) # pull | extend
+  dataset_name: str = Field(sa_column=Column(String, nullable=False, index=True))
+  params: dict = Field(default_factory=dict, sa_column=Column(JSON))
+  priority: int = Field(default=0)
+  status: StatusProcess = Field(sa_column=Column(sa.Enum(StatusProcess),nullable=False,default=StatusProcess.QUEUED))
+  progress: float = Field(default=0.0)
+  error: Optional[str] = Field(default=None)
+  created_at: str = Field(default_factory=lambda: datetime.now().isoformat())
+  started_at: Optional[str] = Field(default=None)
+  finished_at: Optional[str] = Field(default=None)
+  owner: Optional[str] = Field(default=None)          # "<host>:<pid>" of the dispatcher running the job
+  heartbeat_at: Optional[float] = Field(default=None) # epoch seconds, renewed by the owner while the job runs
+
+  def to_response(self) -> JobResponseSchema:
+    return JobResponseSchema(id=self.id,kind=self.kind,dataset_name=self.dataset_name,params=self.params,
+                             priority=self.priority,status=self.status.name,progress=self.progress,error=self.error,
+                             created_at=self.created_at,started_at=self.started_at,finished_at=self.finished_at)
+
+  @classmethod
+  def enqueue(cls,db:Session,kind:str,dataset_name:str,priority:int=0,commit:bool=True,**params) -> "Job":
+    job = cls(kind=kind,dataset_name=dataset_name,priority=priority,params=params,status=StatusProcess.QUEUED)
+    db.add(job)
+    if commit:
+      db.commit()
+      db.refresh(job)
+    return job
+
+  @classmethod
+  def claim_next(cls,db:Session,owner:Optional[str] = None) -> Optional["Job"]:
+    """Atomically move the highest-priority (then oldest) QUEUED job to RUNNING_PULL, leased to `owner`."""
+    while True:
+      job = db.exec(select(cls).where(cls.status == StatusProcess.QUEUED)
+                    .order_by(cls.priority.desc(),cls.id).limit(1)).first()
+      if not job: return None
+      claimed = db.exec(sa.update(cls).where(cls.id == job.id,cls.status == StatusProcess.QUEUED)
+                        .values(status=StatusProcess.RUNNING_PULL,started_at=datetime.now().isoformat(),
+                                owner=owner,heartbeat_at=time.time()))
+      db.commit()
+      if claimed.rowcount:
+        db.refresh(job)
+        return job
+
+  @classmethod
+  def expired(cls,lease:float):
+    """Condition for RUNNING jobs whose owner has not renewed its lease for `lease` seconds."""
+    return sa.and_(cls.status == StatusProcess.RUNNING_PULL,sa.or_(cls.heartbeat_at.is_(None),cls.heartbeat_at < time.time() - lease))
+
+  @classmethod
+  def live(cls,dataset_name:str,lease:Optional[float] = None):
+    """Condition for the jobs of `dataset_name` still queued or running under an unexpired lease."""
+    lease = Config.job_lease if lease is None else lease
+    return sa.and_(cls.dataset_name == dataset_name,
+                   sa.or_(cls.status == StatusProcess.QUEUED,
+                          sa.and_(cls.status == StatusProcess.RUNNING_PULL,cls.heartbeat_at >= time.time() - lease)))
+
+  @classmethod
+  async def ahas_live(cls,dataset_name:str,db:AsyncSession) -> bool:
+    return (await db.exec(select(cls.id).where(cls.live(dataset_name)).limit(1))).first() is not None
+
+  @classmethod
+  async def aabandon_expired(cls,dataset_name:str,db:AsyncSession):
+    """Fail the expired RUNNING jobs of `dataset_name` (not committed), so `requeue_running` does not run them next to a resume."""
+    await db.exec(sa.update(cls).where(cls.dataset_name == dataset_name,cls.expired(Config.job_lease))
+                  .values(status=StatusProcess.ERROR_PULL,error="Lease expired, superseded by a resume",
+                          finished_at=datetime.now().isoformat()))
+
+  @classmethod
+  def heartbeat(cls,ids:List[int],owner:str,db:Session):
+    """Renew the lease of the jobs `owner` is running."""
+    if not ids: return
+    db.exec(sa.update(cls).where(cls.id.in_(ids),cls.owner == owner,cls.status == StatusProcess.RUNNING_PULL).values(heartbeat_at=time.time()))
+    db.commit()
+
+  @classmethod
+  def requeue_running(cls,db:Session,lease:Optional[float] = None) -> int:
+    """
+    Put jobs left RUNNING by a dead dispatcher (lease expired, see `expired`)
+    back in the queue; pulls resume from their manifest. Jobs of live
+    dispatchers, e.g. other API processes, are left alone.
+    """
+    jobs = db.exec(select(cls).where(cls.expired(Config.job_lease if lease is None else lease))).all()
+    for job in jobs:
+      job.status,job.owner,job.heartbeat_at = StatusProcess.QUEUED,None,None
+      if job.kind == "pull": job.params = {**job.params,"resume":True}
+    db.commit()
+    return len(jobs)
+
+  @classmethod
+  def set_progress(cls,id,progress:float,db:Session) -> StatusProcess:
+    """Store progress and return the current status so workers can notice a cancellation."""
+    db.exec(sa.update(cls).where(cls.id == id,cls.status == StatusProcess.RUNNING_PULL).values(progress=round(progress,4)))
+    db.commit()
+    return db.exec(select(cls.status).where(cls.id == id)).one()
+
+  @classmethod
+  def finish(cls,id,status:StatusProcess,db:Session,error:Optional[str]=None):
+    values = dict(status=status,error=error,finished_at=datetime.now().isoformat())
+    if status == StatusProcess.SUCCESS_PULL: values["progress"] = 1.0
+    db.exec(sa.update(cls).where(cls.id == id,cls.status != StatusProcess.CANCELLED).values(**values))
+    db.commit()
+
+  @classmethod
+  def cancel(cls,id,db:Session) -> Optional["Job"]:
+    job = db.get(cls,id)
+    if not job or job.status in JOB_FINISHED: return job
+    job.status = StatusProcess.CANCELLED
+    job.finished_at = datetime.now().isoformat()
+    db.commit()
+    db.refresh(job)
+    return job
+
+  @classmethod
+  def get_by_id(cls,id,db:Session): return db.get(cls,id)
+
+  @classmethod
+  def get_all(cls,db:Session,status:Optional[StatusProcess]=None,dataset_name:Optional[str]=None):
+    query = select(cls)
+    if status: query = query.where(cls.status == status)
+    if dataset_name: query = query.where(cls.dataset_name == dataset_name)
+    return db.exec(query.order_by(cls.id.desc())).all()
+
 
 if __name__ == "__main__":
   pass
@@ -48,6 +48,17 @@ class TaskType(Enum):
     lists = list(cls.__members__.values())
     return [d for d in lists if "Dummy" not in str(d)]
 
+  @classmethod
+  def family(cls,name:str) -> List["TaskType"]:
+    """
+    Task types a filter on `name` selects: a base type with its dummy
+    (`Classification` -> Classification, ClassificationDummy), a dummy type
+    alone, or every dummy for `Dummy`. KeyError for any other name.
+    """
+    if name == "Dummy": return cls.dummies()
+    task_type = cls[name]
+    return [task_type] if task_type.name != task_type.base else [t for t in cls if t.base == task_type.name]
+
   def is_classification(self): return self in [TaskType.Classification,TaskType.ClassificationDummy]
   def is_regression(self): return self in [TaskType.Regression,TaskType.RegressionDummy]
   def is_clustering(self): return self in [TaskType.Clustering,TaskType.ClusteringDummy]
@@ -93,6 +104,12 @@ class TaskType(Enum):
   @property
   def base(self) -> str: return self.name.replace("Dummy","")
 
+  @staticmethod
+  def get_description_model(task_type:"TaskType",algorithm:str) -> str:
+    """Full name of a PyCaret algorithm id (e.g. `rf`) from `algorithm_list.json`, or the id itself."""
+    try: return TaskType[task_type.base].algorithms().get(algorithm,algorithm)
+    except (AssertionError,ValueError): return algorithm
+
 
 class MetaDataset(BaseModel):
   created_by:str
@@ -107,6 +124,9 @@ class MetaDataset(BaseModel):
   random_seed:Optional[int]
   columns:List[Any]
   path:str
+  # True: `missing_values` counts the cells still empty after grid alignment and fill (what is stored);
+  # None: written before, counting the NaNs of the unfilled join
+  missing_after_fill:Optional[bool] = None
 
 class DatasetRequestSchema(BaseModel):
   description:str = ""
@@ -172,6 +192,32 @@ class InferenceRequestSchema(BaseModel):
   dataset_name:str
   X:Any
 
+class RealtimeSnapshotRequestSchema(BaseModel):
+  tags:List[Union[str,int]] = []
+  dataset_name:Optional[str] = None
+  deadline:float = 1.0
+
+class RealtimeSnapshotResponseSchema(BaseModel):
+  timestamp:str
+  tags:List[str]
+  values:List[Optional[float]]
+  errors:Dict[str,str]
+  latency_ms:Dict[str,Optional[float]]
+  elapsed_ms:float
+
+class JobResponseSchema(BaseModel):
+  id:int
+  kind:str
+  dataset_name:str
+  params:dict = {}
+  priority:int
+  status:str
+  progress:float
+  error:Optional[str] = None
+  created_at:str
+  started_at:Optional[str] = None
+  finished_at:Optional[str] = None
+
 class InitiateRequestSchema(BaseModel):
   description:str
   task_type:str
@@ -5,6 +5,8 @@ from app.config import Config
 from app.helpers import init_storages_dataset
 from app.database.schemas import TaskType,DatasetRequestSchema,StatusProcess,MetaDataset
 from app.database.orm import Dataset
+from app.storage import dataset_store
+from app.stats import Profile
 
 
 INDEX_DATASET_DUMMY : dict = {
@@ -41,8 +43,11 @@ def create_dummy(payload:DatasetRequestSchema) -> Dataset:
     payload.target = target
   else: features = columns
   df["dt"] = generate_range_dt(len(df))
-  path = f"storages/{name}/data.csv"
-  df.to_csv(Config.dir/path,index=False)
+  path = f"storages/{name}/data"
+  store = dataset_store(name)
+  store.write(df)
+  profile = Profile.from_frame(df)
+  profile.save(store.profile)
   n_rows,n_cols = df.shape
   meta = MetaDataset(
     created_at = datetime.datetime.now().isoformat(),
@@ -51,7 +56,7 @@ def create_dummy(payload:DatasetRequestSchema) -> Dataset:
     n_rows = n_rows,
     n_cols = n_cols,
     missing_values=df.isna().sum().sum().item(),
-    is_outlier = False, random_seed = 4,
+    is_outlier = profile.has_outliers(), random_seed = 4,
     columns = df.columns.tolist(),notes = "", train_size = 0.8,
     path = path
   ).model_dump()
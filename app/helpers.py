@@ -10,11 +10,13 @@ def decode_date_unix(unix_timestamps):pass
 
 def encode_date_unix(timestamps):pass
 
-def init_storages_dataset(name):
-  path = Config.dir/"storages"/name
-  os.makedirs(path,exist_ok=True)
-  os.makedirs(path/"logs",exist_ok=True)
-  os.makedirs(path/"top_model",exist_ok=True)
+def init_storages_dataset(name): init_storages_datasets([name])
+
+def init_storages_datasets(names):
+  for name in names:
+    path = Config.dir/"storages"/name
+    os.makedirs(path/"logs",exist_ok=True)
+    os.makedirs(path/"top_model",exist_ok=True)
   print("Init Storages ...")
 
 
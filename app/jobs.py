@@ -0,0 +1,211 @@
+import os,socket,threading,time,logging,multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor,Executor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from sqlmodel import Session,select,func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.config import Config
+from app.database.orm import Job,Dataset
+from app.database.schemas import StatusProcess
+
+logger = logging.getLogger("jobs")
+
+def _runner(kind:str):
+  from app.pull import pulling,extending
+  runners = {"pull":pulling,"extend":extending}
+  if kind not in runners: raise ValueError(f"Unknown job kind: {kind}")
+  return runners[kind]
+
+class ProgressReporter:
+  """
+  Progress callback handed to `pulling`/`extending` inside a worker.
+
+  Writes the fraction done to the job row (at most every `every` seconds, each
+  in its own short session) and raises `PullCancelled` once the job has been
+  cancelled through the API.
+  """
+  def __init__(self,job_id:int,every:float = 1.0):
+    self.job_id = job_id
+    self.every = every
+    self._last = 0.0
+
+  def __call__(self,fraction:float):
+    from app.database import db
+    from app.pull import PullCancelled
+    now = time.monotonic()
+    if now - self._last < self.every and fraction < 1: return
+    self._last = now
+    with db.session_scope(write=True) as session: status = Job.set_progress(self.job_id,fraction,session)
+    if status == StatusProcess.CANCELLED: raise PullCancelled(f"Job {self.job_id} is cancelled")
+
+def run_job(job_id:int):
+  """Execute one claimed job; runs inside a worker process."""
+  from app.database import db
+  from app.pull import PullCancelled
+  with db.session_scope() as session:
+    job = Job.get_by_id(job_id,session)
+    kind,dataset_name,params = job.kind,job.dataset_name,dict(job.params or {})
+  try:
+    _runner(kind)(dataset_name,progress=ProgressReporter(job_id),**params)
+    status,error = StatusProcess.SUCCESS_PULL,None
+  except PullCancelled: status,error = StatusProcess.CANCELLED,None
+  except Exception as e: status,error = StatusProcess.ERROR_PULL,str(e)
+  with db.session_scope(write=True) as session: Job.finish(job_id,status,session,error=error)
+
+def enqueue(db:Session,kind:str,dataset:Dataset,priority:int = 0,**params) -> Job:
+  """Queue a job for `dataset` and mark the dataset QUEUED in the same transaction."""
+  job = Job.enqueue(db,kind,dataset.name,priority=priority,commit=False,**params)
+  dataset.status = StatusProcess.QUEUED
+  db.commit()
+  db.refresh(job)
+  DISPATCHER.wake()
+  return job
+
+async def aenqueue(db:AsyncSession,kind:str,dataset:Dataset,priority:int = 0,**params) -> Job:
+  """Async `enqueue`."""
+  job = Job.enqueue(db,kind,dataset.name,priority=priority,commit=False,**params)
+  dataset.status = StatusProcess.QUEUED
+  await db.commit()
+  await db.refresh(job)
+  DISPATCHER.wake()
+  return job
+
+async def aenqueue_many(db:AsyncSession,kind:str,datasets,priority:int = 0,**params) -> list:
+  """Queue one job per dataset in a single transaction, which also inserts the datasets not yet stored."""
+  queued = [Job.enqueue(db,kind,d.name,priority=priority,commit=False,**params) for d in datasets]
+  for d in datasets:
+    d.status = StatusProcess.QUEUED
+    db.add(d)
+  await db.commit()
+  DISPATCHER.wake()
+  return queued
+
+def cancel(db:Session,job_id:int) -> Optional[Job]:
+  """Cancel a job; queued jobs never start, running pulls stop at their next progress report."""
+  job = Job.cancel(job_id,db)
+  if job and job.status == StatusProcess.CANCELLED:
+    dataset = Dataset.get_by_name(job.dataset_name,db)
+    if dataset and dataset.status in (StatusProcess.QUEUED,StatusProcess.RUNNING_PULL):
+      dataset.status = StatusProcess.CANCELLED
+      db.commit()
+  return job
+
+def warn_unserved() -> int:
+  """For an API started without a dispatcher: warn when jobs are already queued; returns how many."""
+  from app.database import db
+  with db.session_scope() as session:
+    n = session.exec(select(func.count(Job.id)).where(Job.status == StatusProcess.QUEUED)).one()
+  if n: logger.warning(f"{n} jobs are queued and WORKER=0: they only run once a dispatcher is started (python -m app.jobs)")
+  return n
+
+class JobDispatcher:
+  """
+  Feeds QUEUED jobs from the database to a pool of worker processes.
+
+  A single thread claims jobs by priority (highest first, then oldest) while
+  fewer than `workers` are in flight, so the API process only does light
+  bookkeeping and the pulls themselves run in separate processes.
+
+  Claimed jobs are leased to this process (`owner`, host and pid) and the
+  lease is renewed while they run; only jobs whose lease expired, i.e. whose
+  dispatcher died, are requeued, so several dispatchers (API processes,
+  `uvicorn --reload`) never take over each other's running jobs.
+  """
+  def __init__(self,workers:int,poll:float = 1.0,executor:Optional[Executor] = None):
+    self.workers = workers
+    self.poll = poll
+    self.executor = executor
+    self.inflight = {}
+    self._wake = threading.Event()
+    self._stop = threading.Event()
+    self._thread = None
+    self._broken = False
+    self.owner = None
+    self._renewed = 0.0
+
+  def start(self):
+    if self._thread and self._thread.is_alive(): return
+    if self.executor is None: self.executor = self._make_executor()
+    self.owner = f"{socket.gethostname()}:{os.getpid()}"
+    self.requeue()
+    self._renewed = time.monotonic()
+    self._stop.clear()
+    self._thread = threading.Thread(target=self._loop,name="job-dispatcher",daemon=True)
+    self._thread.start()
+
+  def stop(self,wait:bool = False):
+    self._stop.set()
+    self._wake.set()
+    if self._thread: self._thread.join()
+    if self.executor: self.executor.shutdown(wait=wait,cancel_futures=True)
+    self.executor = None
+
+  def wake(self): self._wake.set()
+
+  def requeue(self) -> int:
+    """Requeue the jobs of dispatchers whose lease expired (dead or killed processes)."""
+    from app.database import db
+    with db.session_scope(write=True) as session: n = Job.requeue_running(session)
+    if n: logger.warning(f"Requeued {n} interrupted jobs")
+    return n
+
+  def renew(self):
+    """Every third of `Config.job_lease`: renew the lease of the jobs in flight and requeue expired ones."""
+    from app.database import db
+    if time.monotonic() - self._renewed < Config.job_lease / 3: return
+    self._renewed = time.monotonic()
+    with db.session_scope(write=True) as session: Job.heartbeat(list(self.inflight.values()),self.owner,session)
+    self.requeue()
+
+  def _make_executor(self) -> Executor:
+    return ProcessPoolExecutor(max_workers=self.workers,mp_context=mp.get_context("spawn"))
+
+  def _done(self,future):
+    from app.database import db
+    job_id = self.inflight.pop(future,None)
+    error = None if future.cancelled() else future.exception()
+    if error:
+      # run_job handles its own errors, so this is a dead worker process
+      logger.error(f"Job {job_id} worker crashed: {error}")
+      with db.session_scope(write=True) as session: Job.finish(job_id,StatusProcess.ERROR_PULL,session,error=f"Worker crashed: {error}")
+      if isinstance(error,BrokenProcessPool): self._broken = True
+    self._wake.set()
+
+  def dispatch(self) -> int:
+    """Claim and submit queued jobs while there are free workers; returns how many were submitted."""
+    from app.database import db
+    if self._broken and not self.inflight:
+      self.executor.shutdown(wait=False)
+      self.executor,self._broken = self._make_executor(),False
+    submitted = 0
+    while len(self.inflight) < self.workers and not self._broken:
+      with db.session_scope(write=True) as session: job = Job.claim_next(session,self.owner)
+      if not job: break
+      future = self.executor.submit(run_job,job.id)
+      self.inflight[future] = job.id
+      future.add_done_callback(self._done)
+      submitted += 1
+    return submitted
+
+  def _loop(self):
+    while not self._stop.is_set():
+      try:
+        self.renew()
+        self.dispatch()
+      except Exception as e: logger.error(f"Dispatcher error: {e}")
+      self._wake.wait(self.poll)
+      self._wake.clear()
+
+
+DISPATCHER = JobDispatcher(workers=Config.job_workers,poll=Config.job_poll)
+
+if __name__ == "__main__":
+  # Standalone dispatcher, for APIs started with WORKER=0
+  from app.database.db import init_db
+  from app import metrics
+  init_db()
+  metrics.prune()
+  DISPATCHER.start()
+  try:
+    while True: time.sleep(3600)
+  except KeyboardInterrupt: DISPATCHER.stop()
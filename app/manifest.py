@@ -0,0 +1,64 @@
+import json,os,pathlib,threading,time
+from typing import Optional,List,Tuple
+
+class PullManifest:
+  """
+  Durable record of the (tag, day) units a pull has completed.
+
+  Stored as `storages/<name>/pull_manifest.json` next to the dataset, so an
+  interrupted `pull_to_disk` can resume and fetch only the remaining units. `params` pins the pull window: a manifest written for a
+  different window (or for a pull that already completed) is discarded.
+  With `path=None` the manifest lives in memory only.
+  """
+  def __init__(self,path:Optional[pathlib.Path] = None,save_every:float = 1.0):
+    self.path = pathlib.Path(path) if path else None
+    self.save_every = save_every
+    self.data = dict(params={},done={},failed={},complete=False)
+    self._lock = threading.Lock()
+    self._saved_at = 0.0
+    if self.path and self.path.exists():
+      try: self.data.update(json.loads(self.path.read_text()))
+      except (OSError,ValueError): pass
+
+  def start(self,params:dict,resume:bool = True) -> bool:
+    """Begin a pull for `params`; returns True when previous progress is kept."""
+    keep = resume and not self.data["complete"] and self.data["params"] == params
+    if not keep: self.data = dict(params=params,done={},failed={},complete=False)
+    self.save(force=True)
+    return keep
+
+  def is_done(self,col:str,date:str) -> bool: return date in self.data["done"].get(col,{})
+
+  def pending(self,units:List[Tuple[str,str]]) -> List[Tuple[str,str]]:
+    return [(col,date) for col,date in units if not self.is_done(col,date)]
+
+  def rows(self,col:str) -> int: return sum(self.data["done"].get(col,{}).values())
+
+  @property
+  def failed(self) -> dict: return self.data["failed"]
+
+  def mark_done(self,col:str,date:str,n_rows:int):
+    with self._lock:
+      self.data["done"].setdefault(col,{})[date] = int(n_rows)
+      self.data["failed"].get(col,{}).pop(date,None)
+    self.save()
+
+  def mark_failed(self,col:str,date:str,error:str):
+    with self._lock: self.data["failed"].setdefault(col,{})[date] = error
+    self.save()
+
+  def finish(self):
+    self.data["complete"] = True
+    self.save(force=True)
+
+  def save(self,force:bool = False):
+    """Write atomically; unforced saves are throttled to one per `save_every` seconds."""
+    if not self.path: return
+    with self._lock:
+      now = time.monotonic()
+      if not force and now - self._saved_at < self.save_every: return
+      self.path.parent.mkdir(parents=True,exist_ok=True)
+      tmp = self.path.with_suffix(".tmp")
+      tmp.write_text(json.dumps(self.data))
+      os.replace(tmp,self.path)
+      self._saved_at = now
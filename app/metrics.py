@@ -0,0 +1,92 @@
+"""
+Prometheus metrics for the historian client, pulls, routes, DB sessions and caches.
+
+Pulls run in job worker processes, so every process writes its values to a
+shared directory, `PROMETHEUS_MULTIPROC_DIR` (`storages/cache/metrics` by
+default), and `render` aggregates them. The value class is picked again
+here in case `prometheus_client` was imported before the variable was set.
+`prune` drops the files of processes that are gone; the API and the
+standalone dispatcher call it on start-up.
+"""
+import os,time,pathlib
+from typing import Optional,Union
+from contextlib import contextmanager
+from fastapi import Request,Response
+from fastapi.routing import APIRoute
+from app.config import Config
+
+MULTIPROC_DIR = pathlib.Path(os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR",str(Config.dir/"storages"/"cache"/"metrics")))
+MULTIPROC_DIR.mkdir(parents=True,exist_ok=True)
+
+from prometheus_client import Counter,Histogram,Gauge,CollectorRegistry,generate_latest,CONTENT_TYPE_LATEST,multiprocess,values
+values.ValueClass = values.get_value_class()
+
+LATENCY_BUCKETS = (0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30)
+PULL_BUCKETS = (1,5,15,30,60,120,300,600,1800,3600,7200)
+BYTES_BUCKETS = tuple(2**i for i in range(8,28,2))
+
+HISTORIAN_LATENCY = Histogram("historian_request_seconds","Historian request latency",["endpoint"],buckets=LATENCY_BUCKETS)
+HISTORIAN_PAYLOAD = Histogram("historian_response_bytes","Historian response payload size",["endpoint"],buckets=BYTES_BUCKETS)
+HISTORIAN_REQUESTS = Counter("historian_requests","Historian requests by outcome",["endpoint","outcome"])
+HISTORIAN_RETRIES = Counter("historian_retries","Historian request retries",["endpoint"])
+
+PULL_DURATION = Histogram("pull_seconds","Duration of pull/extend jobs",["kind","status"],buckets=PULL_BUCKETS)
+PULL_LAST_SECONDS = Gauge("pull_last_seconds","Duration of the last pull/extend per dataset",["kind","dataset"],multiprocess_mode="mostrecent")
+PULL_ROWS = Gauge("pull_rows","Rows in a dataset after its last pull/extend",["dataset"],multiprocess_mode="mostrecent")
+
+ROUTE_LATENCY = Histogram("http_request_seconds","API route latency",["method","route","status"],buckets=LATENCY_BUCKETS)
+DB_SESSION = Histogram("db_session_seconds","Lifetime of request-scoped DB sessions",buckets=LATENCY_BUCKETS)
+
+def endpoint_of(url:str) -> str:
+  """Metric label for a historian URL: its last path segment (`get-history`, `data_point`)."""
+  return url.rstrip("/").rsplit("/",1)[-1]
+
+def observe_pull(kind:str,dataset:str,seconds:float,status:str,n_rows:int = None):
+  PULL_DURATION.labels(kind,status).observe(seconds)
+  PULL_LAST_SECONDS.labels(kind,dataset).set(seconds)
+  if n_rows is not None: PULL_ROWS.labels(dataset).set(n_rows)
+
+@contextmanager
+def timed(histogram,*labels):
+  t0 = time.perf_counter()
+  try: yield
+  finally: (histogram.labels(*labels) if labels else histogram).observe(time.perf_counter() - t0)
+
+class TimedRoute(APIRoute):
+  """Route class recording `ROUTE_LATENCY` under the route template (e.g. `/dataset/sample`)."""
+  def get_route_handler(self):
+    handler = super().get_route_handler()
+    async def timed_handler(request:Request) -> Response:
+      t0,status = time.perf_counter(),500
+      try:
+        response = await handler(request)
+        status = response.status_code
+        return response
+      except Exception as e:
+        status = getattr(e,"status_code",500)
+        raise
+      finally: ROUTE_LATENCY.labels(request.method,self.path,str(status)).observe(time.perf_counter() - t0)
+    return timed_handler
+
+def _alive(pid:int) -> bool:
+  try: os.kill(pid,0)
+  except ProcessLookupError: return False
+  except PermissionError: pass
+  return True
+
+def prune(path:Optional[Union[str,pathlib.Path]] = None) -> int:
+  """Remove the metric files (`<type>_<pid>.db`) of processes that are no longer running; returns how many."""
+  # os.kill(pid,0) is a liveness probe on POSIX only; elsewhere it would signal the process
+  if os.name != "posix": return 0
+  n = 0
+  for f in pathlib.Path(path or MULTIPROC_DIR).glob("*.db"):
+    pid = f.stem.rsplit("_",1)[-1]
+    if pid.isdigit() and int(pid) != os.getpid() and not _alive(int(pid)):
+      f.unlink(missing_ok=True)
+      n += 1
+  return n
+
+def render() -> Response:
+  registry = CollectorRegistry()
+  multiprocess.MultiProcessCollector(registry,path=str(MULTIPROC_DIR))
+  return Response(generate_latest(registry),media_type=CONTENT_TYPE_LATEST)
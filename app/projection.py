@@ -0,0 +1,78 @@
+"""
+PCA projection of a dataset's features, computed once per dataset version.
+
+The fitted scaler/PCA and the projection of every row are stored under
+`storages/<name>/pca/` keyed by the store signature, the feature list and
+`n_components`, so repeated `/dataset/pca` calls only downsample the stored
+projection. Datasets up to `FULL_FIT_ROWS` rows are fitted in memory with
+`PCA` (randomized SVD for large inputs); bigger ones stream chunks through
+`StandardScaler.partial_fit` and `IncrementalPCA`. Missing values are
+imputed with the column mean (0 after scaling).
+"""
+import hashlib,json,threading,numpy as np
+from collections import OrderedDict
+from typing import List
+from app.storage import DatasetStore
+
+FULL_FIT_ROWS = 200_000
+CHUNK_ROWS = 50_000
+_MEMO,_MEMO_SIZE,_LOCK = OrderedDict(),8,threading.Lock()
+
+def _fit_full(store:DatasetStore,features:List[str],n_components:int) -> dict:
+  from sklearn.preprocessing import StandardScaler
+  from sklearn.decomposition import PCA
+  X = store.read(columns=features).to_numpy(dtype=np.float64)
+  X = np.nan_to_num(StandardScaler().fit_transform(X))
+  if n_components >= len(features): return dict(points=X.astype(np.float32),ratio=np.full(len(features),np.nan))
+  pca = PCA(n_components=n_components,random_state=4)
+  return dict(points=pca.fit_transform(X).astype(np.float32),ratio=pca.explained_variance_ratio_)
+
+def _fit_incremental(store:DatasetStore,features:List[str],n_components:int) -> dict:
+  from sklearn.preprocessing import StandardScaler
+  from sklearn.decomposition import IncrementalPCA
+  chunks = lambda: (c.to_numpy(dtype=np.float64) for c in store.iter_frames(CHUNK_ROWS,columns=features))
+  scaler = StandardScaler()
+  for X in chunks(): scaler.partial_fit(X)
+  scale = lambda X: np.nan_to_num(scaler.transform(X))
+  if n_components >= len(features): return dict(points=np.concatenate([scale(X) for X in chunks()]).astype(np.float32),
+                                                ratio=np.full(len(features),np.nan))
+  pca,pending = IncrementalPCA(n_components=n_components),[]
+  for X in chunks():
+    # partial_fit needs at least n_components rows; a shorter chunk joins the next one (a final one is left out of the fit)
+    pending.append(scale(X))
+    if sum(len(p) for p in pending) >= n_components:
+      pca.partial_fit(np.concatenate(pending))
+      pending = []
+  points = np.concatenate([pca.transform(scale(X)) for X in chunks()]).astype(np.float32)
+  return dict(points=points,ratio=pca.explained_variance_ratio_)
+
+def projection(store:DatasetStore,features:List[str],n_components:int = 2) -> dict:
+  """`points` (n_rows x n_components, float32) and `ratio` (explained variance) for the current data, cached."""
+  signature = hashlib.sha1(repr(store.signature()).encode()).hexdigest()[:12]
+  params = hashlib.sha1(json.dumps([features,n_components]).encode()).hexdigest()[:12]
+  key = (str(store.root),signature,params)
+  with _LOCK:
+    if key in _MEMO:
+      _MEMO.move_to_end(key)
+      return _MEMO[key]
+  path = store.root/"pca"/f"{signature}-{params}.npz"
+  if path.exists():
+    with np.load(path) as f: result = dict(points=f["points"],ratio=f["ratio"])
+  else:
+    fit = _fit_full if store.num_rows() <= FULL_FIT_ROWS else _fit_incremental
+    result = fit(store,features,n_components)
+    path.parent.mkdir(exist_ok=True)
+    for old in path.parent.glob("*.npz"):
+      if not old.name.startswith(signature): old.unlink(missing_ok=True)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(tmp,**result)
+    tmp.replace(path)
+  with _LOCK:
+    _MEMO[key] = result
+    while len(_MEMO) > _MEMO_SIZE: _MEMO.popitem(last=False)
+  return result
+
+def downsample(n_rows:int,max_points:int,seed:int = 4) -> np.ndarray:
+  """Sorted row positions of at most `max_points` rows, the same for every call on the same size."""
+  if n_rows <= max_points: return np.arange(n_rows)
+  return np.sort(np.random.default_rng(seed).choice(n_rows,size=max_points,replace=False))
@@ -1,15 +1,52 @@
-from typing import Union,List
-import json,requests as req,pandas as pd,numpy as np,time,urllib3,warnings
+from typing import Union,List,Optional
+import json,orjson,requests as req,pandas as pd,numpy as np,time,urllib3,warnings,psutil
 from urllib3.exceptions import HTTPError
+from concurrent.futures import ThreadPoolExecutor,as_completed,wait
 from app.config import Config
 from app.helpers import encode_to_dt_sl
 from datetime import datetime,timedelta
 from app.logger import Logger
+from app.client import CLIENT,DeadlineError
+from app.metrics import observe_pull
+from app.storage import DatasetStore,dataset_store
+from app.stats import Profile,dataset_profile
+from app.align import align_day,make_grid,grid_step
+from app.manifest import PullManifest
+from app.tagstore import TagStore,tag_store,level_for,DAY_START,DAY_END
 
 warnings.filterwarnings("ignore")
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def get_realtime(point_id:str,logger=None,max_retries:int=2,retry_delay:float=0.5,timeout:int=5):
+class PullCancelled(Exception):
+  """Raised from a progress callback to stop a pull whose job was cancelled."""
+
+class DatasetDeleted(PullCancelled):
+  """Raised by `save_dataset` when the dataset was deleted while it was being pulled."""
+
+def get_http_session(url:str = None) -> req.Session:
+  """Shared keep-alive session for the historian host of `url` (see `HistorianClient.session`)."""
+  return CLIENT.session(url)
+
+def decode_history(content:bytes,row_id,dtype=np.float64) -> pd.DataFrame:
+  """
+  Decode a getDBHistory body (`[[epoch_ms, value], ...]`) into a DataFrame.
+
+  The body is parsed with orjson and converted in bulk with NumPy: epoch-millis
+  become a tz-aware `datetime64[ns]` index in `Config.utc` and values a
+  `dtype` array (float64 or float32). Non-numeric values are coerced to NaN.
+  """
+  rows = orjson.loads(content)
+  if not rows: return pd.DataFrame(columns=["dt", row_id]).set_index("dt")
+  try:
+    arr = np.asarray(rows,dtype=np.float64)
+    ts,val = arr[:,0].astype(np.int64),arr[:,1].astype(dtype)
+  except (TypeError,ValueError):
+    ts = np.asarray([r[0] for r in rows],dtype=np.int64)
+    val = pd.to_numeric(pd.Series([r[1] for r in rows]),errors="coerce").to_numpy(dtype)
+  index = pd.DatetimeIndex(ts.astype("datetime64[ms]").astype("datetime64[ns]"),name="dt")
+  return pd.DataFrame({row_id: val},index=index.tz_localize("UTC").tz_convert(Config.utc))
+
+def get_realtime(point_id:str,logger=None,max_retries:int=2,retry_delay:float=0.5,timeout:int=5,session=None,deadline:float=None):
   """
   Get realtime value for a data point with automatic retry on timeout and connection errors.
   
@@ -19,18 +56,25 @@ def get_realtime(point_id:str,logger=None,max_retries:int=2,retry_delay:float=0.
     max_retries: Maximum number of retry attempts (default: 3)
     retry_delay: Delay between retries in seconds (default: 1.0)
     timeout: Request timeout in seconds (default: 3)
+    session: requests.Session to use (default: pooled session for Config.url)
+    deadline: `time.perf_counter()` value bounding all attempts, including their wait for
+      the client's rate limit and in-flight cap: each one's timeout is capped at the time
+      left and no attempt (or retry) starts once it has passed
     
   Returns:
     Current value as float
   """
   url = f"{Config.url}/data_point"
+  http = session or get_http_session(url)
   data = dict(token = Config.token, point_id = point_id)
   last_exception = None
 
   for attempt in range(max_retries):
     try:
+      left = timeout if deadline is None else min(timeout,deadline - time.perf_counter())
+      if left <= 0: raise ValueError(f"Deadline exceeded for point_id {point_id} after {attempt} attempts")
       if logger and attempt > 0: logger.info(f"Retry attempt {attempt + 1}/{max_retries} for point_id {point_id}")
-      result = req.post(url, data=data, verify=False, timeout=timeout)
+      result = CLIENT.post(url, session=http, data=data, verify=False, timeout=left, deadline=deadline)
       if result.status_code != 200:
         error_msg = f"status_code: {result.status_code} | text: {result.text} | url: {url}"
         if logger: logger.error(error_msg)
@@ -53,6 +97,12 @@ def get_realtime(point_id:str,logger=None,max_retries:int=2,retry_delay:float=0.
       
       return float(currvalue)
     
+    except DeadlineError as e:
+      # the budget ran out waiting for the client's rate limit or in-flight cap: no retry can make it
+      error_msg = f"Timed out for point_id {point_id}: {str(e)}"
+      if logger: logger.error(error_msg)
+      raise ValueError(error_msg)
+
     except (req.exceptions.Timeout, req.exceptions.ConnectionError, HTTPError) as e:
       last_exception = e
       error_type = type(e).__name__
@@ -64,10 +114,11 @@ def get_realtime(point_id:str,logger=None,max_retries:int=2,retry_delay:float=0.
         )
       
       # If this is not the last attempt, wait before retrying
-      if attempt < max_retries - 1: time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
+      spent = deadline is not None and time.perf_counter() >= deadline
+      if attempt < max_retries - 1 and not spent: CLIENT.backoff(attempt, retry_delay, url)  # Exponential backoff with jitter
       else:
         error_msg = (
-          f"Failed after {max_retries} attempts for point_id {point_id}: "
+          f"Failed after {attempt + 1} attempts for point_id {point_id}: "
           f"{error_type} - {str(e)}"
         )
         if logger: logger.error(error_msg)
@@ -91,6 +142,56 @@ def get_realtime(point_id:str,logger=None,max_retries:int=2,retry_delay:float=0.
   if last_exception: raise ValueError(f"Failed after {max_retries} attempts: {str(last_exception)}")
 
 
+def get_realtime_bulk(point_ids:List[str],deadline:float = 1.0,logger = None,max_retries:int = 2,max_workers:int = None) -> dict:
+  """
+  Sample many data points concurrently within one overall deadline.
+
+  Args:
+    point_ids: Data point identifiers to sample
+    deadline: Overall budget in seconds; points still in flight are reported as errors
+    logger: Logger instance for logging
+    max_retries: Retry attempts per point; each attempt gets the budget left as its timeout
+      and none starts once it is spent (default: 2)
+    max_workers: Concurrent requests (default: min(len(point_ids), Config.realtime_workers))
+
+  Returns:
+    dict with the snapshot `timestamp`, `points`, aligned `values` (None on failure),
+    per-point `errors` and `latency_ms`, and the total `elapsed_ms`
+  """
+  point_ids = list(dict.fromkeys(point_ids))
+  session = get_http_session()
+  timestamp = datetime.now(tz=Config.utc)
+  started = time.perf_counter()
+  values,errors,latency = {},{},{}
+
+  def fetch(point_id):
+    t0 = time.perf_counter()
+    try: return get_realtime(point_id,logger=logger,max_retries=max_retries,timeout=deadline,session=session,deadline=started + deadline)
+    finally: latency[point_id] = round((time.perf_counter() - t0) * 1e3,2)
+
+  pool = ThreadPoolExecutor(max_workers=max_workers or max(min(len(point_ids),Config.realtime_workers),1))
+  try:
+    futures = {pool.submit(fetch,point_id):point_id for point_id in point_ids}
+    done,pending = wait(futures,timeout=deadline)
+    for future in done:
+      point_id = futures[future]
+      try: values[point_id] = future.result()
+      except Exception as e: errors[point_id] = str(e)
+    for future in pending:
+      point_id = futures[future]
+      future.cancel()
+      errors[point_id] = f"Deadline of {deadline}s exceeded"
+      latency.setdefault(point_id,round(deadline * 1e3,2))
+  finally: pool.shutdown(wait=False,cancel_futures=True)
+
+  elapsed = round((time.perf_counter() - started) * 1e3,2)
+  if logger: logger.info(f"Realtime snapshot | {len(values)}/{len(point_ids)} points | {elapsed} ms")
+  return dict(timestamp=timestamp.isoformat(),points=point_ids,
+              values=[values.get(point_id) for point_id in point_ids],
+              errors=errors,latency_ms={point_id:latency.get(point_id) for point_id in point_ids},
+              elapsed_ms=elapsed)
+
+
 def get_history(row_id:int,
                 current_date:str,
                 time_start:str = "00:00:00",
@@ -100,7 +201,9 @@ def get_history(row_id:int,
                 logger = None,
                 max_retries:int = 3,
                 retry_delay: float = 0.7,
-                timeout : int = 3):
+                timeout : int = 3,
+                session = None,
+                dtype = np.float64):
   """
   Retrieve historical data with automatic retry on timeout and connection errors.
   
@@ -115,6 +218,8 @@ def get_history(row_id:int,
     max_retries: Maximum number of retry attempts (default: 3)
     retry_delay: Delay between retries in seconds (default: 1.0)
     timeout: Request timeout in seconds (default: 30)
+    session: requests.Session to use (default: pooled session for Config.url)
+    dtype: Value dtype, np.float64 or np.float32 (default: np.float64)
     
   Returns:
     List of [datetime, values] or DataFrame with datetime index
@@ -135,13 +240,14 @@ def get_history(row_id:int,
   url = f"{Config.url}/tags/get-history"
   packet = json.dumps(packet)
   payload = {"packet": packet}
+  http = session or get_http_session(url)
   last_exception = None
   for attempt in range(max_retries):
     try:
       if logger and attempt > 0:
         logger.info(f"Retry attempt {attempt + 1}/{max_retries} for row_id {row_id}, date {current_date}")
       
-      result = req.post(url, data=payload, headers=headers, verify=False, timeout=timeout)
+      result = CLIENT.post(url, session=http, data=payload, headers=headers, verify=False, timeout=timeout)
       
       if result.status_code != 200:
         error_msg = f"status_code is {result.status_code} | url: {url} | text: {result.text}"
@@ -149,25 +255,16 @@ def get_history(row_id:int,
           logger.error(error_msg)
         raise ValueError(error_msg)
       
-      result_json = result.json()
+      df = decode_history(result.content,row_id,dtype)
       
-      if not result_json:
+      if df.empty:
         if logger: logger.warning(f"Column: {row_id} | {encode_to_dt_sl(current_date)} | No data returned")
-        return pd.DataFrame(columns=["dt", row_id]).set_index("dt") if to_dataframe else [[], []]
+        return df if to_dataframe else [[], []]
       
       if logger:
         logger.info(f"Column: {row_id} | {encode_to_dt_sl(current_date)} | Successfully retrieved!")
       
-      # Unpack timestamps and values
-      dt, val = zip(*result_json)
-      dt = [datetime.fromtimestamp(i/1000,tz=Config.utc) for i in dt]
-      
-      if to_dataframe:
-        df = pd.DataFrame({"dt": dt, row_id: val})
-        df["dt"] = pd.to_datetime(df["dt"])
-        return df.set_index("dt")
-      
-      return [dt, val]
+      return df if to_dataframe else [df.index.to_pydatetime().tolist(),tuple(df[row_id])]
     
     except (req.exceptions.Timeout, req.exceptions.ConnectionError, HTTPError) as e:
       last_exception = e
@@ -180,7 +277,7 @@ def get_history(row_id:int,
         )
       # If this is not the last attempt, wait before retrying
       if attempt < max_retries - 1:
-        time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
+        CLIENT.backoff(attempt, retry_delay, url)  # Exponential backoff with jitter
       else:
         error_msg = (
           f"Failed after {max_retries} attempts for row_id {row_id}: "
@@ -207,69 +304,182 @@ def get_history(row_id:int,
   # This should not be reached, but just in case
   if last_exception: raise ValueError(f"Failed after {max_retries} attempts: {str(last_exception)}")
 
-def pulling(dataset_name:str):
-  from app.database.db import get_session
+def dataset_columns(dataset) -> List[str]:
+  columns = list(dataset.features)
+  if dataset.task_type.is_supervised(): columns += [str(dataset.target)]
+  return list(dict.fromkeys(columns))
+
+def make_meta(dataset_name:str,n_rows:int,columns:List[str],missing_values:int,size_of:int,is_outlier:bool=False) -> dict:
+  from app.database.schemas import MetaDataset
+  return MetaDataset(
+    created_at = datetime.now().isoformat(),
+    created_by = "Anonymous",
+    size_of = size_of,
+    n_rows = n_rows,
+    n_cols = len(columns),
+    missing_values = missing_values,
+    is_outlier = is_outlier, random_seed = 4,
+    columns = list(columns),notes = "", train_size = 0.8,
+    path = f"storages/{dataset_name}/data",missing_after_fill = True
+  ).model_dump()
+
+def save_dataset(dataset,*fields):
+  """
+  Write `fields` of a detached `dataset` onto its row in a short write
+  transaction, so no session stays open during a pull. The row is read
+  inside the transaction and only `fields` are set, so columns changed by
+  other requests meanwhile are kept; a deleted row raises `DatasetDeleted`
+  instead of being inserted again.
+  """
+  from app.database.db import session_scope
+  with session_scope(write=True) as db:
+    row = db.get(type(dataset),dataset.id)
+    if row is None: raise DatasetDeleted(f"{dataset.name} was deleted")
+    for field in fields: setattr(row,field,getattr(dataset,field))
+
+def pulling(dataset_name:str,resume:bool=False,progress=None):
+  from app.database.db import session_scope
   from app.database.orm import Dataset
-  from app.database.schemas import StatusProcess,MetaDataset
+  from app.database.schemas import StatusProcess
 
   logger = Logger(dataset_name)
-  logger.info(f"Start Pulling ... {dataset_name}")
+  logger.info(f"{'Resume' if resume else 'Start'} Pulling ... {dataset_name}")
+  t0 = time.perf_counter()
 
-  db = next(get_session())
-  dataset = Dataset.get_by_name(dataset_name,db)
+  with session_scope() as db: dataset = Dataset.get_by_name(dataset_name,db)
   if not dataset: raise ValueError(f"{dataset_name} not found!")
   try:
     dataset.status = StatusProcess.RUNNING_PULL
-    db.commit()
+    save_dataset(dataset,"status")
 
     if not dataset.task_type.is_dummies():
-      columns = dataset.features
-      if dataset.task_type.is_supervised(): columns += [dataset.target]
-
-      df = pull_real_data(columns,start_date=dataset.start_date,
-                          end_date=dataset.end_date,time_start=dataset.time_start,time_end=dataset.time_end)
+      stats = pull_to_disk(dataset_columns(dataset),start_date=dataset.start_date,end_date=dataset.end_date,
+                           time_start=dataset.time_start,time_end=dataset.time_end,
+                           path=Config.dir/"storages"/dataset.name,logger=logger,
+                           step=grid_step(dataset.interval),resume=resume,progress=progress,
+                           manifest=PullManifest(Config.dir/"storages"/dataset.name/"pull_manifest.json"))
 
     else:
       raise NotImplementedError()
       # df = _generate_dummy_data(dataset, logger)
 
-    if df is None or df.empty: raise ValueError("Generated dataframe is empty")
-
-    df["dt"] = pd.to_datetime(df["dt"])
-
-    n_rows,n_cols = df.shape
-    dataset.meta = MetaDataset(
-      created_at = datetime.now().isoformat(),
-      created_by = "Anonymous",
-      size_of = df.memory_usage().sum(),
-      n_rows = n_rows,
-      n_cols = n_cols,
-      missing_values=df.isna().sum().sum().item(),
-      is_outlier = False, random_seed = 4,
-      columns = df.columns.tolist(),notes = "", train_size = 0.8,
-      path = f"storages/{dataset.name}/data.csv"
-    )
-
-    df = df.ffill()
-    interval = df["dt"].diff().median()  # Gunakan median untuk lebih robust
+    if not stats["n_rows"]: raise ValueError("Generated dataframe is empty")
+
+    dataset.meta = make_meta(dataset.name,stats["n_rows"],stats["columns"],stats["missing_values"],stats["size_of"],stats["is_outlier"])
     dataset.is_valid = True
     dataset.status = StatusProcess.SUCCESS_PULL
-    dataset.interval = int(interval.total_seconds() / 60) if isinstance(interval,timedelta) else 0
+    dataset.interval = int(stats["interval"].total_seconds() // 60)
 
     logger.info("End Pulling ...")
-    db.commit()
+    save_dataset(dataset,"meta","is_valid","status","interval")
     logger.info("Pulled successfully!")
-
+    observe_pull("pull",dataset_name,time.perf_counter() - t0,"success",stats["n_rows"])
 
   except Exception as e:
     logger.error(f"Dataset: {dataset_name} | Error: {str(e)}")
     dataset.is_valid = False
-    dataset.status = StatusProcess.ERROR_PULL
-    db.commit()
+    dataset.status = StatusProcess.CANCELLED if isinstance(e,PullCancelled) else StatusProcess.ERROR_PULL
+    if not isinstance(e,DatasetDeleted): save_dataset(dataset,"is_valid","status")
+    observe_pull("pull",dataset_name,time.perf_counter() - t0,"cancelled" if isinstance(e,PullCancelled) else "error")
     raise
 
-def pull_real_data(columns:List[str],start_date:str,end_date:str,time_start:str,time_end:str,logger=None) -> pd.DataFrame:
-  # Parse and validate dates
+def extending(dataset_name:str,end_date:str,status:Optional[str] = None,progress=None):
+  """
+  Move a dataset's `end_date` forward by pulling only the missing (tag, day) units.
+
+  On failure the dataset gets back `status`, its status before the job was
+  queued (SUCCESS_PULL when not given): the stored data is left as it was.
+  `end_date` must be a day that is already over (see `TagStore.complete`).
+
+  Coverage is taken from the tag store, not from the stored rows (which are
+  filled onto the grid): a unit that failed or was never fetched is missing
+  there. When the stored range has such gaps, the dataset is rebuilt from
+  the tag store like a pull (`pull_to_disk`), fetching only the missing
+  units. Otherwise only the new days are fetched, aligned onto the grid
+  continuing from the last stored samples and appended as a new part, and
+  `meta` is updated incrementally, counting `missing_values` after alignment
+  as a pull does. A new unit still failing after the retry rounds (recorded
+  in the dataset's pull manifest) fails the job and nothing is appended.
+  """
+  from app.database.db import session_scope
+  from app.database.orm import Dataset
+  from app.database.schemas import StatusProcess,MetaDataset
+  from app.helpers import FMT_DT
+
+  logger = Logger(dataset_name)
+  logger.info(f"Start Extending ... {dataset_name} -> {end_date}")
+  t0 = time.perf_counter()
+
+  with session_scope() as db: dataset = Dataset.get_by_name(dataset_name,db)
+  if not dataset: raise ValueError(f"{dataset_name} not found!")
+  status = StatusProcess[status] if status else StatusProcess.SUCCESS_PULL
+  try:
+    if end_date <= dataset.end_date: raise ValueError(f"end_date {end_date} should be after {dataset.end_date}")
+    if not TagStore.complete(end_date): raise ValueError(f"end_date {end_date} should be before today")
+    store = dataset_store(dataset.name)
+    if not store.exists(): raise ValueError(f"{store.root} has no data!")
+    dataset.status = StatusProcess.RUNNING_PULL
+    save_dataset(dataset,"status")
+
+    columns = dataset_columns(dataset)
+    tags = tag_store()
+    step = grid_step(dataset.interval)
+    gaps = tags.missing([(col,day) for col in columns for day in date_range(dataset.start_date,dataset.end_date)])
+    first = (datetime.strptime(dataset.end_date,FMT_DT) + timedelta(days=1)).strftime(FMT_DT)
+    new_days = date_range(first,end_date)
+    logger.info(f"Missing units: {len(gaps)} in the stored range, {len(columns) * len(new_days)} after it")
+
+    if gaps:
+      stats = pull_to_disk(columns,start_date=dataset.start_date,end_date=end_date,
+                           time_start=dataset.time_start,time_end=dataset.time_end,
+                           path=store.root,logger=logger,step=step,progress=progress,tags=tags)
+      if not stats["n_rows"]: raise ValueError("Generated dataframe is empty")
+      dataset.meta = make_meta(dataset.name,stats["n_rows"],stats["columns"],stats["missing_values"],stats["size_of"],stats["is_outlier"])
+    else:
+      if progress: progress(0.1)
+      manifest = PullManifest(Config.dir/"storages"/dataset.name/"pull_manifest.json")
+      manifest.start(dict(columns=columns,start_date=first,end_date=end_date,time_start=dataset.time_start,time_end=dataset.time_end))
+      frames = pull_units([(col,day) for col in columns for day in new_days],dataset.time_start,dataset.time_end,
+                          logger=logger,tags=tags,manifest=manifest)
+      if progress: progress(0.9)
+      # the samples of the last stored day give the carry pull_to_disk would have at the day boundary
+      level = level_for(step,dataset.time_start,dataset.time_end) if Config.fill_policy in ("ffill","none") else None
+      last = {col:tags.samples(col,dataset.end_date,dataset.time_start,dataset.time_end,level) for col in columns}
+      _,carry = align_day(last,columns,make_grid(dataset.end_date,dataset.time_start,dataset.time_end,step),
+                          Config.fill_policy,Config.max_staleness,None)
+      new = combine_units(frames,columns,new_days,dataset.time_start,dataset.time_end,step,carry=carry,strict=False)
+      if new.empty: raise ValueError("No data retrieved for the missing units")
+      new = new.reindex(columns=store.columns())
+      profile = dataset_profile(store)
+      meta = MetaDataset(**dataset.meta)
+      if not meta.missing_after_fill:
+        # counted before the fill by an older pull: recount what is stored, as a pull does now
+        meta.missing_values = sum(chunk.isna().sum().sum().item() for chunk in store.iter_frames())
+        meta.missing_after_fill = True
+      store.append(new)
+      profile.merge(Profile.from_frame(new))
+      profile.save(store.profile)
+      meta.n_rows += len(new)
+      meta.size_of += int(new.memory_usage(index=False).sum())
+      meta.missing_values += new.isna().sum().sum().item()
+      meta.is_outlier = profile.has_outliers()
+      dataset.meta = meta.model_dump()
+      manifest.finish()
+
+    dataset.end_date = end_date
+    dataset.status = StatusProcess.SUCCESS_PULL
+    save_dataset(dataset,"meta","end_date","status")
+    logger.info("Extended successfully!")
+    observe_pull("extend",dataset_name,time.perf_counter() - t0,"success",(dataset.meta or {}).get("n_rows"))
+
+  except Exception as e:
+    logger.error(f"Dataset: {dataset_name} | Error: {str(e)}")
+    dataset.status = StatusProcess.CANCELLED if isinstance(e,PullCancelled) else status
+    if not isinstance(e,DatasetDeleted): save_dataset(dataset,"status")
+    observe_pull("extend",dataset_name,time.perf_counter() - t0,"cancelled" if isinstance(e,PullCancelled) else "error")
+    raise
+
+def date_range(start_date:str,end_date:str) -> List[str]:
   from app.helpers import FMT_DT
   try:
     start_date_dt = datetime.strptime(start_date, FMT_DT)
@@ -278,52 +488,236 @@ def pull_real_data(columns:List[str],start_date:str,end_date:str,time_start:str,
   
   if start_date_dt > end_date_dt: raise ValueError("Start date cannot be after end date")
   
-  # Generate date range
   delta_days = (end_date_dt - start_date_dt).days
-  dates = [(start_date_dt + timedelta(days=i)).strftime(FMT_DT) for i in range(delta_days + 1)]
-  
-  if logger: logger.info(f"Pulling data from {start_date} to {end_date} ({len(dates)} days)")
-  
-  # Pull data for each feature/target
-  results = []
-  for col in columns:
-    if logger:logger.info(f"Pulling feature: {col}")
-    feature_data = []
-    
-    for date in dates:
+  return [(start_date_dt + timedelta(days=i)).strftime(FMT_DT) for i in range(delta_days + 1)]
+
+def fetch_tag_day(tags:TagStore,col:str,date:str,logger=None,session=None) -> int:
+  """
+  Fetch one whole (tag, day) unit from the historian into `tags`; returns its number of samples.
+
+  Holds the unit's lock: when another pull stored it meanwhile (for a day not
+  over yet, within `Config.tag_refetch_after` seconds), it is read from the store instead.
+  """
+  with tags.lock(col,date):
+    if tags.fresh(col,date,Config.tag_refetch_after): return tags.rows(col,date)
+    df = get_history(int(col),date,DAY_START,DAY_END,interval=1,to_dataframe=True,logger=logger,session=session)
+    tags.put(col,date,df)
+    return len(df)
+
+def fetch_units(units,tags:TagStore,manifest:PullManifest,logger=None,max_workers:int=None,on_done=None) -> list:
+  """
+  Fetch the (column, day) units of `units` missing from `tags` into it; returns the units that failed.
+
+  Units are fanned out over a bounded thread pool (`max_workers`, default
+  `Config.pull_workers`) sharing one keep-alive session per historian host,
+  and recorded in `manifest` as they complete (units it already has are
+  skipped). Failed units go to a retry queue that is re-run up to
+  `Config.pull_retry_rounds` times with a growing pause; those still failing
+  are recorded as failed and returned as (column, day, error).
+  `on_done`, when given, is called with the number of units done after every attempt.
+  """
+  session = get_http_session()
+  def fetch(col,date) -> int:
+    n = tags.rows(col,date) if tags.has(col,date) else fetch_tag_day(tags,col,date,logger=logger,session=session)
+    manifest.mark_done(col,date,n)
+    return n
+
+  units = list(dict.fromkeys(units))
+  queue = manifest.pending(units)
+  done = len(units) - len(queue)
+  failed = []
+  try:
+    for attempt in range(Config.pull_retry_rounds + 1):
+      if attempt:
+        if logger: logger.warning(f"Retry round {attempt}/{Config.pull_retry_rounds} | {len(queue)} units")
+        time.sleep(Config.pull_retry_delay * attempt)
+      failed = []
+      pool = ThreadPoolExecutor(max_workers=max_workers or Config.pull_workers)
       try:
-        df_day = get_history(
-            int(col),
-            date,
-            time_start,
-            time_end,
-            interval=1,
-            to_dataframe=True,
-            logger=logger
-        )
-        feature_data.append(df_day)
-      except Exception as e:
-        if logger:logger.warning(f"Failed to get data for {col} on {date}: {str(e)}")
-        continue
-    
-    if not feature_data: raise ValueError(f"No data retrieved for feature: {col}")
-    
-    # Concatenate all days for this feature
-    feature_df = pd.concat(feature_data, axis=0)
-    results.append(feature_df)
-  
-  # Combine all features
-  df = pd.concat(results, axis=1).sort_index()
+        futures = {pool.submit(fetch,col,date):(col,date) for col,date in queue}
+        for future in as_completed(futures):
+          col,date = futures[future]
+          try:
+            future.result()
+            done += 1
+          except Exception as e: failed.append((col,date,str(e)))
+          if on_done: on_done(done)
+      finally: pool.shutdown(wait=True,cancel_futures=True)
+      queue = [(col,date) for col,date,_ in failed]
+      if not queue: break
+    for col,date,error in failed:
+      if logger:logger.warning(f"Failed to get data for {col} on {date}: {error}")
+      manifest.mark_failed(col,date,error)
+  finally: manifest.save(force=True)
+  return failed
+
+def pull_units(units,time_start:str,time_end:str,logger=None,max_workers:int=None,tags:TagStore=None,
+               manifest:PullManifest=None) -> dict:
+  """
+  Fetch (column, day) units through the tag store `tags` (default
+  `storages/tags`); returns {(column, day): DataFrame} of their
+  `time_start`..`time_end` samples.
+
+  Missing units are fetched as whole days by `fetch_units`, with its retry
+  rounds, and recorded in `manifest` (in memory by default). A unit still
+  failing after the last round raises ValueError.
+  """
+  tags = tags or tag_store()
+  units = list(dict.fromkeys(units))
+  failed = fetch_units(units,tags,manifest or PullManifest(),logger=logger,max_workers=max_workers)
+  if failed:
+    col,date,error = failed[0]
+    raise ValueError(f"{len(failed)} units still missing after {Config.pull_retry_rounds} retry rounds, "
+                     f"e.g. {col} on {date}: {error}")
+  return {(col,date):tags.get(col,date,time_start,time_end) for col,date in units}
+
+def combine_units(frames:dict,columns:List[str],dates:List[str],time_start:str,time_end:str,step:int,
+                  fill:str=None,max_staleness:float=None,carry:dict=None,strict:bool=True) -> pd.DataFrame:
+  """
+  Align fetched units onto a fixed grid of `step` seconds, one day at a time.
+
+  The result has exactly one row per grid step between `time_start` and
+  `time_end` of each day in `dates` (see `app.align`). With `strict`, a column
+  without any fetched unit raises; otherwise it stays all-NaN.
+  """
+  columns = list(dict.fromkeys(columns))
+  missing = [col for col in columns if not any((col,date) in frames for date in dates)]
+  if strict and missing: raise ValueError(f"No data retrieved for feature: {missing[0]}")
+  if len(missing) == len(columns): return pd.DataFrame(columns=columns + ["dt"])
   
-  # Forward fill missing values
-  df = df.ffill()
+  days = []
+  for date in dates:
+    grid = make_grid(date,time_start,time_end,step)
+    df,carry = align_day({col:frames.get((col,date)) for col in columns},columns,grid,
+                         fill or Config.fill_policy,max_staleness or Config.max_staleness,carry)
+    days.append(df)
   
   # Reset index and add datetime column
+  df = pd.concat(days,axis=0)
   df["dt"] = df.index
   df.reset_index(drop=True, inplace=True)
   
   return df
 
+def pull_real_data(columns:List[str],start_date:str,end_date:str,time_start:str,time_end:str,logger=None,max_workers:int=None,
+                   step:int=None,fill:str=None,max_staleness:float=None,tags:TagStore=None) -> pd.DataFrame:
+  """
+  Pull every (column, day) unit concurrently (see `pull_units`) through the
+  tag store `tags` (default `storages/tags`) and align them onto a grid of
+  `step` seconds (default: `Config.grid_seconds`). Raises ValueError when
+  units are still missing after the retry rounds.
+  """
+  dates = date_range(start_date,end_date)
+  
+  if logger: logger.info(f"Pulling data from {start_date} to {end_date} ({len(dates)} days)")
+  
+  units = [(col,date) for col in columns for date in dates]
+  frames = pull_units(units,time_start,time_end,logger=logger,max_workers=max_workers,tags=tags)
+  return combine_units(frames,columns,dates,time_start,time_end,step or Config.grid_seconds,fill,max_staleness)
+
+class PeakRSS:
+  """Track the peak resident set size of this process across `sample()` calls."""
+  def __init__(self):
+    self.process = psutil.Process()
+    self.peak = 0
+    self.sample()
+
+  def sample(self) -> int:
+    self.peak = max(self.peak,self.process.memory_info().rss)
+    return self.peak
+
+  def __str__(self): return f"{self.peak / 1024**2:.1f} MB"
+
+def pull_to_disk(columns:List[str],start_date:str,end_date:str,time_start:str,time_end:str,path,
+                 logger=None,max_workers:int=None,step:int=None,fill:str=None,max_staleness:float=None,
+                 manifest:PullManifest=None,resume:bool=False,progress=None,tags:TagStore=None) -> dict:
+  """
+  Streaming variant of `pull_real_data` with memory bounded by one day of data.
+
+  Every (column, day) unit missing from the tag store `tags` (default
+  `storages/tags`, see `app.tagstore`) is fetched as a whole day and written
+  there by the worker that fetched it; units already stored are not fetched
+  again, so datasets sharing tags share their pulls. A second, time-ordered
+  pass then reads each day's `time_start`..`time_end` samples back (only
+  the last sample of every rollup bucket when the grid is aligned to a
+  rollup level, see `app.tagstore.level_for`), aligns them onto the grid
+  (carrying the last sample across day boundaries) and writes each day as a
+  row group of the dataset stored in the directory `path` (see
+  `app.storage`). The new data is swapped in atomically once the pass
+  completes and the peak RSS of the pull is written to the log.
+
+  Completed units are recorded in `manifest`; with `resume`, units already
+  recorded for the same window are not fetched again. Failed units are
+  retried by `fetch_units` before they are recorded as failed; the pull goes
+  on without them unless a column has no data at all.
+
+  A statistics profile (`app.stats.Profile`) is accumulated during the join
+  pass and saved next to the data.
+
+  `progress`, when given, is called with the fraction done (fetching counts
+  for 90%, the join pass for the rest); an exception it raises aborts the pull.
+
+  Returns:
+    dict with `n_rows`, `columns`, `missing_values` (cells still empty after alignment and fill,
+    i.e. NaNs of the stored data), `size_of`, the grid `interval` and `is_outlier`
+  """
+  step = step or Config.grid_seconds
+  fill = fill or Config.fill_policy
+  store = DatasetStore(path)
+  tags = tags or tag_store()
+  # on a grid aligned to a rollup level, as-of alignment over bucket-last samples equals the raw result
+  level = level_for(step,time_start,time_end) if fill in ("ffill","none") else None
+  columns = list(dict.fromkeys(columns))
+  dates = date_range(start_date,end_date)
+  peak = PeakRSS()
+  if logger: logger.info(f"Streaming pull from {start_date} to {end_date} ({len(dates)} days, {len(columns)} columns)")
+
+  manifest = manifest or PullManifest()
+  units = [(col,date) for col in columns for date in dates]
+  params = dict(columns=columns,start_date=start_date,end_date=end_date,time_start=time_start,time_end=time_end)
+  if manifest.start(params,resume=resume):
+    if logger: logger.info(f"Resuming pull | {len(manifest.pending(units))}/{len(units)} units left")
+  if logger: logger.info(f"Tag store | {len(units) - len(tags.missing(units))}/{len(units)} units stored")
+
+  def on_done(done:int):
+    peak.sample()
+    if progress: progress(0.9 * done / len(units))
+  fetch_units(units,tags,manifest,logger=logger,max_workers=max_workers,on_done=on_done)
+
+  for col in columns:
+    if not manifest.rows(col): raise ValueError(f"No data retrieved for feature: {col}")
+
+  stats = dict(n_rows=0,columns=columns + ["dt"],missing_values=0,size_of=0,interval=timedelta(seconds=step))
+  carry = None
+  profile = Profile()
+  writer = store.writer()
+  try:
+    for i,date in enumerate(dates):
+      day = {col:tags.samples(col,date,time_start,time_end,level) for col in columns}
+      df,carry = align_day(day,columns,make_grid(date,time_start,time_end,step),
+                           fill,max_staleness or Config.max_staleness,carry)
+      df["dt"] = df.index
+      writer.write(df.reset_index(drop=True))
+      profile.update(df)
+      stats["n_rows"] += len(df)
+      stats["missing_values"] += df.isna().sum().sum().item()
+      stats["size_of"] += int(df.memory_usage(index=False).sum())
+      del day,df
+      peak.sample()
+      if progress: progress(0.9 + 0.1 * (i + 1) / len(dates))
+  except BaseException:
+    writer.abort()
+    raise
+
+  if stats["n_rows"]:
+    writer.commit()
+    profile.save(store.profile)
+  else: writer.abort()
+  stats["is_outlier"] = profile.has_outliers()
+  manifest.finish()
+  if logger: logger.info(f"Streaming pull done | rows: {stats['n_rows']} | peak RSS: {peak}")
+  return stats
+
 def generate_dummy():pass
 
 if __name__ == "__main__":
@@ -1,12 +1,23 @@
 from fastapi import HTTPException
-from app.database.schemas import DatasetResponseSchema,DatasetRequestSchema, StatusProcess,TaskType
-from app.database.orm import Dataset
+from app.database.schemas import DatasetRequestSchema, StatusProcess,TaskType,RealtimeSnapshotRequestSchema
+from app.database.orm import Dataset,SORTABLE
 from app.config import Config
-import os,uuid,shutil,pandas as pd
-from typing import Optional
-from app.helpers import init_storages_dataset
+import os,uuid,shutil,numpy as np,pandas as pd
+from typing import List,Optional
+from app.helpers import init_storages_dataset,init_storages_datasets
+from app.storage import dataset_store,bounds_for
+from app.tagstore import TagStore,tag_store
+from app.align import grid_step
+from app import jobs
+from app.stats import dataset_profile
+from app.series import series,rollup_series
 
 TAGNAME = pd.read_csv("tagname.csv")
+MAPPING = pd.read_csv("mapping.csv")
+POINT_IDS : dict = {
+  str(row_id):point_id for row_id,point_id in
+  zip(pd.concat([TAGNAME["row_id"],MAPPING["row_id"]]),pd.concat([TAGNAME["point_id"],MAPPING["point_id"]]))
+}
 
 def check_integrity_dataset(dataset:Optional[Dataset]):
   if not dataset: raise HTTPException(status_code=404,detail="Dataset is not found!")
@@ -14,7 +25,7 @@ def check_integrity_dataset(dataset:Optional[Dataset]):
   if not dataset.meta: return HTTPException(status_code=404,detail="dataset is haven't meta!")
   path = Config.dir/"storages"/dataset.name
   if not os.path.exists(path): raise HTTPException(status_code=404,detail=f"Path is not found : {path}")
-  if not os.path.exists(path/"data.csv"): raise HTTPException(status_code=404,detail="Dataframe is not found!")
+  if not dataset_store(dataset.name).exists(): raise HTTPException(status_code=404,detail="Dataframe is not found!")
 
 def check_create_dataset(payload:DatasetRequestSchema):
   if not isinstance(payload.features,(list,tuple)): raise HTTPException(status_code=404,detail="features should list or tuple")
@@ -29,17 +40,100 @@ def check_create_dataset(payload:DatasetRequestSchema):
     else:
       if not str(payload.target).isdigit(): raise HTTPException(status_code=500,detail ="")
 
-def create_dataset(payload:DatasetRequestSchema):
-  check_create_dataset(payload) 
-  name = f"{payload.task_type}-{str(uuid.uuid4())[:8]}"
-  init_storages_dataset(name)
+def check_extend_dataset(dataset:Optional[Dataset],end_date:str):
+  from app.helpers import FMT_DT
+  from datetime import datetime
+  check_integrity_dataset(dataset)
+  if dataset.task_type.is_dummies(): raise HTTPException(status_code=500,detail="Dummy dataset can't be extended")
+  if dataset.status in (StatusProcess.RUNNING_PULL,StatusProcess.QUEUED): raise HTTPException(status_code=409,detail="Dataset is pulling")
+  try: datetime.strptime(end_date,FMT_DT)
+  except ValueError: raise HTTPException(status_code=422,detail="end_date should be YYYYMMDD")
+  if end_date <= dataset.end_date: raise HTTPException(status_code=422,detail=f"end_date should be after {dataset.end_date}")
+  if not TagStore.complete(end_date): raise HTTPException(status_code=422,detail="end_date should be before today")
+
+def check_resume_dataset(dataset:Optional[Dataset],live:bool = False):
+  if not dataset: raise HTTPException(status_code=404,detail="Dataset is not found!")
+  if dataset.task_type.is_dummies(): raise HTTPException(status_code=500,detail="Dummy dataset can't be pulled")
+  # RUNNING_PULL without a `live` job (queued, or running under a live lease, see `Job.live`): its worker died
+  if dataset.status == StatusProcess.RUNNING_PULL and not live: return
+  if dataset.status not in (StatusProcess.ERROR_PULL,StatusProcess.PENDING,StatusProcess.CANCELLED):
+    raise HTTPException(status_code=409,detail=f"Dataset can't be resumed | Status : {dataset.status}")
+
+async def list_datasets(db,after:Optional[str] = None,limit:int = 50,status:Optional[str] = None,task_type:Optional[str] = None,
+                  date_from:Optional[str] = None,date_to:Optional[str] = None,search:Optional[str] = None,
+                  sort:str = "id",order:str = "asc") -> dict:
+  if not 1 <= limit <= 500: raise HTTPException(status_code=422,detail="limit should be between 1 and 500")
+  if sort not in SORTABLE: raise HTTPException(status_code=422,detail=f"sort should be one of {SORTABLE}")
+  if order not in ("asc","desc"): raise HTTPException(status_code=422,detail="order should be asc or desc")
+  try:
+    status = StatusProcess[status] if status else None
+    task_type = TaskType[task_type] if task_type else None
+  except KeyError as e: raise HTTPException(status_code=422,detail=f"Unknown status/task_type: {e}")
+  try: page = await Dataset.apage(db,after=after,limit=limit,sort=sort,desc=order == "desc",status=status,task_type=task_type,
+                                 date_from=date_from,date_to=date_to,search=search)
+  except ValueError as e: raise HTTPException(status_code=422,detail=str(e))
+  if not page["recordsTotal"]: raise HTTPException(status_code=404,detail="Datasets is empty")
+  return page
+
+MAX_BATCH = 500
+
+def new_dataset(payload:DatasetRequestSchema) -> Dataset:
   return Dataset(
-    name = name,
+    name = f"{payload.task_type}-{str(uuid.uuid4())[:8]}",
     is_valid = False,
     status = StatusProcess.PENDING,
-    **payload.model_dump()
+    **{**payload.model_dump(),"task_type":TaskType[payload.task_type]}
   )
 
+def create_dataset(payload:DatasetRequestSchema):
+  check_create_dataset(payload) 
+  dataset = new_dataset(payload)
+  init_storages_dataset(dataset.name)
+  return dataset
+
+def check_create_datasets(payloads:List[DatasetRequestSchema]):
+  """Validate every payload of a batch before any is created; the 422 lists the invalid ones by position."""
+  if not 1 <= len(payloads) <= MAX_BATCH: raise HTTPException(status_code=422,detail=f"a batch holds 1 to {MAX_BATCH} datasets")
+  errors = []
+  for i,payload in enumerate(payloads):
+    try:
+      if payload.task_type not in TaskType.__members__: raise HTTPException(status_code=422,detail=f"Unknown task_type: {payload.task_type}")
+      if TaskType[payload.task_type].is_dummies(): raise HTTPException(status_code=422,detail="Dummy datasets can't be created in a batch")
+      check_create_dataset(payload)
+    except HTTPException as e: errors.append({"index":i,"detail":e.detail})
+  if errors: raise HTTPException(status_code=422,detail=errors)
+
+async def create_datasets(payloads:List[DatasetRequestSchema],db,priority:int = 0) -> List[Dataset]:
+  """
+  Create many datasets and queue their pulls: storage directories are made
+  first, then the rows and their jobs are inserted in one transaction (all or
+  none). Their pulls share the tag store, so tags common to several datasets
+  are fetched once (see `app.tagstore`).
+  """
+  check_create_datasets(payloads)
+  datasets = [new_dataset(payload) for payload in payloads]
+  for d in datasets: d.models = []
+  init_storages_datasets([d.name for d in datasets])
+  try: await jobs.aenqueue_many(db,"pull",datasets,priority=priority)
+  except Exception:
+    await db.rollback()
+    for d in datasets: shutil.rmtree(Config.dir/"storages"/d.name,ignore_errors=True)
+    raise
+  return datasets
+
+def check_task_type(task_type:str) -> List[TaskType]:
+  try: return TaskType.family(task_type)
+  except KeyError: raise HTTPException(status_code=422,detail=f"Unknown task_type: {task_type}")
+
+def clean_task_type(task_type:str,db) -> dict:
+  check_task_type(task_type)
+  names = Dataset.delete_by_task_type(task_type,db)
+  if not names: raise HTTPException(status_code=500,detail="Dataset udah dihapus")
+  for name in names:
+    filepath = Config.dir/"storages"/name
+    if os.path.exists(filepath): shutil.rmtree(filepath)
+  return {"detail":"datasets is removed"}
+
 def clean_all_datasets(datasets,db)->dict:
   if not datasets: raise HTTPException(status_code=500,detail="Dataset udah dihapus")
   for d in datasets:
@@ -67,35 +161,75 @@ def delete_dataset(name,db,logger=None):
   if logger:logger.info(f"Dataset is has been delete | dataset_name : {dataset_name}")
   return {"detail":"dataset is has been delete","dataset_name":dataset_name}
 
-def get_df_sample(dataset:Optional[Dataset],n_samples):
+def get_df_sample(dataset:Optional[Dataset],n_samples:int,seed:Optional[int]=None,start:Optional[str]=None,
+                  end:Optional[str]=None,stratify:bool=False):
   if not dataset: raise HTTPException(status_code=404,detail="Dataset is not found!")
   if not dataset.is_valid: raise HTTPException(status_code=500,detail="Dataset invalid!")
-  pathfile = Config.dir/"storages"/dataset.name/"data.csv"
-  if not os.path.exists(pathfile): raise ValueError(f"{pathfile} is not found!")
-  df = pd.read_csv(pathfile)
-  return df.sample(n_samples).to_dict(orient="index")
+  if n_samples <= 0: raise HTTPException(status_code=422,detail="n should be positive")
+  if stratify and not dataset.task_type.is_classification(): raise HTTPException(status_code=422,detail="stratify needs a classification dataset")
+  store = dataset_store(dataset.name)
+  if not store.exists(): raise ValueError(f"{dataset.name} has no data!")
+  try: df = store.sample(n_samples,seed=seed,start=start,end=end,stratify=str(dataset.target) if stratify else None)
+  except ValueError as e: raise HTTPException(status_code=422,detail=str(e))
+  return df.to_dict(orient="index")
 
 def get_df_describe(dataset:Optional[Dataset]):
   if not dataset: raise HTTPException(status_code=404,detail="Dataset is not found!")
   if not dataset.is_valid: raise HTTPException(status_code=500,detail="Dataset invalid!")
-  pathfile = Config.dir/"storages"/dataset.name/"data.csv"
-  if not os.path.exists(pathfile): raise ValueError(f"{pathfile} is not found!")
-  return pd.read_csv(pathfile).describe()
-
-def dim_reduce(dataset,n_components=2,to_dict=True):
-  from sklearn.preprocessing import StandardScaler
-  from sklearn.decomposition import PCA
-  if not dataset: return HTTPException(status_code=404,detail="dataset is not found!")
-  if not dataset.is_valid: return HTTPException(status_code=404,detail="dataset is not valid!")
-  if not dataset.meta: return HTTPException(status_code=404,detail="dataset is haven't meta!")
-  cols = dataset.features
-  path = Config.dir/dataset.meta['path']/"data.csv"
-  X = pd.read_csv(path)[cols].values
-  X_scaled = StandardScaler().fit_transform(X)
-  assert len(cols) > 1 ,cols 
-  if len(cols) == 2: df = pd.DataFrame(X_scaled,columns=cols)
-  else: df = pd.DataFrame(PCA(n_components=n_components).fit_transform(X_scaled),columns=["X1","X2"])
-  return df.to_dict(orient="index") if to_dict else df
+  store = dataset_store(dataset.name)
+  if not store.exists(): raise ValueError(f"{dataset.name} has no data!")
+  return dataset_profile(store).describe()
+
+def get_df_profile(dataset:Optional[Dataset]):
+  if not dataset: raise HTTPException(status_code=404,detail="Dataset is not found!")
+  if not dataset.is_valid: raise HTTPException(status_code=500,detail="Dataset invalid!")
+  store = dataset_store(dataset.name)
+  if not store.exists(): raise ValueError(f"{dataset.name} has no data!")
+  return dataset_profile(store).summary()
+
+def get_df_series(dataset:Optional[Dataset],tags:Optional[List[str]] = None,start:Optional[str] = None,
+                  end:Optional[str] = None,n_points:int = 1000):
+  if not dataset: raise HTTPException(status_code=404,detail="Dataset is not found!")
+  if not dataset.is_valid: raise HTTPException(status_code=500,detail="Dataset invalid!")
+  if n_points < 3: raise HTTPException(status_code=422,detail="n_points should be at least 3")
+  store = dataset_store(dataset.name)
+  if not store.exists(): raise ValueError(f"{dataset.name} has no data!")
+  columns = [c for c in store.columns() if c != "dt"]
+  tags = list(dict.fromkeys(tags)) if tags else columns
+  unknown = [t for t in tags if t not in columns]
+  if unknown: raise HTTPException(status_code=422,detail=f"Unknown tags: {unknown}")
+  try:
+    # long ranges of pulled datasets come from the tag store rollups, the rest from the dataset itself
+    if not dataset.task_type.is_dummies():
+      lo,hi = bounds_for(pd.DatetimeTZDtype(tz=Config.utc),start or f"{dataset.start_date} {dataset.time_start}",
+                         end or f"{dataset.end_date} {dataset.time_end}")
+      result = rollup_series(tag_store(),tags,lo,hi,n_out=n_points,step=grid_step(dataset.interval),
+                             time_start=dataset.time_start,time_end=dataset.time_end)
+      if result: return result
+    return series(store,tags,start=start,end=end,n_out=n_points)
+  except ValueError as e: raise HTTPException(status_code=422,detail=str(e))
+
+def dim_reduce(dataset,n_components:int=2,max_points:int=5000):
+  from app.projection import projection,downsample
+  if not dataset: raise HTTPException(status_code=404,detail="dataset is not found!")
+  if not dataset.is_valid: raise HTTPException(status_code=404,detail="dataset is not valid!")
+  if not dataset.meta: raise HTTPException(status_code=404,detail="dataset is haven't meta!")
+  cols = list(dataset.features)
+  if len(cols) < 2: raise HTTPException(status_code=422,detail="PCA needs at least 2 features")
+  if n_components < 1 or max_points < 1: raise HTTPException(status_code=422,detail="n_components and max_points should be positive")
+  store = dataset_store(dataset.name)
+  if not store.exists(): raise HTTPException(status_code=404,detail="Dataframe is not found!")
+  result = projection(store,cols,min(n_components,len(cols)))
+  idx = downsample(len(result["points"]),max_points)
+  points = result["points"][idx]
+  names = cols if points.shape[1] == len(cols) else [f"X{i+1}" for i in range(points.shape[1])]
+  return dict(
+    columns = names,
+    explained_variance_ratio = [None if np.isnan(r) else float(r) for r in result["ratio"]],
+    n_rows = len(result["points"]),
+    index = idx.tolist(),
+    data = [points[:,i].round(5).tolist() for i in range(points.shape[1])]
+  )
 
 def get_mapping():
   data = {}
@@ -104,5 +238,36 @@ def get_mapping():
 
 def get_tagname(row_id:int): return {"tagname":get_mapping().get(row_id,"")}
 
+def resolve_point_ids(tags) -> dict:
+  """Map each tag (row_id from tagname.csv / mapping.csv, or a raw point_id) to its point_id."""
+  known = set(POINT_IDS.values())
+  resolved,unknown = {},[]
+  for tag in tags:
+    tag = str(tag)
+    if tag in POINT_IDS: resolved[tag] = POINT_IDS[tag]
+    elif tag in known: resolved[tag] = tag
+    else: unknown.append(tag)
+  if unknown: raise HTTPException(status_code=404,detail=f"Unknown tags: {unknown}")
+  return resolved
 
+def get_realtime_snapshot(payload:RealtimeSnapshotRequestSchema,dataset:Optional[Dataset]=None) -> dict:
+  from app.pull import get_realtime_bulk
+  tags = [str(t) for t in payload.tags]
+  if payload.dataset_name:
+    if not dataset: raise HTTPException(status_code=404,detail="Dataset is not found!")
+    tags += dataset.features + ([str(dataset.target)] if dataset.task_type.is_supervised() else [])
+  tags = list(dict.fromkeys(tags))
+  if not tags: raise HTTPException(status_code=404,detail="tags is empty")
+  if payload.deadline <= 0: raise HTTPException(status_code=422,detail="deadline should be positive")
+  resolved = resolve_point_ids(tags)
+  snapshot = get_realtime_bulk(list(resolved.values()),deadline=payload.deadline)
+  values = dict(zip(snapshot["points"],snapshot["values"]))
+  return dict(
+    timestamp = snapshot["timestamp"],
+    tags = tags,
+    values = [values[resolved[t]] for t in tags],
+    errors = {t:snapshot["errors"][resolved[t]] for t in tags if resolved[t] in snapshot["errors"]},
+    latency_ms = {t:snapshot["latency_ms"][resolved[t]] for t in tags},
+    elapsed_ms = snapshot["elapsed_ms"]
+  )
 
@@ -1,64 +1,106 @@
-from fastapi import HTTPException,Depends,BackgroundTasks,APIRouter
-from app.database.db import get_session
+from typing import List,Optional
+from fastapi import HTTPException,Depends,APIRouter,Query
+from fastapi.concurrency import run_in_threadpool
+from app.database.db import get_session,get_async_session,get_async_write_session
 from sqlmodel import Session
-from app.database.orm import Dataset
-from app.database.schemas import DatasetRequestSchema,TaskType,DatasetResponseSchema
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.database.orm import Dataset,Job
+from app.database.schemas import DatasetRequestSchema,TaskType,DatasetResponseSchema,RealtimeSnapshotRequestSchema,RealtimeSnapshotResponseSchema
 from app.routes import dataset
-from app.pull import pulling
+from app import jobs
 from app.dummy import create_dummy
+from app.tagstore import tag_store
+from app.client import CLIENT
+from app.metrics import TimedRoute
 
-datasetRouter = APIRouter()
+datasetRouter = APIRouter(route_class=TimedRoute)
+
+# Async handlers query through the AsyncSession and hand file/CPU work to the threadpool;
+# handlers that still need a sync Session are plain `def`, which FastAPI runs in the threadpool.
 
 @datasetRouter.get("/datasets")
-async def get_dataset_req(db:Session = Depends(get_session)):
-  datasets = Dataset.get_all(db)
-  if not datasets: raise HTTPException(status_code=404,detail="Datasets is empty")
-  return Dataset.to_responses(datasets,db)
+async def get_dataset_req(after:Optional[str] = None,limit:int = 50,status:Optional[str] = None,task_type:Optional[str] = None,
+                          date_from:Optional[str] = None,date_to:Optional[str] = None,search:Optional[str] = None,
+                          sort:str = "id",order:str = "asc",db:AsyncSession = Depends(get_async_session)):
+  return await dataset.list_datasets(db,after=after,limit=limit,status=status,task_type=task_type,date_from=date_from,
+                                     date_to=date_to,search=search,sort=sort,order=order)
 
 @datasetRouter.get("/datasets/filter")
-async def get_dataset_by_task_type_req(task_type:str,db:Session = Depends(get_session)):
-  dataset = Dataset.get_by_task_type(task_type,db)
-  return Dataset.to_responses(dataset,db)
+async def get_dataset_by_task_type_req(task_type:str,db:AsyncSession = Depends(get_async_session)):
+  dataset.check_task_type(task_type)
+  datasets = await Dataset.aget_by_task_type(task_type,db)
+  return await Dataset.ato_responses(datasets,db)
 
 @datasetRouter.get("/dataset")
-async def get_dataset_by_name_req(name: str, db: Session = Depends(get_session)):
-  dataset = Dataset.get_by_name(name, db)
+async def get_dataset_by_name_req(name: str, db: AsyncSession = Depends(get_async_session)):
+  dataset = await Dataset.aget_by_name(name, db)
   if not dataset: raise HTTPException(status_code=404, detail="Dataset is not found!")
   return dataset.to_response()
 
 @datasetRouter.delete("/datasets/filter")
-async def clean_task_type_req(task_type:str,db:Session = Depends(get_session)):
-  datasets = Dataset.get_by_task_type(task_type,db)
-  dataset.clean_all_datasets(datasets,db)
+def clean_task_type_req(task_type:str,db:Session = Depends(get_session)):
+  dataset.clean_task_type(task_type,db)
   return {"msg":"success!"}
 
 @datasetRouter.post(f"/dataset",response_model=DatasetResponseSchema)
-async def post_dataset_req(background_task:BackgroundTasks,payload: DatasetRequestSchema,db:Session = Depends(get_session)):
+async def post_dataset_req(payload: DatasetRequestSchema,priority:int = 0,db:AsyncSession = Depends(get_async_write_session)):
   try:
     tt = payload.tt()
-    q = create_dummy(payload) if tt.is_dummies() else dataset.create_dataset(payload)
-    q.save(db)
-    if not tt.is_dummies(): background_task.add_task(pulling,dataset_name=q.name)
+    q = await run_in_threadpool(create_dummy,payload) if tt.is_dummies() else dataset.create_dataset(payload)
+    q = await q.asave(db)
+    if not tt.is_dummies(): await jobs.aenqueue(db,"pull",q,priority=priority)
     return q.to_response()
   except Exception as e: raise HTTPException(status_code=500,detail=str(e))
 
+@datasetRouter.post("/datasets/batch",response_model=List[DatasetResponseSchema])
+async def post_datasets_req(payloads:List[DatasetRequestSchema],priority:int = 0,db:AsyncSession = Depends(get_async_write_session)):
+  return [q.to_response() for q in await dataset.create_datasets(payloads,db,priority=priority)]
+
+@datasetRouter.post("/dataset/extend",response_model=DatasetResponseSchema)
+async def extend_dataset_req(name:str,end_date:str,priority:int = 0,db:AsyncSession = Depends(get_async_write_session)):
+  q = await Dataset.aget_by_name(name,db)
+  dataset.check_extend_dataset(q,end_date)
+  # the dataset is QUEUED from here on: the job restores this status if the extend fails
+  await jobs.aenqueue(db,"extend",q,priority=priority,end_date=end_date,status=q.status.name)
+  return q.to_response()
+
+@datasetRouter.post("/dataset/resume",response_model=DatasetResponseSchema)
+async def resume_dataset_req(name:str,priority:int = 0,db:AsyncSession = Depends(get_async_write_session)):
+  q = await Dataset.aget_by_name(name,db)
+  dataset.check_resume_dataset(q,live=bool(q) and await Job.ahas_live(q.name,db))
+  await Job.aabandon_expired(q.name,db)
+  await jobs.aenqueue(db,"pull",q,priority=priority,resume=True)
+  return q.to_response()
+
 @datasetRouter.get("/dataset/sample")
-async def get_sample_req(name: str, db: Session = Depends(get_session)):
-  q = Dataset.get_by_name(name,db)
-  return  dataset.get_df_sample(q,10)
+async def get_sample_req(name: str, n:int = 10, seed:Optional[int] = None, start:Optional[str] = None, end:Optional[str] = None,
+                         stratify:bool = False, db: AsyncSession = Depends(get_async_session)):
+  q = await Dataset.aget_by_name(name,db)
+  return await run_in_threadpool(dataset.get_df_sample,q,n,seed=seed,start=start,end=end,stratify=stratify)
 
 @datasetRouter.get("/dataset/describe")
-async def get_description_req(name: str, db: Session = Depends(get_session)):
-  q = Dataset.get_by_name(name,db)
-  return dataset.get_df_describe(q)
+async def get_description_req(name: str, db: AsyncSession = Depends(get_async_session)):
+  q = await Dataset.aget_by_name(name,db)
+  return await run_in_threadpool(dataset.get_df_describe,q)
+
+@datasetRouter.get("/dataset/profile")
+async def get_profile_req(name: str, db: AsyncSession = Depends(get_async_session)):
+  q = await Dataset.aget_by_name(name,db)
+  return await run_in_threadpool(dataset.get_df_profile,q)
+
+@datasetRouter.get("/dataset/series")
+async def get_series_req(name:str,tags:Optional[List[str]] = Query(None),start:Optional[str] = None,end:Optional[str] = None,
+                         n_points:int = 1000,db:AsyncSession = Depends(get_async_session)):
+  q = await Dataset.aget_by_name(name,db)
+  return await run_in_threadpool(dataset.get_df_series,q,tags,start=start,end=end,n_points=n_points)
 
 @datasetRouter.get("/dataset/pca")
-async def get_pca_req(name:str,db:Session = Depends(get_session)):
-  q = Dataset.get_by_name(name,db)
-  return dataset.dim_reduce(q)
+async def get_pca_req(name:str,n_components:int = 2,max_points:int = 5000,db:AsyncSession = Depends(get_async_session)):
+  q = await Dataset.aget_by_name(name,db)
+  return await run_in_threadpool(dataset.dim_reduce,q,n_components=n_components,max_points=max_points)
 
 @datasetRouter.delete("/dataset")
-async def delete_dataset_req(name:str,db:Session=Depends(get_session)):
+def delete_dataset_req(name:str,db:Session=Depends(get_session)):
   return dataset.delete_dataset(name,db)
 
 @datasetRouter.get("/utils/mapping")
@@ -67,5 +109,17 @@ async def get_mapping_req(): return dataset.get_mapping()
 @datasetRouter.get("/utils/tagname")
 async def get_tagname_req(row_id:int): return {"tagname":dataset.get_mapping()[row_id]}
 
+@datasetRouter.post("/realtime/snapshot",response_model=RealtimeSnapshotResponseSchema)
+def post_realtime_snapshot_req(payload:RealtimeSnapshotRequestSchema,db:Session = Depends(get_session)):
+  # Sync handler: FastAPI runs it in the threadpool so the fan-out doesn't block the event loop
+  q = Dataset.get_by_name(payload.dataset_name,db) if payload.dataset_name else None
+  return dataset.get_realtime_snapshot(payload,q)
+
+@datasetRouter.get("/utils/cache")
+async def get_cache_stats_req(): return {"tags":await run_in_threadpool(tag_store().stats)}
+
+@datasetRouter.get("/utils/historian")
+async def get_historian_stats_req(): return CLIENT.stats()
+
 
 
@@ -0,0 +1,30 @@
+from fastapi import HTTPException,Depends,APIRouter
+from sqlmodel import Session
+from typing import Optional
+from app.database.db import get_session,get_write_session
+from app.database.orm import Job
+from app.database.schemas import JobResponseSchema,StatusProcess
+from app import jobs
+from app.metrics import TimedRoute
+
+jobRouter = APIRouter(route_class=TimedRoute)
+
+# Sync handlers on the sync Session: FastAPI runs them in the threadpool
+
+@jobRouter.get("/jobs")
+def get_jobs_req(status:Optional[str] = None,dataset_name:Optional[str] = None,db:Session = Depends(get_session)):
+  try: status = StatusProcess[status] if status else None
+  except KeyError: raise HTTPException(status_code=422,detail=f"Unknown status: {status}")
+  return [j.to_response() for j in Job.get_all(db,status=status,dataset_name=dataset_name)]
+
+@jobRouter.get("/job",response_model=JobResponseSchema)
+def get_job_req(id:int,db:Session = Depends(get_session)):
+  job = Job.get_by_id(id,db)
+  if not job: raise HTTPException(status_code=404,detail="Job is not found!")
+  return job.to_response()
+
+@jobRouter.delete("/job",response_model=JobResponseSchema)
+def cancel_job_req(id:int,db:Session = Depends(get_write_session)):
+  job = jobs.cancel(db,id)
+  if not job: raise HTTPException(status_code=404,detail="Job is not found!")
+  return job.to_response()
@@ -0,0 +1,83 @@
+"""
+Downsampled time series of a stored dataset, for charting.
+
+Only the requested tags inside `[start, end]` are read (row-group pushdown on
+`dt`), then every tag is reduced to about `n_out` points with MinMaxLTTB from
+tsdownsample: a min-max preselection of `minmax_ratio * n_out` candidates
+followed by LTTB, which keeps peaks, dips and gaps (NaN) visible at a cost
+linear in the rows read, independent of `n_out`.
+
+Long ranges are served from the tag store rollups instead (`rollup_series`):
+the coarsest level that still has `n_out` buckets in the range's daily
+windows is read, so the cost is bounded by `n_out` times the number of
+levels, not by the rows stored.
+"""
+import numpy as np,pandas as pd
+from typing import List,Optional
+from tsdownsample import NaNMinMaxLTTBDownsampler
+from app.storage import DatasetStore,DT
+from app.tagstore import TagStore,ROLLUPS,DAY_START,DAY_END
+from app.helpers import FMT_DT
+
+MINMAX_RATIO = 4
+
+def downsample_indices(x:np.ndarray,y:np.ndarray,n_out:int) -> np.ndarray:
+  """Positions of the (about) `n_out` points of `y` over the sorted `x` that best keep its shape."""
+  if len(y) <= n_out: return np.arange(len(y))
+  return NaNMinMaxLTTBDownsampler().downsample(x,np.ascontiguousarray(y,dtype=np.float64),n_out=n_out,minmax_ratio=MINMAX_RATIO)
+
+def to_list(values:np.ndarray) -> list: return np.where(np.isnan(values),None,values).tolist()
+
+def series(store:DatasetStore,tags:List[str],start:Optional[str] = None,end:Optional[str] = None,n_out:int = 1000) -> dict:
+  """
+  {n_rows, series: {tag: {dt, values}}}, `dt` as epoch milliseconds.
+
+  Each tag has its own timestamps: LTTB picks the points that matter for that
+  tag, so the series of two tags generally differ in length and position.
+  """
+  df = store.read(columns=[*tags,DT],start=start,end=end)
+  x = pd.DatetimeIndex(df[DT]).asi8
+  out = {}
+  for tag in tags:
+    y = df[tag].to_numpy(dtype=np.float64)
+    idx = downsample_indices(x,y,n_out)
+    out[tag] = dict(dt=(x[idx] // 1_000_000).tolist(),values=to_list(y[idx]))
+  return dict(n_rows=len(df),level=None,series=out)
+
+def window_buckets(start:pd.Timestamp,end:pd.Timestamp,seconds:int,time_start:str = DAY_START,time_end:str = DAY_END) -> int:
+  """Number of `seconds` bucket labels inside `time_start`..`time_end` of each day between `start` and `end`."""
+  days = pd.date_range(start.normalize(),end.normalize(),freq="D")
+  lo = np.maximum((days + pd.Timedelta(time_start)).asi8,start.value)
+  hi = np.minimum((days + pd.Timedelta(time_end)).asi8,end.value)
+  step = seconds * 10**9
+  # labels are epoch-aligned, like the rollups (see `app.tagstore.rollup`)
+  return int(np.maximum(hi // step - -(-lo // step) + 1,0).sum())
+
+def rollup_series(tags:TagStore,columns:List[str],start:pd.Timestamp,end:pd.Timestamp,n_out:int = 1000,step:int = 0,
+                  time_start:str = DAY_START,time_end:str = DAY_END) -> Optional[dict]:
+  """
+  Like `series`, from the coarsest rollup level coarser than `step` seconds
+  with at least `n_out` buckets in the daily windows between the tz-aware
+  `start` and `end` (see `window_buckets`).
+  MinMaxLTTB runs over the bucket means and every point also carries its
+  bucket's `min` and `max`; buckets are restricted to the daily window
+  `time_start`..`time_end`. None when no level fits or a day is not stored.
+  """
+  level = next((level for level,seconds in ROLLUPS.items()
+                if seconds > step and window_buckets(start,end,seconds,time_start,time_end) >= n_out),None)
+  if level is None: return None
+  dates = pd.date_range(start.normalize(),end.normalize(),freq="D").strftime(FMT_DT).tolist()
+  lo,hi = pd.Timedelta(time_start),pd.Timedelta(time_end)
+  out,n_rows = {},0
+  for tag in columns:
+    frame = tags.read_rollups(tag,dates,level)
+    if frame is None: return None
+    frame = frame.loc[start:end]
+    of_day = frame.index - frame.index.normalize()
+    frame = frame[(of_day >= lo) & (of_day <= hi)]
+    x = frame.index.asi8
+    idx = downsample_indices(x,frame["mean"].to_numpy(),n_out)
+    out[tag] = dict(dt=(x[idx] // 1_000_000).tolist(),values=to_list(frame["mean"].to_numpy()[idx]),
+                    min=to_list(frame["min"].to_numpy()[idx]),max=to_list(frame["max"].to_numpy()[idx]))
+    n_rows = max(n_rows,len(frame))
+  return dict(n_rows=n_rows,level=level,series=out)
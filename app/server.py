@@ -1,10 +1,29 @@
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from app.routes.dataset_routes import datasetRouter
+from app.routes.job_routes import jobRouter
+from app.database.db import init_db
+from app.config import WORKER
+from app.jobs import DISPATCHER
+from app import metrics,jobs
 import uvicorn
 
-app = FastAPI(title="Smart AI")
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+  init_db()
+  metrics.prune()
+  if WORKER: DISPATCHER.start()
+  else: jobs.warn_unserved()
+  yield
+  if WORKER: DISPATCHER.stop()
+
+app = FastAPI(title="Smart AI",lifespan=lifespan)
 
 app.include_router(datasetRouter)
+app.include_router(jobRouter)
+
+@app.get("/metrics",include_in_schema=False)
+def metrics_req(): return metrics.render()
 
 
 if __name__ == "__main__": uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,252 @@
+"""
+Mergeable per-dataset statistics, computed in one streaming pass.
+
+A `Profile` is fed chunk by chunk (one day at a time during a pull) and can
+be merged with another profile, so appending data only needs a profile of
+the new rows. It tracks, per numeric column:
+
+- count, null count, mean and M2 (Chan et al. parallel variance), min, max
+- a `QuantileSketch` (KLL-style compactors) for quantiles and histograms
+- pairwise co-moment sums for the Pearson correlation matrix, over the rows
+  where both columns are present (like `DataFrame.corr`)
+
+Profiles are stored as `storages/<name>/profile.json` next to the data.
+"""
+import json,os,copy,pathlib,numpy as np,pandas as pd
+from typing import Optional
+
+QUANTILES = (0.25,0.5,0.75)
+
+class QuantileSketch:
+  """
+  Streaming quantile sketch with a stack of compactors.
+
+  Level `h` holds items of weight 2**h. When a level grows past `k` items it
+  is sorted and every other item (random offset) is promoted to the next
+  level, so memory stays O(k log(n/k)) and sketches merge level by level.
+  """
+  def __init__(self,k:int = 256,seed:int = 4):
+    self.k = k
+    self.levels = [np.empty(0)]
+    self._rng = np.random.default_rng(seed)
+
+  def update(self,values:np.ndarray):
+    values = np.asarray(values,dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values):
+      self.levels[0] = np.concatenate([self.levels[0],values])
+      self._compress()
+
+  def merge(self,other:"QuantileSketch"):
+    for h,items in enumerate(other.levels):
+      if h == len(self.levels): self.levels.append(np.empty(0))
+      self.levels[h] = np.concatenate([self.levels[h],items])
+    self._compress()
+
+  def _compress(self):
+    h = 0
+    while h < len(self.levels):
+      items = self.levels[h]
+      if len(items) > self.k:
+        items = np.sort(items)
+        keep = items[len(items) - len(items) % 2:]
+        promoted = items[self._rng.integers(2):len(items) - len(keep):2]
+        if h + 1 == len(self.levels): self.levels.append(np.empty(0))
+        self.levels[h + 1] = np.concatenate([self.levels[h + 1],promoted])
+        self.levels[h] = keep
+      h += 1
+
+  def weighted(self):
+    """All retained items (sorted) with their weights."""
+    items = np.concatenate(self.levels)
+    weights = np.concatenate([np.full(len(items),2.0**h) for h,items in enumerate(self.levels)])
+    order = np.argsort(items,kind="stable")
+    return items[order],weights[order]
+
+  def quantiles(self,qs) -> np.ndarray:
+    items,weights = self.weighted()
+    if not len(items): return np.full(len(qs),np.nan)
+    cum = np.cumsum(weights)
+    return items[np.minimum(np.searchsorted(cum,np.asarray(qs) * cum[-1],side="left"),len(items) - 1)]
+
+  def to_dict(self) -> dict: return dict(k=self.k,levels=[items.tolist() for items in self.levels])
+
+  @classmethod
+  def from_dict(cls,data:dict) -> "QuantileSketch":
+    sketch = cls(data["k"])
+    sketch.levels = [np.asarray(items,dtype=np.float64) for items in data["levels"]] or [np.empty(0)]
+    return sketch
+
+class Profile:
+  """Statistics profile of a dataset; see the module docstring."""
+  def __init__(self,k:int = 256):
+    self.k = k
+    self.n_rows = 0
+    self.columns = []
+    self.nulls = {}
+    self.numeric = []
+    self.sketches = []
+    self.count = self.mean = self.m2 = self.min = self.max = self.shift = None
+    self.pair_n = self.pair_sx = self.pair_sxx = self.pair_sxy = None
+
+  @classmethod
+  def from_frame(cls,df:pd.DataFrame,k:int = 256) -> "Profile":
+    profile = cls(k)
+    profile.update(df)
+    return profile
+
+  def _init(self,df:pd.DataFrame):
+    self.columns = [str(c) for c in df.columns if str(c) != "dt"]
+    self.nulls = {c:0 for c in self.columns}
+    self.numeric = [str(c) for c in df.columns if str(c) != "dt" and pd.api.types.is_numeric_dtype(df[c])]
+    m = len(self.numeric)
+    self.sketches = [QuantileSketch(self.k,seed=i) for i in range(m)]
+    self.count,self.mean,self.m2 = np.zeros(m),np.zeros(m),np.zeros(m)
+    self.min,self.max = np.full(m,np.inf),np.full(m,-np.inf)
+    self.shift = None
+    self.pair_n,self.pair_sx,self.pair_sxx,self.pair_sxy = (np.zeros((m,m)) for _ in range(4))
+
+  def update(self,df:pd.DataFrame):
+    """Add the rows of `df` (same columns as the first chunk; `dt` is ignored)."""
+    if not len(df): return
+    df = df.set_axis([str(c) for c in df.columns],axis=1)
+    if not self.columns: self._init(df)
+    self.n_rows += len(df)
+    for c,n in df.reindex(columns=self.columns).isna().sum().items(): self.nulls[c] += int(n)
+    if not self.numeric: return
+    X = df.reindex(columns=self.numeric).to_numpy(dtype=np.float64)
+    present = ~np.isnan(X)
+
+    count = present.sum(axis=0).astype(np.float64)
+    with np.errstate(invalid="ignore",divide="ignore"):
+      mean = np.where(count > 0,np.nansum(X,axis=0) / np.maximum(count,1),0.0)
+      m2 = np.nansum((X - mean) ** 2,axis=0)
+    self._merge_moments(count,mean,m2)
+    self.min = np.fmin(self.min,np.nanmin(np.where(present,X,np.inf),axis=0))
+    self.max = np.fmax(self.max,np.nanmax(np.where(present,X,-np.inf),axis=0))
+    for sketch,values in zip(self.sketches,X.T): sketch.update(values)
+
+    if self.shift is None: self.shift = mean
+    Xc = np.where(present,X - self.shift,0.0)
+    P = present.astype(np.float64)
+    self.pair_n += P.T @ P
+    self.pair_sx += Xc.T @ P
+    self.pair_sxx += (Xc ** 2).T @ P
+    self.pair_sxy += Xc.T @ Xc
+
+  def _merge_moments(self,count,mean,m2):
+    total = self.count + count
+    delta = mean - self.mean
+    with np.errstate(invalid="ignore",divide="ignore"):
+      self.mean = np.where(total > 0,self.mean + delta * count / np.maximum(total,1),0.0)
+      self.m2 = self.m2 + m2 + np.where(total > 0,delta ** 2 * self.count * count / np.maximum(total,1),0.0)
+    self.count = total
+
+  def merge(self,other:"Profile"):
+    """Fold `other` (a profile of rows appended after these) into this profile."""
+    if not other.n_rows: return
+    if not self.columns:
+      self.__dict__.update(copy.deepcopy(other.__dict__))
+      return
+    if other.columns != self.columns: raise ValueError("Profiles have different columns")
+    self.n_rows += other.n_rows
+    for c,n in other.nulls.items(): self.nulls[c] += n
+    if not self.numeric: return
+    self._merge_moments(other.count,other.mean,other.m2)
+    self.min,self.max = np.fmin(self.min,other.min),np.fmax(self.max,other.max)
+    for sketch,o in zip(self.sketches,other.sketches): sketch.merge(o)
+    if self.shift is None: self.shift = other.shift
+    d = other.shift - self.shift
+    n,sx = other.pair_n,other.pair_sx
+    self.pair_n += n
+    self.pair_sxy += other.pair_sxy + sx * d[None,:] + sx.T * d[:,None] + n * np.outer(d,d)
+    self.pair_sxx += other.pair_sxx + 2 * d[:,None] * sx + n * d[:,None] ** 2
+    self.pair_sx += sx + n * d[:,None]
+
+  def std(self) -> np.ndarray:
+    with np.errstate(invalid="ignore",divide="ignore"): return np.where(self.count > 1,np.sqrt(self.m2 / (self.count - 1)),np.nan)
+
+  def describe(self) -> dict:
+    """`DataFrame.describe()`-shaped dict {column: {count, mean, std, min, 25%, 50%, 75%, max}}."""
+    out,std = {},self.std()
+    for i,col in enumerate(self.numeric):
+      empty = not self.count[i]
+      qs = self.sketches[i].quantiles(QUANTILES)
+      stats = dict(count=self.count[i],mean=np.nan if empty else self.mean[i],std=std[i],
+                   min=np.nan if empty else self.min[i],**{f"{int(q*100)}%":v for q,v in zip(QUANTILES,qs)},
+                   max=np.nan if empty else self.max[i])
+      out[col] = {k:clean(v) for k,v in stats.items()}
+    return out
+
+  def correlation(self) -> dict:
+    """Pairwise-complete Pearson correlation, {column: {column: r}}."""
+    n = np.maximum(self.pair_n,1)
+    with np.errstate(invalid="ignore",divide="ignore"):
+      cov = self.pair_sxy - self.pair_sx * self.pair_sx.T / n
+      var = self.pair_sxx - self.pair_sx ** 2 / n
+      r = cov / np.sqrt(var * var.T)
+    r[self.pair_n < 2] = np.nan
+    return {a:{b:clean(r[i,j]) for j,b in enumerate(self.numeric)} for i,a in enumerate(self.numeric)}
+
+  def histograms(self,bins:int = 20) -> dict:
+    """Approximate histograms from the quantile sketches: {column: {edges, counts}}."""
+    out = {}
+    for i,col in enumerate(self.numeric):
+      items,weights = self.sketches[i].weighted()
+      if not len(items): continue
+      counts,edges = np.histogram(items,bins=bins,range=(self.min[i],self.max[i]),weights=weights)
+      out[col] = dict(edges=edges.tolist(),counts=np.rint(counts).astype(int).tolist())
+    return out
+
+  def has_outliers(self,factor:float = 3.0) -> bool:
+    """True when any column reaches beyond `factor` IQRs outside its quartiles."""
+    for i in range(len(self.numeric)):
+      if not self.count[i]: continue
+      q1,_,q3 = self.sketches[i].quantiles(QUANTILES)
+      iqr = q3 - q1
+      if iqr > 0 and (self.min[i] < q1 - factor * iqr or self.max[i] > q3 + factor * iqr): return True
+    return False
+
+  def summary(self) -> dict:
+    return dict(n_rows=self.n_rows,nulls=self.nulls,describe=self.describe(),correlation=self.correlation(),
+                histograms=self.histograms(),is_outlier=self.has_outliers())
+
+  def to_dict(self) -> dict:
+    arrays = ("count","mean","m2","min","max","shift","pair_n","pair_sx","pair_sxx","pair_sxy")
+    return dict(k=self.k,n_rows=self.n_rows,columns=self.columns,nulls=self.nulls,numeric=self.numeric,
+                sketches=[s.to_dict() for s in self.sketches],
+                **{a:None if getattr(self,a) is None else getattr(self,a).tolist() for a in arrays})
+
+  @classmethod
+  def from_dict(cls,data:dict) -> "Profile":
+    profile = cls(data["k"])
+    profile.n_rows,profile.columns,profile.nulls,profile.numeric = data["n_rows"],data["columns"],data["nulls"],data["numeric"]
+    profile.sketches = [QuantileSketch.from_dict(s) for s in data["sketches"]]
+    for a in ("count","mean","m2","min","max","shift","pair_n","pair_sx","pair_sxx","pair_sxy"):
+      setattr(profile,a,None if data[a] is None else np.asarray(data[a],dtype=np.float64))
+    return profile
+
+  def save(self,path:pathlib.Path):
+    path = pathlib.Path(path)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(self.to_dict()))
+    os.replace(tmp,path)
+
+  @classmethod
+  def load(cls,path:pathlib.Path) -> Optional["Profile"]:
+    try: return cls.from_dict(json.loads(pathlib.Path(path).read_text()))
+    except (OSError,ValueError,KeyError): return None
+
+def dataset_profile(store) -> Profile:
+  """Stored profile of a `DatasetStore`, built in one pass over the data (and saved) when missing."""
+  profile = Profile.load(store.profile)
+  if profile is None:
+    profile = Profile()
+    for chunk in store.iter_frames(): profile.update(chunk)
+    profile.save(store.profile)
+  return profile
+
+def clean(value) -> Optional[float]:
+  """JSON-safe float: NaN/inf become None."""
+  value = float(value)
+  return value if np.isfinite(value) else None
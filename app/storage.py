@@ -0,0 +1,334 @@
+"""
+Columnar dataset storage.
+
+A dataset lives under `storages/<name>/data/` as Parquet part files
+(`part-00000.parquet`, ...) with float columns and a typed `dt` timestamp
+column. Parts are appended in time order and written one row group per day,
+so time-range filters skip whole row groups using Parquet statistics and
+column projection reads only the requested columns.
+
+Every write or append drops `profile.json` (see `app.stats`); writers that
+know the new profile save it again afterwards.
+
+Datasets written before this layout keep working from `storages/<name>/data.csv`
+until they are migrated:
+
+  python -m app.storage migrate [name ...]
+"""
+import os,io,sys,shutil,pathlib,numpy as np,pandas as pd,pyarrow as pa,pyarrow.parquet as pq,pyarrow.dataset as ds
+from typing import Optional,List,Union
+from app.config import Config
+
+DT = "dt"
+
+class DatasetWriter:
+  """
+  Write a whole dataset chunk by chunk into `data.tmp/`, swapped in by `commit`.
+
+  Every `write` call becomes one row group; all chunks must share the first
+  chunk's columns. Used as a context manager it commits on success and
+  discards the partial data on error.
+  """
+  def __init__(self,store:"DatasetStore"):
+    self.store = store
+    self.tmp = store.root/"data.tmp"
+    shutil.rmtree(self.tmp,ignore_errors=True)
+    self.tmp.mkdir(parents=True)
+    self.schema = None
+    self._writer = None
+
+  def write(self,df:pd.DataFrame):
+    table = to_table(df,self.schema)
+    if self._writer is None:
+      self.schema = table.schema
+      self._writer = pq.ParquetWriter(self.tmp/"part-00000.parquet",self.schema)
+    self._writer.write_table(table)
+
+  def commit(self):
+    if self._writer: self._writer.close()
+    old = self.store.root/"data.old"
+    shutil.rmtree(old,ignore_errors=True)
+    if self.store.data.exists(): os.replace(self.store.data,old)
+    os.replace(self.tmp,self.store.data)
+    shutil.rmtree(old,ignore_errors=True)
+    self.store.csv.unlink(missing_ok=True)
+    self.store.profile.unlink(missing_ok=True)
+
+  def abort(self):
+    if self._writer: self._writer.close()
+    shutil.rmtree(self.tmp,ignore_errors=True)
+
+  def __enter__(self): return self
+  def __exit__(self,exc_type,*_):
+    if exc_type is None: self.commit()
+    else: self.abort()
+
+class DatasetStore:
+  """Read/write access to one dataset directory (`storages/<name>` by default)."""
+  def __init__(self,root:Union[str,pathlib.Path]):
+    self.root = pathlib.Path(root)
+    self.data = self.root/"data"
+    self.csv = self.root/"data.csv"
+    self.profile = self.root/"profile.json"
+
+  @property
+  def format(self) -> Optional[str]:
+    if self.data.is_dir(): return "parquet"
+    if self.csv.exists(): return "csv"
+    return None
+
+  def exists(self) -> bool: return self.format is not None
+
+  def parts(self) -> List[pathlib.Path]: return sorted(self.data.glob("part-*.parquet"))
+
+  def signature(self) -> tuple:
+    """(file, mtime_ns, size) of every stored file; changes whenever the data is rewritten or appended."""
+    files = self.parts() if self.format == "parquet" else [self.csv] if self.format == "csv" else []
+    if not files: raise FileNotFoundError(f"Dataset is not found: {self.root}")
+    return tuple((p.name,st.st_mtime_ns,st.st_size) for p,st in ((p,p.stat()) for p in files))
+
+  def columns(self) -> List[str]:
+    """Stored column names (including `dt`) without reading any data."""
+    if self.format == "parquet": return pq.read_schema(self.parts()[0]).names
+    if self.format == "csv": return pd.read_csv(self.csv,nrows=0).columns.tolist()
+    raise FileNotFoundError(f"Dataset is not found: {self.root}")
+
+  def num_rows(self) -> int:
+    if self.format == "parquet": return sum(pq.ParquetFile(p).metadata.num_rows for p in self.parts())
+    if self.format == "csv":
+      with open(self.csv,"rb") as f: return max(sum(1 for _ in f) - 1,0)
+    raise FileNotFoundError(f"Dataset is not found: {self.root}")
+
+  def read(self,columns:Optional[List[str]] = None,start = None,end = None,index:bool = False) -> pd.DataFrame:
+    """
+    Load the dataset, or part of it.
+
+    Args:
+      columns: Columns to read (default: all, including `dt`); `dt` is only
+               returned when listed or when `columns` is None
+      start, end: Inclusive bounds on `dt`, pushed down to row-group statistics
+      index: Return `dt` as the index instead of a column
+    """
+    fmt = self.format
+    if fmt is None: raise FileNotFoundError(f"Dataset is not found: {self.root}")
+    filtered = start is not None or end is not None
+    wanted = None if columns is None else list(dict.fromkeys([*columns,DT] if index or filtered else columns))
+    if fmt == "parquet":
+      dataset = ds.dataset([str(p) for p in self.parts()],format="parquet")
+      bounds,expr = bounds_for(dataset.schema.field(DT).type,start,end),None
+      if bounds[0] is not None: expr = ds.field(DT) >= bounds[0]
+      if bounds[1] is not None: expr = (ds.field(DT) <= bounds[1]) if expr is None else expr & (ds.field(DT) <= bounds[1])
+      df = dataset.to_table(columns=wanted,filter=expr).to_pandas()
+      if DT in df and getattr(df[DT].dtype,"tz",None) is not None: df[DT] = df[DT].dt.tz_convert(Config.utc)
+    else:
+      df = pd.read_csv(self.csv,usecols=wanted,parse_dates=[DT] if wanted is None or DT in wanted else None)
+      if filtered:
+        lo,hi = bounds_for(df[DT].dtype,start,end)
+        keep = pd.Series(True,index=df.index)
+        if lo is not None: keep &= df[DT] >= lo
+        if hi is not None: keep &= df[DT] <= hi
+        df = df[keep].reset_index(drop=True)
+    if index: df = df.set_index(DT)
+    if columns is not None: df = df[[c for c in columns if c != DT or not index]]
+    return df
+
+  def iter_frames(self,batch_rows:int = 100_000,columns:Optional[List[str]] = None):
+    """Yield the dataset (or `columns` of it) in order as frames of about `batch_rows` rows."""
+    if self.format == "parquet":
+      buffer,rows = [],0
+      for batch in ds.dataset([str(p) for p in self.parts()],format="parquet").to_batches(columns=columns,batch_size=batch_rows):
+        buffer.append(batch)
+        rows += batch.num_rows
+        if rows >= batch_rows:
+          yield pa.Table.from_batches(buffer).to_pandas()
+          buffer,rows = [],0
+      if rows: yield pa.Table.from_batches(buffer).to_pandas()
+    elif self.format == "csv":
+      parse = [DT] if columns is None or DT in columns else None
+      yield from pd.read_csv(self.csv,chunksize=batch_rows,usecols=columns,parse_dates=parse)
+    else: raise FileNotFoundError(f"Dataset is not found: {self.root}")
+
+  def row_groups(self,files:Optional[dict] = None) -> List[tuple]:
+    """`(part, row_group, first_row, num_rows, dt_min, dt_max)` for every row group, from Parquet metadata only."""
+    files = files or {p:pq.ParquetFile(p) for p in self.parts()}
+    groups,first = [],0
+    for part,f in files.items():
+      meta = f.metadata
+      i_dt = meta.schema.names.index(DT)
+      for i in range(meta.num_row_groups):
+        rg = meta.row_group(i)
+        st = rg.column(i_dt).statistics
+        lo,hi = (pd.Timestamp(st.min),pd.Timestamp(st.max)) if st is not None and st.has_min_max else (None,None)
+        groups.append((part,i,first,rg.num_rows,lo,hi))
+        first += rg.num_rows
+    return groups
+
+  def sample(self,n:int,seed:Optional[int] = None,columns:Optional[List[str]] = None,
+             start = None,end = None,stratify:Optional[str] = None) -> pd.DataFrame:
+    """
+    `n` random rows (without replacement), indexed by row position and sorted.
+
+    Only the row groups holding the chosen rows are read. Row groups fully
+    inside `[start, end]` are counted from metadata; those straddling a bound
+    read just their `dt` column. With `stratify`, that column is read for the
+    eligible rows and `n` is split across its classes proportionally (at
+    least one row per class when `n` allows). The same `seed` gives the same rows.
+    """
+    rng = np.random.default_rng(seed)
+    if self.format == "csv": return self._sample_csv(n,rng,columns,start,end,stratify)
+    if self.format is None: raise FileNotFoundError(f"Dataset is not found: {self.root}")
+    filtered = start is not None or end is not None
+    files = {p:pq.ParquetFile(p) for p in self.parts()}
+    lo,hi = bounds_for(files[next(iter(files))].schema_arrow.field(DT).type,start,end)
+    groups,offsets = [],[]
+    for part,i,first,num,gmin,gmax in self.row_groups(files):
+      if filtered and gmin is not None and ((hi is not None and gmin > hi) or (lo is not None and gmax < lo)): continue
+      if not filtered or (gmin is not None and (lo is None or gmin >= lo) and (hi is None or gmax <= hi)): rows = None
+      else:
+        dt = files[part].read_row_group(i,columns=[DT]).column(DT).to_pandas()
+        keep = pd.Series(True,index=dt.index)
+        if lo is not None: keep &= dt >= lo
+        if hi is not None: keep &= dt <= hi
+        rows = np.flatnonzero(keep.to_numpy())
+        if not len(rows): continue
+      groups.append((part,i,first,num))
+      offsets.append(rows)
+    sizes = np.array([num if rows is None else len(rows) for (_,_,_,num),rows in zip(groups,offsets)],dtype=np.int64)
+    total = int(sizes.sum())
+
+    if stratify:
+      labels = [files[part].read_row_group(i,columns=[stratify]).column(stratify).to_numpy(zero_copy_only=False)
+                for part,i,_,_ in groups]
+      labels = np.concatenate([l if rows is None else l[rows] for l,rows in zip(labels,offsets)]) if labels else np.empty(0)
+      chosen = stratified_choice(labels,n,rng)
+    else: chosen = np.sort(rng.choice(total,size=min(n,total),replace=False)) if total else np.empty(0,dtype=np.int64)
+
+    ends = np.cumsum(sizes)
+    which = np.searchsorted(ends,chosen,side="right")
+    tables,index = [],[]
+    for g in np.unique(which):
+      part,i,first,num = groups[g]
+      local = chosen[which == g] - (ends[g] - sizes[g])
+      rows = local if offsets[g] is None else offsets[g][local]
+      tables.append(files[part].read_row_group(i,columns=columns).take(pa.array(rows)))
+      index.append(first + rows)
+    if not tables: return self.read(columns=columns).iloc[:0]
+    df = pa.concat_tables(tables).to_pandas().set_axis(pd.Index(np.concatenate(index)),axis=0)
+    if DT in df and getattr(df[DT].dtype,"tz",None) is not None: df[DT] = df[DT].dt.tz_convert(Config.utc)
+    return df
+
+  def line_index(self) -> np.ndarray:
+    """Byte offset of every data line of the legacy CSV, cached in `data.csv.idx.npy` until the CSV changes."""
+    path = self.root/"data.csv.idx.npy"
+    if path.exists() and path.stat().st_mtime_ns >= self.csv.stat().st_mtime_ns: return np.load(path)
+    raw = np.fromfile(self.csv,dtype=np.uint8)
+    starts = np.flatnonzero(raw == ord("\n")) + 1
+    starts = starts[starts < len(raw)].astype(np.int64)
+    tmp = self.root/"data.csv.idx.tmp.npy"
+    np.save(tmp,starts)
+    os.replace(tmp,path)
+    return starts
+
+  def _sample_csv(self,n,rng,columns,start,end,stratify) -> pd.DataFrame:
+    starts = self.line_index()
+    if start is not None or end is not None or stratify:
+      eligible = pd.read_csv(self.csv,usecols=[DT] + ([stratify] if stratify else []),parse_dates=[DT])
+      lo,hi = bounds_for(eligible[DT].dtype,start,end)
+      if lo is not None: eligible = eligible[eligible[DT] >= lo]
+      if hi is not None: eligible = eligible[eligible[DT] <= hi]
+      positions = eligible.index.to_numpy()
+      if stratify: positions = positions[stratified_choice(eligible[stratify].to_numpy(),n,rng)]
+      else: positions = np.sort(rng.choice(positions,size=min(n,len(positions)),replace=False))
+    else: positions = np.sort(rng.choice(len(starts),size=min(n,len(starts)),replace=False))
+    with open(self.csv,"rb") as f:
+      lines = [f.readline()]
+      for pos in positions:
+        f.seek(starts[pos])
+        lines.append(f.readline())
+    df = pd.read_csv(io.BytesIO(b"".join(lines)),parse_dates=[DT]).set_axis(pd.Index(positions),axis=0)
+    return df if columns is None else df[columns]
+
+  def writer(self) -> DatasetWriter: return DatasetWriter(self)
+
+  def write(self,df:pd.DataFrame):
+    """Replace the dataset with `df`."""
+    with self.writer() as w: w.write(df)
+
+  def append(self,df:pd.DataFrame):
+    """Append `df` (rows after the stored range) as a new part, or to the legacy CSV."""
+    self.profile.unlink(missing_ok=True)
+    if self.format == "csv": return df.to_csv(self.csv,mode="a",header=False,index=False)
+    if self.format is None: return self.write(df)
+    parts = self.parts()
+    schema = pq.read_schema(parts[0]) if parts else None
+    n = int(parts[-1].stem.split("-")[1]) + 1 if parts else 0
+    tmp = self.data/f"part-{n:05d}.tmp"
+    pq.write_table(to_table(df,schema),tmp)
+    os.replace(tmp,self.data/f"part-{n:05d}.parquet")
+
+  def delete(self):
+    shutil.rmtree(self.data,ignore_errors=True)
+    self.csv.unlink(missing_ok=True)
+    self.profile.unlink(missing_ok=True)
+
+  def migrate(self,chunksize:int = 100_000) -> bool:
+    """Convert a legacy `data.csv` to Parquet; returns False when there is nothing to migrate."""
+    if self.format != "csv": return False
+    with self.writer() as w:
+      for chunk in pd.read_csv(self.csv,chunksize=chunksize,parse_dates=[DT]): w.write(chunk)
+    return True
+
+def dataset_store(name:str) -> DatasetStore: return DatasetStore(Config.dir/"storages"/name)
+
+def to_table(df:pd.DataFrame,schema:Optional[pa.Schema] = None) -> pa.Table:
+  df = df.reset_index() if df.index.name == DT else df
+  df = df.set_axis([str(c) for c in df.columns],axis=1)
+  if DT in df and not pd.api.types.is_datetime64_any_dtype(df[DT]): df[DT] = pd.to_datetime(df[DT])
+  return pa.Table.from_pandas(df,schema=schema,preserve_index=False)
+
+def stratified_choice(labels:np.ndarray,n:int,rng:np.random.Generator) -> np.ndarray:
+  """Sorted positions of `n` rows drawn per class of `labels`, proportionally to class size (at least one each when possible)."""
+  classes,inverse,counts = np.unique(pd.Series(labels).fillna("<NA>").astype(str).to_numpy(),return_inverse=True,return_counts=True)
+  n = min(n,len(labels))
+  if not n: return np.empty(0,dtype=np.int64)
+  quota = counts * n / counts.sum()
+  alloc = np.floor(quota).astype(int)
+  if n >= len(classes): alloc = np.maximum(alloc,1)
+  for c in np.argsort(alloc - quota):
+    if alloc.sum() >= n: break
+    if alloc[c] < counts[c]: alloc[c] += 1
+  while alloc.sum() > n: alloc[np.argmax(alloc)] -= 1
+  chosen = [rng.choice(np.flatnonzero(inverse == c),size=min(k,counts[c]),replace=False) for c,k in enumerate(alloc) if k]
+  return np.sort(np.concatenate(chosen))
+
+def bounds_for(dtype,start,end) -> tuple:
+  """Turn `start`/`end` into timestamps comparable with a `dt` column of `dtype` (arrow or pandas)."""
+  tz = getattr(dtype,"tz",None)
+  def cast(value):
+    if value is None: return None
+    ts = pd.Timestamp(value)
+    if tz is not None: return ts.tz_localize(Config.utc) if ts.tz is None else ts
+    return ts.tz_convert(Config.utc).tz_localize(None) if ts.tz is not None else ts
+  return cast(start),cast(end)
+
+def migrate(names:Optional[List[str]] = None):
+  """Migrate the given datasets (default: every `storages/*/data.csv`) and point their meta at the new files."""
+  from sqlmodel import Session
+  from app.database import db
+  from app.database.orm import Dataset
+  roots = [Config.dir/"storages"/n for n in names] if names else sorted(p.parent for p in (Config.dir/"storages").glob("*/data.csv"))
+  with Session(db.engine) as session:
+    for root in roots:
+      if not DatasetStore(root).migrate():
+        print(f"skip    {root.name}")
+        continue
+      dataset = Dataset.get_by_name(root.name,session)
+      if dataset and dataset.meta:
+        dataset.meta = {**dataset.meta,"path":f"storages/{root.name}/data"}
+        session.commit()
+      print(f"migrated {root.name}")
+
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2 or sys.argv[1] != "migrate": sys.exit("usage: python -m app.storage migrate [name ...]")
+  migrate(sys.argv[2:])
@@ -0,0 +1,198 @@
+"""
+Tag-centric store of raw historian samples, shared by every dataset.
+
+Each tag (`row_id` in `tagname.csv`) has one partition set, split by month:
+
+  storages/tags/<row_id>/month=YYYY-MM/<YYYYMMDD>.parquet
+
+A day file holds the whole day (00:00:00-23:59:59) of raw samples at the
+historian's 1 s interval as `dt`/`value`; an empty file records a day
+without data. Pulls fetch only the (tag, day) units missing here and
+datasets are materialized from the store (see `app.pull.pull_to_disk`), so
+datasets built on the same tags share one copy of their history.
+
+Days from today on are never complete (the historian keeps writing into
+them): they are stored like the others but fetched again by pulls once
+`Config.tag_refetch_after` seconds have passed since their last fetch (the
+day file's mtime, see `fresh`).
+
+Every day also lands as rollups (`ROLLUPS`: 1 min, 15 min, 1 h) under
+`<row_id>/rollup=<level>/month=YYYY-MM/<YYYYMMDD>.parquet`, one row per
+right-closed bucket `(t - level, t]` labelled `t`, with the `mean`, `min`,
+`max`, `count` and `last` value and the time of that last sample
+(`last_dt`). On a grid aligned to the level, as-of ("ffill") alignment
+over the bucket-last samples gives exactly the result of the raw samples,
+so pulls with a coarse grid read 60-3600x fewer rows (see `level_for`).
+Rollups missing for an existing day are built from it on first use.
+
+Fetches of a (tag, day) take its `lock` (a `.lock` file next to the day
+file, removed on release), so pulls running at the same time in other
+workers, such as those of datasets created together, wait for the first
+fetch and read its result. Without `fcntl` (non-POSIX) the lock only holds
+across the threads of one process.
+"""
+import os,time,pathlib,threading,numpy as np,pandas as pd,pyarrow.parquet as pq,pyarrow.dataset as ds
+from datetime import datetime
+from contextlib import contextmanager
+from typing import List,Optional,Tuple,Union
+from app.config import Config
+from app.helpers import FMT_DT
+try: import fcntl
+except ImportError: fcntl = None
+
+DAY_START,DAY_END = "00:00:00","23:59:59"
+ROLLUPS = {"1h":3600,"15min":900,"1min":60}
+
+def rollup(df:pd.DataFrame,seconds:int) -> pd.DataFrame:
+  """Aggregate one value column indexed by `dt` into right-closed `seconds` buckets labelled by their end."""
+  ts = df.index.asi8
+  values = df.iloc[:,0].to_numpy(dtype=np.float64)
+  keep = ~np.isnan(values)
+  ts,values = ts[keep],values[keep]
+  step = seconds * 10**9
+  # plant time is a whole-hour UTC offset, so epoch-aligned buckets are aligned to the plant clock
+  labels = -(-ts // step) * step
+  starts = np.flatnonzero(np.r_[True,labels[1:] != labels[:-1]])[:len(ts)]
+  ends = np.r_[starts[1:],len(ts)][:len(starts)].astype(np.int64)
+  count = ends - starts
+  reduce = lambda ufunc: ufunc.reduceat(values,starts) if len(ts) else np.empty(0)
+  to_dt = lambda ns: pd.DatetimeIndex(ns.astype("datetime64[ns]")).tz_localize("UTC").tz_convert(Config.utc)
+  return pd.DataFrame({"mean":reduce(np.add) / np.maximum(count,1),"min":reduce(np.minimum),"max":reduce(np.maximum),
+                       "count":count,"last":values[ends - 1],"last_dt":to_dt(ts[ends - 1])},
+                      index=to_dt(labels[starts]).rename("dt"))
+
+def level_for(step:int,time_start:str = DAY_START,time_end:str = DAY_END) -> Optional[str]:
+  """
+  Coarsest rollup level whose bucket-last samples align exactly onto a grid of
+  `step` seconds from `time_start` to `time_end`: the step and both ends must
+  fall on bucket edges (`time_end` may also be the end of the day).
+  """
+  ts,te = (int(pd.Timedelta(t).total_seconds()) for t in (time_start,time_end))
+  for level,seconds in ROLLUPS.items():
+    if step % seconds == 0 and ts % seconds == 0 and (te % seconds == 0 or te == 86_399): return level
+  return None
+
+# per-path locks where `fcntl` is missing
+_LOCKS,_LOCKS_GUARD = {},threading.Lock()
+
+class TagStore:
+  """Day files of raw samples per tag under `root` (`storages/tags` by default)."""
+  def __init__(self,root:Union[str,pathlib.Path]):
+    self.root = pathlib.Path(root)
+
+  def path(self,row_id,date:str) -> pathlib.Path:
+    return self.root/str(int(row_id))/f"month={date[:4]}-{date[4:6]}"/f"{date}.parquet"
+
+  @staticmethod
+  def complete(date:str) -> bool:
+    """A day is complete once it is over in plant time."""
+    return date < datetime.now(tz=Config.utc).strftime(FMT_DT)
+
+  def has(self,row_id,date:str) -> bool: return self.complete(date) and self.path(row_id,date).exists()
+
+  def missing(self,units:List[Tuple[str,str]]) -> List[Tuple[str,str]]:
+    return [(col,date) for col,date in units if not self.has(col,date)]
+
+  def fresh(self,row_id,date:str,window:float) -> bool:
+    """Stored and complete, or (a day not over yet) fetched less than `window` seconds ago."""
+    if self.has(row_id,date): return True
+    try: return time.time() - self.path(row_id,date).stat().st_mtime < window
+    except FileNotFoundError: return False
+
+  @contextmanager
+  def lock(self,row_id,date:str):
+    """Exclusive lock on one (tag, day) across threads and processes; its `.lock` file is removed on release."""
+    path = self.path(row_id,date).with_suffix(".lock")
+    path.parent.mkdir(parents=True,exist_ok=True)
+    if fcntl is None:
+      with _LOCKS_GUARD: lock = _LOCKS.setdefault(path,threading.Lock())
+      with lock: yield
+      return
+    while True:
+      f = open(path,"a")
+      fcntl.flock(f,fcntl.LOCK_EX)
+      # the previous holder may have removed the file we waited on: lock the current one instead
+      try: current = os.path.samestat(os.fstat(f.fileno()),os.stat(path))
+      except FileNotFoundError: current = False
+      if current: break
+      f.close()
+    try: yield
+    finally:
+      path.unlink(missing_ok=True)
+      f.close()
+
+  def rollup_path(self,row_id,date:str,level:str) -> pathlib.Path:
+    return self.root/str(int(row_id))/f"rollup={level}"/f"month={date[:4]}-{date[4:6]}"/f"{date}.parquet"
+
+  @staticmethod
+  def _write(path:pathlib.Path,df:pd.DataFrame):
+    path.parent.mkdir(parents=True,exist_ok=True)
+    tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+    df.reset_index().to_parquet(tmp,index=False)
+    os.replace(tmp,path)
+
+  def put(self,row_id,date:str,df:pd.DataFrame):
+    """Store one day as returned by `get_history(..., to_dataframe=True)` (indexed by `dt`, one value column) and its rollups."""
+    if df.empty: df = pd.DataFrame({"value":np.empty(0)},index=pd.DatetimeIndex([],tz=Config.utc,name="dt"))
+    df = df.set_axis(["value"],axis=1).astype({"value":np.float64})
+    for level,seconds in ROLLUPS.items(): self._write(self.rollup_path(row_id,date,level),rollup(df,seconds))
+    self._write(self.path(row_id,date),df)
+
+  def rows(self,row_id,date:str) -> int:
+    path = self.path(row_id,date)
+    return pq.ParquetFile(path).metadata.num_rows if path.exists() else 0
+
+  def get(self,row_id,date:str,time_start:str = DAY_START,time_end:str = DAY_END) -> Optional[pd.DataFrame]:
+    """Samples of one day between `time_start` and `time_end` (inclusive), indexed by `dt`; None when not stored."""
+    path = self.path(row_id,date)
+    if not path.exists(): return None
+    day = pd.Timestamp(datetime.strptime(date,FMT_DT),tz=Config.utc)
+    lo,hi = day + pd.Timedelta(time_start),day + pd.Timedelta(time_end)
+    df = pd.read_parquet(path,filters=[("dt",">=",lo),("dt","<=",hi)])
+    df["dt"] = df["dt"].dt.tz_convert(Config.utc)
+    return df.set_index("dt")
+
+  def get_rollup(self,row_id,date:str,level:str,time_start:str = DAY_START,time_end:str = DAY_END) -> Optional[pd.DataFrame]:
+    """Buckets of one day labelled between `time_start` and `time_end` (inclusive), indexed by `dt`; None when the day is not stored."""
+    frame = self.read_rollups(row_id,[date],level)
+    if frame is None: return None
+    day = pd.Timestamp(datetime.strptime(date,FMT_DT),tz=Config.utc)
+    return frame.loc[day + pd.Timedelta(time_start):day + pd.Timedelta(time_end)]
+
+  def read_rollups(self,row_id,dates:List[str],level:str) -> Optional[pd.DataFrame]:
+    """All buckets of `dates` in one scan, indexed by `dt`; None when any of the days is not stored."""
+    paths = []
+    for date in dates:
+      path = self.rollup_path(row_id,date,level)
+      if not path.exists():
+        raw = self.get(row_id,date)
+        if raw is None: return None
+        self._write(path,rollup(raw,ROLLUPS[level]))
+      paths.append(str(path))
+    df = ds.dataset(paths,format="parquet").to_table().to_pandas()
+    for col in ("dt","last_dt"): df[col] = df[col].dt.tz_convert(Config.utc)
+    return df.set_index("dt").sort_index(kind="stable")
+
+  def samples(self,row_id,date:str,time_start:str = DAY_START,time_end:str = DAY_END,level:Optional[str] = None) -> Optional[pd.DataFrame]:
+    """
+    Samples of one day for as-of alignment, like `get`: the raw samples, or
+    with `level` (see `level_for`) only the last sample of every bucket.
+    """
+    if level is None: return self.get(row_id,date,time_start,time_end)
+    day = pd.Timestamp(datetime.strptime(date,FMT_DT),tz=Config.utc)
+    lo,hi = day + pd.Timedelta(time_start),day + pd.Timedelta(time_end)
+    # the bucket ending right after DAY_END holds the last seconds of the day
+    frame = self.get_rollup(row_id,date,level,time_start,"24:00:00" if time_end == DAY_END else time_end)
+    if frame is None: return None
+    frame = frame[(frame["last_dt"] >= lo) & (frame["last_dt"] <= hi)]
+    return pd.DataFrame({"value":frame["last"].to_numpy()},index=pd.DatetimeIndex(frame["last_dt"],name="dt"))
+
+  def tags(self) -> List[str]: return sorted(p.name for p in self.root.iterdir() if p.is_dir()) if self.root.exists() else []
+
+  def days(self,row_id) -> List[str]: return sorted(p.stem for p in (self.root/str(int(row_id))).glob("month=*/*.parquet"))
+
+  def stats(self) -> dict:
+    files = list(self.root.glob("*/month=*/*.parquet")) if self.root.exists() else []
+    return dict(tags=len(self.tags()),days=len(files),bytes=sum(p.stat().st_size for p in files))
+
+def tag_store() -> TagStore: return TagStore(Config.dir/"storages"/"tags")
@@ -0,0 +1,131 @@
+"""
+Load test: dataset reads through a sync Session vs the AsyncSession helpers under concurrent requests.
+
+  python -m benchmarks.bench_db [--datasets 500] [--concurrency 64] [--seconds 5] [--writers 2]
+
+Serves two versions of `GET /dataset`, `GET /datasets` and a status update
+(`POST /status`, the write of `/dataset/resume`) from one uvicorn process on
+a temporary SQLite database: `/sync/...` is the previous handler shape
+(`async def` calling the sync `Session`, which blocks the event loop for
+every query, including while a write waits for the lock) and `/async/...` the
+current one (`aget_by_name`/`apage` on an `AsyncSession`). `--writers`
+threads play pull workers holding the write lock for `--hold` ms at a time.
+The clients run in a separate process; reports requests/s and latency
+percentiles per variant.
+
+The sync engine gets one pooled connection per client: with fewer, a sync
+handler waiting for a connection blocks the event loop that would release one.
+"""
+import argparse,asyncio,pathlib,random,tempfile,threading,time,numpy as np,httpx,uvicorn
+from fastapi import FastAPI,Depends
+from sqlmodel import SQLModel,Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from concurrent.futures import ProcessPoolExecutor
+from app.database.db import make_engine,make_async_engine,session_scope
+from app.database.orm import Dataset,ModelML
+from app.database.schemas import StatusProcess,TaskType
+
+def make_db(url:str,n:int):
+  engine = make_engine(url)
+  SQLModel.metadata.create_all(engine)
+  with session_scope(write=True,bind=engine) as db:
+    for i in range(n):
+      d = Dataset(name=f"Regression-{i:05d}",description=f"dataset {i}",task_type=TaskType.Regression,features=[str(j) for j in range(20)],
+                  target="1",start_date="20250901",end_date="20250930",time_start="00:00:00",time_end="23:59:00",interval=1,
+                  status=StatusProcess.SUCCESS_PULL)
+      d.models = [ModelML(name=f"m{i}-{j}",algorithm="rf",evaluation={},path="",status=StatusProcess.SUCCESS_TRAIN) for j in range(3)]
+      db.add(d)
+  return engine
+
+def make_app(engine,async_engine) -> FastAPI:
+  app = FastAPI()
+  def sync_session():
+    with Session(engine) as session: yield session
+  async def async_session():
+    async with AsyncSession(async_engine,expire_on_commit=False) as session: yield session
+
+  @app.get("/sync/dataset")
+  async def sync_dataset(name:str,db:Session = Depends(sync_session)): return Dataset.get_by_name(name,db).to_response()
+
+  @app.get("/sync/datasets")
+  async def sync_datasets(db:Session = Depends(sync_session)): return Dataset.page(db,limit=50)
+
+  @app.post("/sync/status")
+  async def sync_status(name:str):
+    with session_scope(write=True,bind=engine) as db: Dataset.get_by_name(name,db).status = StatusProcess.QUEUED
+    return {"msg":"success!"}
+
+  @app.get("/async/dataset")
+  async def async_dataset(name:str,db:AsyncSession = Depends(async_session)): return (await Dataset.aget_by_name(name,db)).to_response()
+
+  @app.get("/async/datasets")
+  async def async_datasets(db:AsyncSession = Depends(async_session)): return await Dataset.apage(db,limit=50)
+
+  @app.post("/async/status")
+  async def async_status(name:str):
+    async with AsyncSession(async_engine.execution_options(sqlite_immediate=True),expire_on_commit=False) as db:
+      (await Dataset.aget_by_name(name,db)).status = StatusProcess.QUEUED
+      await db.commit()
+    return {"msg":"success!"}
+
+  return app
+
+def writer(engine,n:int,hold:float,stop:threading.Event):
+  rng,statuses = random.Random(),(StatusProcess.RUNNING_PULL,StatusProcess.SUCCESS_PULL)
+  while not stop.is_set():
+    with session_scope(write=True,bind=engine) as db:
+      Dataset.get_by_name(f"Regression-{rng.randrange(n):05d}",db).status = rng.choice(statuses)
+      time.sleep(hold)
+    time.sleep(hold)
+
+async def load(url:str,variant:str,names,write_ratio:float,concurrency:int,seconds:float) -> np.ndarray:
+  latencies,deadline = [],time.monotonic() + seconds
+  async with httpx.AsyncClient(base_url=url,timeout=60,limits=httpx.Limits(max_connections=concurrency)) as client:
+    async def worker():
+      while time.monotonic() < deadline:
+        t0,r = time.perf_counter(),random.random()
+        if r < write_ratio: req = client.post(f"/{variant}/status",params={"name":random.choice(names)})
+        elif r < write_ratio + 0.1: req = client.get(f"/{variant}/datasets")
+        else: req = client.get(f"/{variant}/dataset",params={"name":random.choice(names)})
+        (await req).raise_for_status()
+        latencies.append(time.perf_counter() - t0)
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+  return np.array(latencies)
+
+def run_load(*args) -> np.ndarray: return asyncio.run(load(*args))
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--datasets",type=int,default=500)
+  parser.add_argument("--concurrency",type=int,default=64)
+  parser.add_argument("--seconds",type=float,default=5.0)
+  parser.add_argument("--writers",type=int,default=2)
+  parser.add_argument("--hold",type=float,default=20,help="ms a pull worker holds the write lock")
+  parser.add_argument("--write-ratio",type=float,default=0.1,help="share of requests that update a status")
+  parser.add_argument("--port",type=int,default=8765)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp:
+    url = f"sqlite:///{pathlib.Path(tmp)/'data.db'}"
+    make_db(url,args.datasets).dispose()
+    engine = make_engine(url,pool_size=args.concurrency,max_overflow=args.writers)
+    async_engine = make_async_engine(url)
+    server = uvicorn.Server(uvicorn.Config(make_app(engine,async_engine),port=args.port,log_level="warning"))
+    threading.Thread(target=server.run,daemon=True).start()
+    while not server.started: time.sleep(0.05)
+    stop = threading.Event()
+    for _ in range(args.writers): threading.Thread(target=writer,args=(engine,args.datasets,args.hold / 1000,stop),daemon=True).start()
+    names = [f"Regression-{i:05d}" for i in range(args.datasets)]
+    print(f"{args.datasets} datasets, {args.concurrency} concurrent clients, {args.writers} writers holding the lock {args.hold:.0f} ms, "
+          f"{args.write_ratio:.0%} writes, {args.seconds:.0f} s per run")
+    for variant in ("sync","async"):
+      with ProcessPoolExecutor(1) as pool:
+        latencies = pool.submit(run_load,f"http://127.0.0.1:{args.port}",variant,names,args.write_ratio,args.concurrency,args.seconds).result()
+      p50,p95,p99 = np.percentile(latencies,[50,95,99]) * 1000
+      print(f"{variant:>5}: {len(latencies) / args.seconds:8.0f} req/s  p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  p99 {p99:7.1f} ms")
+    stop.set()
+    server.should_exit = True
+    engine.dispose()
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,48 @@
+"""
+Micro-benchmark: legacy getDBHistory decoding vs `app.pull.decode_history`.
+
+  python -m benchmarks.bench_decode [n_samples] [repeat]
+
+Default is one day at 1-second resolution (86,400 samples) for one tag.
+"""
+import sys,json,time,numpy as np,pandas as pd
+from datetime import datetime
+from app.config import Config
+from app.pull import decode_history
+
+def make_payload(n:int) -> bytes:
+  start = int(datetime(2025,9,10,tzinfo=Config.utc).timestamp() * 1000)
+  rng = np.random.default_rng(4)
+  rows = [[start + i * 1000,round(float(v),3)] for i,v in enumerate(20 + rng.standard_normal(n))]
+  return json.dumps(rows).encode()
+
+def decode_legacy(content:bytes,row_id) -> pd.DataFrame:
+  """The decode path `get_history` used before vectorization."""
+  dt,val = zip(*json.loads(content))
+  dt = [datetime.fromtimestamp(i/1000,tz=Config.utc) for i in dt]
+  df = pd.DataFrame({"dt": dt, row_id: val})
+  df["dt"] = pd.to_datetime(df["dt"])
+  return df.set_index("dt")
+
+def bench(fn,*args,repeat:int=5) -> float:
+  best = float("inf")
+  for _ in range(repeat):
+    t0 = time.perf_counter()
+    fn(*args)
+    best = min(best,time.perf_counter() - t0)
+  return best
+
+def main(n:int = 86_400,repeat:int = 5):
+  content = make_payload(n)
+  legacy,fast = decode_legacy(content,1),decode_history(content,1)
+  assert legacy.index.equals(fast.index) and np.allclose(legacy[1].to_numpy(float),fast[1].to_numpy())
+  t_legacy = bench(decode_legacy,content,1,repeat=repeat)
+  t_fast = bench(decode_history,content,1,repeat=repeat)
+  t_fast32 = bench(decode_history,content,1,np.float32,repeat=repeat)
+  print(f"samples          : {n:,} ({len(content)/1e6:.1f} MB payload)")
+  print(f"legacy           : {t_legacy*1e3:8.1f} ms")
+  print(f"vectorized f64   : {t_fast*1e3:8.1f} ms  ({t_legacy/t_fast:.1f}x)")
+  print(f"vectorized f32   : {t_fast32*1e3:8.1f} ms  ({t_legacy/t_fast32:.1f}x)")
+
+if __name__ == "__main__":
+  main(*[int(a) for a in sys.argv[1:3]])
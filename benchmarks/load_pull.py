@@ -0,0 +1,72 @@
+"""
+Load test: pull a dataset from the local fake historian and report throughput.
+
+  python -m benchmarks.load_pull --tags 20 --days 3 --latency lognormal:0.05:0.6 --error-rate 0.02
+  python -m benchmarks.load_pull --mode disk --workers 16 --rate 200
+
+`--mode memory` drives `pull_real_data`, `--mode disk` drives `pull_to_disk`
+(the engine behind `pulling`), both with an empty tag store so every unit
+hits the server. Reports rows/s, requests/s, client-side latency percentiles
+and the historian client counters.
+"""
+import argparse,pathlib,tempfile,threading,time,numpy as np
+from datetime import datetime,timedelta
+from app.config import Config
+from app.client import CLIENT
+from app.helpers import FMT_DT
+from app.pull import pull_real_data,pull_to_disk
+from app.tagstore import TagStore
+from tests.fake_historian import FakeHistorian
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--mode",choices=("memory","disk"),default="memory")
+  parser.add_argument("--tags",type=int,default=10)
+  parser.add_argument("--days",type=int,default=2)
+  parser.add_argument("--workers",type=int,default=Config.pull_workers)
+  parser.add_argument("--rate",type=float,default=Config.historian_rate,help="client token-bucket rate (req/s)")
+  parser.add_argument("--latency",default="lognormal:0.03:0.5",help="fixed:S | uniform:LO:HI | lognormal:MEDIAN:SIGMA")
+  parser.add_argument("--error-rate",type=float,default=0.0)
+  parser.add_argument("--timeout-rate",type=float,default=0.0)
+  parser.add_argument("--empty-rate",type=float,default=0.0)
+  parser.add_argument("--sample-seconds",type=int,default=60,help="history sample spacing; sets payload size")
+  parser.add_argument("--step",type=int,default=Config.grid_seconds,help="grid step in seconds")
+  args = parser.parse_args()
+
+  CLIENT.bucket.rate = args.rate
+  fake = FakeHistorian(args.latency,args.error_rate,args.timeout_rate,args.empty_rate,args.sample_seconds,stall=5).start()
+  Config.url = fake.url
+
+  latencies,lock = [],threading.Lock()
+  def record(response,*_,**__):
+    with lock: latencies.append(response.elapsed.total_seconds())
+  CLIENT.session(fake.url).hooks["response"].append(record)
+
+  columns = [str(216998630 + i) for i in range(args.tags)]
+  start = datetime(2025,9,10)
+  start_date,end_date = start.strftime(FMT_DT),(start + timedelta(days=args.days - 1)).strftime(FMT_DT)
+
+  t0 = time.perf_counter()
+  try:
+    with tempfile.TemporaryDirectory() as tmp:
+      tags = TagStore(pathlib.Path(tmp)/"tags")
+      if args.mode == "memory":
+        n_rows = len(pull_real_data(columns,start_date,end_date,"00:00:00","23:59:00",max_workers=args.workers,step=args.step,tags=tags))
+      else:
+        n_rows = pull_to_disk(columns,start_date,end_date,"00:00:00","23:59:00",tmp,max_workers=args.workers,step=args.step,tags=tags)["n_rows"]
+  finally:
+    elapsed = time.perf_counter() - t0
+    fake.stop()
+
+  served = fake.requests
+  payload = sum(r["bytes"] for r in served)
+  p50,p95,p99 = np.percentile(latencies,[50,95,99]) * 1e3 if latencies else (float("nan"),) * 3
+  print(f"mode             : {args.mode} ({args.tags} tags x {args.days} days, {args.workers} workers)")
+  print(f"elapsed          : {elapsed:8.2f} s")
+  print(f"grid rows        : {n_rows:,} ({n_rows / elapsed:,.0f} rows/s, {n_rows * args.tags / elapsed:,.0f} cells/s)")
+  print(f"requests         : {len(served):,} ({len(served) / elapsed:,.1f} req/s, {payload / 1e6:.1f} MB served)")
+  print(f"latency p50/95/99: {p50:.1f} / {p95:.1f} / {p99:.1f} ms")
+  print(f"client           : {CLIENT.stats()}")
+
+if __name__ == "__main__":
+  main()
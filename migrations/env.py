@@ -0,0 +1,28 @@
+from logging.config import fileConfig
+from alembic import context
+from sqlmodel import SQLModel
+from app.config import Config
+from app.database import orm # registers the tables on SQLModel.metadata
+from app.database.db import make_engine
+
+config = context.config
+if config.config_file_name is not None: fileConfig(config.config_file_name,disable_existing_loggers=False)
+target_metadata = SQLModel.metadata
+url = config.get_main_option("sqlalchemy.url") or Config.db_url
+
+def run_migrations_offline():
+  """Emit the SQL instead of running it (`alembic upgrade head --sql`)."""
+  context.configure(url=url,target_metadata=target_metadata,literal_binds=True,render_as_batch=url.startswith("sqlite"),
+                    dialect_opts={"paramstyle":"named"})
+  with context.begin_transaction(): context.run_migrations()
+
+def run_migrations_online():
+  # same engine setup (WAL, busy timeout) as the application, so migrations wait for running pulls
+  engine = make_engine(url,pool_size=1,max_overflow=0)
+  with engine.connect() as connection:
+    context.configure(connection=connection,target_metadata=target_metadata,render_as_batch=url.startswith("sqlite"))
+    with context.begin_transaction(): context.run_migrations()
+  engine.dispose()
+
+if context.is_offline_mode(): run_migrations_offline()
+else: run_migrations_online()
@@ -0,0 +1,25 @@
+"""Indexes for the task_type/status filters and the models of a dataset
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+"""
+from typing import Sequence,Union
+from alembic import op
+
+revision:str = "0001"
+down_revision:Union[str,Sequence[str],None] = None
+branch_labels:Union[str,Sequence[str],None] = None
+depends_on:Union[str,Sequence[str],None] = None
+
+# databases created by `init_db` after this revision already have them
+INDEXES = (("ix_dataset_task_type_status","dataset",["task_type","status"]),("ix_dataset_status","dataset",["status"]),
+           ("ix_modelml_dataset_id_is_active","modelml",["dataset_id","is_active"]),("ix_modelml_status","modelml",["status"]))
+
+
+def upgrade() -> None:
+  for name,table,columns in INDEXES: op.create_index(name,table,columns,if_not_exists=True)
+
+
+def downgrade() -> None:
+  for name,table,_ in INDEXES: op.drop_index(name,table_name=table,if_exists=True)
@@ -0,0 +1,29 @@
+"""Job lease: owner and heartbeat of running jobs
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+"""
+from typing import Sequence,Union
+from alembic import op
+import sqlalchemy as sa
+
+revision:str = "0002"
+down_revision:Union[str,Sequence[str],None] = "0001"
+branch_labels:Union[str,Sequence[str],None] = None
+depends_on:Union[str,Sequence[str],None] = None
+
+COLUMNS = (("owner",sa.String),("heartbeat_at",sa.Float))
+
+
+def upgrade() -> None:
+  # databases created by `init_db` after this revision already have them
+  existing = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("job")}
+  with op.batch_alter_table("job") as batch:
+    for name,type_ in COLUMNS:
+      if name not in existing: batch.add_column(sa.Column(name,type_(),nullable=True))
+
+
+def downgrade() -> None:
+  with op.batch_alter_table("job") as batch:
+    for name,_ in COLUMNS: batch.drop_column(name)
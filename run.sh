@@ -1,3 +1,4 @@
 #!/usr/bin/env zsh
 
+# the API runs the job dispatcher (WORKER=1 by default); with WORKER=0 also start `python -m app.jobs`
 VERBOSE=1 CONFIG=jk5 uvicorn app.server:app --reload --port 8001
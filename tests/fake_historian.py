@@ -0,0 +1,143 @@
+"""
+Local stand-in for the plant historian API.
+
+Implements the two endpoints `app.pull` talks to:
+  POST <base>/tags/get-history   form field `packet` with a getDBHistory call
+  POST <base>/data_point         form fields `token`, `point_id`
+
+Series are synthetic but deterministic per (row_id, day). Latency, error
+rate, timeouts, empty days and payload size are configurable so tests and
+`benchmarks/load_pull.py` can exercise pulls reproducibly.
+
+  python -m tests.fake_historian --port 9000 --latency lognormal:0.05:0.5
+  IP=http://127.0.0.1:9000/beta2/application/api uvicorn app.server:app
+"""
+import json,math,random,threading,time,zlib,argparse
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+from urllib.parse import parse_qs
+from datetime import datetime
+import numpy as np
+from app.config import Config
+
+BASE_PATH = "/beta2/application/api"
+
+class Latency:
+  """Latency distribution parsed from `fixed:S`, `uniform:LO:HI` or `lognormal:MEDIAN:SIGMA` (seconds)."""
+  def __init__(self,spec:str = "fixed:0"):
+    kind,*args = spec.split(":")
+    self.kind,self.args = kind,[float(a) for a in args]
+    if kind not in ("fixed","uniform","lognormal"): raise ValueError(f"Unknown latency distribution: {spec}")
+
+  def sample(self,rng:random.Random) -> float:
+    if self.kind == "fixed": return self.args[0] if self.args else 0.0
+    if self.kind == "uniform": return rng.uniform(*self.args)
+    return rng.lognormvariate(math.log(self.args[0]),self.args[1])
+
+class FakeHistorian:
+  """
+  Threaded HTTP server emulating the historian.
+
+  Args:
+    latency: Latency spec applied to every request (see `Latency`)
+    error_rate: Probability of answering 500
+    timeout_rate: Probability of stalling for `stall` seconds (longer than client timeouts)
+    empty_rate: Probability of returning an empty history
+    sample_seconds: Spacing of history samples; controls payload size
+    seed: Seed for injected faults and latency
+  """
+  def __init__(self,latency:str = "fixed:0",error_rate:float = 0.0,timeout_rate:float = 0.0,empty_rate:float = 0.0,
+               sample_seconds:int = 60,stall:float = 10.0,seed:int = 4,host:str = "127.0.0.1",port:int = 0):
+    self.latency = Latency(latency)
+    self.error_rate,self.timeout_rate,self.empty_rate = error_rate,timeout_rate,empty_rate
+    self.sample_seconds = sample_seconds
+    self.stall = stall
+    self.rng = random.Random(seed)
+    self.requests = []
+    self._lock = threading.Lock()
+    self.server = ThreadingHTTPServer((host,port),self._handler())
+    self.server.daemon_threads = True
+    self._thread = None
+
+  @property
+  def url(self) -> str: return f"http://{self.server.server_address[0]}:{self.server.server_address[1]}{BASE_PATH}"
+
+  def start(self) -> "FakeHistorian":
+    self._thread = threading.Thread(target=self.server.serve_forever,daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def __enter__(self): return self.start()
+  def __exit__(self,*exc): self.stop()
+
+  def history(self,row_id:int,current_date:str,time_start:str,time_end:str) -> list:
+    """Deterministic synthetic series for one tag and day: `[[epoch_ms, value], ...]`."""
+    day = datetime.strptime(current_date,"%Y%m%d").replace(tzinfo=Config.utc)
+    start = int(datetime.strptime(f"{current_date} {time_start}","%Y%m%d %H:%M:%S").replace(tzinfo=Config.utc).timestamp())
+    end = int(datetime.strptime(f"{current_date} {time_end}","%Y%m%d %H:%M:%S").replace(tzinfo=Config.utc).timestamp())
+    rng = np.random.default_rng(zlib.crc32(f"{row_id}-{current_date}".encode()))
+    ts = np.arange(start,end + 1,self.sample_seconds,dtype=np.int64)
+    ts = ts + rng.integers(0,max(self.sample_seconds // 4,1),len(ts))
+    phase = 2 * np.pi * (ts - day.timestamp()) / 86400
+    values = 20 + (row_id % 7) + 3 * np.sin(phase) + rng.normal(0,0.2,len(ts))
+    return [[int(t) * 1000,round(float(v),3)] for t,v in zip(ts,values)]
+
+  def _faults(self) -> tuple:
+    with self._lock:
+      delay = self.latency.sample(self.rng)
+      roll = self.rng.random()
+    if roll < self.timeout_rate: return delay + self.stall,None
+    if roll < self.timeout_rate + self.error_rate: return delay,500
+    return delay,(204 if roll < self.timeout_rate + self.error_rate + self.empty_rate else 200)
+
+  def _handler(self):
+    fake = self
+    class Handler(BaseHTTPRequestHandler):
+      def log_message(self,*args): pass
+
+      def _reply(self,status:int,body:bytes,content_type:str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type",content_type)
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def do_POST(self):
+        t0 = time.perf_counter()
+        form = {k:v[0] for k,v in parse_qs(self.rfile.read(int(self.headers.get("Content-Length",0))).decode()).items()}
+        endpoint = self.path[len(BASE_PATH):] if self.path.startswith(BASE_PATH) else self.path
+        delay,status = fake._faults()
+        time.sleep(delay)
+        size = 0
+        if status == 500: self._reply(500,b"Internal Server Error","text/plain")
+        elif endpoint == "/tags/get-history":
+          params = json.loads(form["packet"])["params"]
+          rows = [] if status == 204 else fake.history(int(params["row_id"]),params["current_date"],params["time_start"],params["time_end"])
+          body = json.dumps(rows).encode()
+          size = len(body)
+          self._reply(200,body)
+        elif endpoint == "/data_point":
+          value = 20 + zlib.crc32(form.get("point_id","").encode()) % 10 + fake.rng.random()
+          self._reply(200,json.dumps({"point_id":form.get("point_id"),"currvalue":f"{value:.3f}"}).encode())
+        else: self._reply(404,b"Not Found","text/plain")
+        with fake._lock: fake.requests.append(dict(endpoint=endpoint,status=status or 200,bytes=size,
+                                                   seconds=time.perf_counter() - t0))
+    return Handler
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Run a local fake historian")
+  parser.add_argument("--port",type=int,default=9000)
+  parser.add_argument("--latency",default="fixed:0")
+  parser.add_argument("--error-rate",type=float,default=0.0)
+  parser.add_argument("--timeout-rate",type=float,default=0.0)
+  parser.add_argument("--empty-rate",type=float,default=0.0)
+  parser.add_argument("--sample-seconds",type=int,default=60)
+  args = parser.parse_args()
+  fake = FakeHistorian(args.latency,args.error_rate,args.timeout_rate,args.empty_rate,args.sample_seconds,port=args.port)
+  print(f"Fake historian on {fake.url}")
+  try: fake.server.serve_forever()
+  except KeyboardInterrupt: fake.server.server_close()
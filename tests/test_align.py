@@ -0,0 +1,54 @@
+from app.align import align_series,align_day,make_grid,grid_step
+import unittest,numpy as np,pandas as pd
+
+S = 10**9
+
+
+class TestAlign(unittest.TestCase):
+  def setUp(self) -> None:
+    self.ts = np.array([0,10,25,60],dtype=np.int64) * S
+    self.values = np.array([1.,2.,3.,4.])
+    self.grid = np.arange(0,70,10,dtype=np.int64) * S
+
+  def test_ffill(self):
+    out = align_series(self.ts,self.values,self.grid,"ffill")
+    np.testing.assert_array_equal(out,[1,2,2,3,3,3,4])
+
+  def test_ffill_max_staleness(self):
+    out = align_series(self.ts,self.values,self.grid,"ffill",max_staleness=15)
+    np.testing.assert_array_equal(out,[1,2,2,3,3,np.nan,4])
+
+  def test_nearest(self):
+    out = align_series(self.ts,self.values,self.grid,"nearest")
+    np.testing.assert_array_equal(out,[1,2,3,3,3,4,4])
+
+  def test_none(self):
+    out = align_series(self.ts,self.values,self.grid,"none")
+    np.testing.assert_array_equal(out,[1,2,np.nan,np.nan,np.nan,np.nan,4])
+
+  def test_before_first_sample(self):
+    out = align_series(self.ts + 5 * S,self.values,self.grid,"ffill")
+    self.assertTrue(np.isnan(out[0]))
+
+  def test_invalid_policy(self):
+    with self.assertRaises(ValueError): align_series(self.ts,self.values,self.grid,"linear")
+
+  def test_align_day_carry(self):
+    self.assertEqual(grid_step(15),900)
+    grid = make_grid("20250910","00:00:00","00:59:00",60)
+    self.assertEqual(len(grid),60)
+    self.assertEqual(str(grid.dtype),"datetime64[ns, UTC+07:00]")
+    frame = pd.DataFrame({"a":[5.,np.nan,7.]},index=grid[[10,20,30]])
+    carry = {"a":(grid[0].value - 30 * S,4.),"b":(grid[0].value - 600 * S,1.)}
+    df,carry = align_day({"a":frame},["a","b"],grid,"ffill",max_staleness=300,carry=carry)
+    self.assertEqual(df.shape,(60,2))
+    self.assertEqual(df["a"].iloc[0],4.)
+    self.assertEqual(df["a"].iloc[15],5.)
+    self.assertTrue(np.isnan(df["a"].iloc[16]))
+    self.assertEqual(df["a"].iloc[34],7.)
+    self.assertTrue(df["b"].isna().all())
+    self.assertEqual(carry["a"],(grid[30].value,7.))
+
+
+if __name__ == "__main__":
+  unittest.main()
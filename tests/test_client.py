@@ -0,0 +1,113 @@
+from app.client import HistorianClient,CircuitBreaker,TokenBucket,Slots,CircuitOpenError,DeadlineError
+from concurrent.futures import ThreadPoolExecutor
+import unittest,tempfile,pathlib,time,requests as req
+
+
+class FakeResponse:
+  def __init__(self,status_code): self.status_code,self.content = status_code,b""
+
+class FakeSession:
+  def __init__(self,*outcomes): self.outcomes,self.calls = list(outcomes),0
+  def post(self,url,**kwargs):
+    self.calls += 1
+    outcome = self.outcomes.pop(0) if self.outcomes else 200
+    if isinstance(outcome,Exception): raise outcome
+    return FakeResponse(outcome)
+
+
+class TestHistorianClient(unittest.TestCase):
+  def make(self,**kwargs):
+    params = dict(rate=1000,burst=100,max_inflight=4,threshold=2,reset_timeout=0.2,max_backoff=0.01)
+    return HistorianClient(**{**params,**kwargs})
+
+  def test_token_bucket(self):
+    bucket = TokenBucket(rate=50,burst=2)
+    t0 = time.monotonic()
+    waits = [bucket.acquire() for _ in range(5)]
+    self.assertEqual(waits[:2],[0.0,0.0])
+    self.assertTrue(all(w > 0 for w in waits[2:]))
+    self.assertGreaterEqual(time.monotonic() - t0,0.05)
+
+  def test_circuit_breaker(self):
+    breaker = CircuitBreaker(threshold=2,reset_timeout=0.1)
+    breaker.record_failure()
+    self.assertTrue(breaker.allow())
+    breaker.record_failure()
+    self.assertFalse(breaker.allow())
+    time.sleep(0.12)
+    self.assertTrue(breaker.allow())
+    self.assertFalse(breaker.allow())
+    breaker.record_success()
+    self.assertEqual(breaker.state,CircuitBreaker.CLOSED)
+
+  def test_short_circuit(self):
+    client = self.make()
+    session = FakeSession(req.exceptions.Timeout(),503)
+    with self.assertRaises(req.exceptions.Timeout): client.post("http://h/x",session=session)
+    self.assertEqual(client.post("http://h/x",session=session).status_code,503)
+    with self.assertRaises(CircuitOpenError): client.post("http://h/x",session=session)
+    self.assertEqual(session.calls,2)
+    stats = client.stats()
+    self.assertEqual((stats["failures"],stats["short_circuited"],stats["circuit"]),(2,1,"open"))
+    time.sleep(0.25)
+    self.assertEqual(client.post("http://h/x",session=session).status_code,200)
+    self.assertEqual(client.stats()["circuit"],"closed")
+
+  def test_half_open_trial_other_error(self):
+    client = self.make(threshold=1)
+    session = FakeSession(req.exceptions.Timeout(),req.exceptions.ChunkedEncodingError(),200)
+    with self.assertRaises(req.exceptions.Timeout): client.post("http://h/x",session=session)
+    time.sleep(0.25)
+    with self.assertRaises(req.exceptions.ChunkedEncodingError): client.post("http://h/x",session=session)
+    self.assertEqual(client.stats()["circuit"],"open")
+    time.sleep(0.25)
+    self.assertEqual(client.post("http://h/x",session=session).status_code,200)
+    self.assertEqual(client.stats()["circuit"],"closed")
+
+  def test_throttled_and_retried(self):
+    client = self.make(rate=100,burst=1)
+    session = FakeSession()
+    for _ in range(3): client.post("http://h/x",session=session)
+    client.backoff(0,0.001)
+    stats = client.stats()
+    self.assertEqual((stats["requests"],stats["throttled"],stats["retried"]),(3,2,1))
+
+  def test_deadline(self):
+    client = self.make(rate=1,burst=1,max_inflight=1)
+    session = FakeSession()
+    client.post("http://h/x",session=session)
+    t0 = time.perf_counter()
+    with self.assertRaises(DeadlineError): client.post("http://h/x",session=session,deadline=t0 + 0.1)
+    client = self.make(max_inflight=1)
+    slot = client.inflight.acquire()
+    with self.assertRaises(DeadlineError): client.post("http://h/x",session=session,deadline=time.perf_counter() + 0.1)
+    self.assertLess(time.perf_counter() - t0,0.5)
+    client.inflight.release(slot)
+    self.assertEqual(session.calls,1)
+
+  def test_shared_state(self):
+    # clients in different processes share their files: separate instances behave the same
+    with tempfile.TemporaryDirectory() as tmp:
+      a,b = self.make(state_dir=tmp),self.make(state_dir=tmp)
+      with self.assertRaises(req.exceptions.Timeout): a.post("http://h/x",session=FakeSession(req.exceptions.Timeout()))
+      self.assertEqual(a.post("http://h/x",session=FakeSession(503)).status_code,503)
+      with self.assertRaises(CircuitOpenError): b.post("http://h/x",session=FakeSession())
+      self.assertEqual(b.stats()["circuit"],"open")
+
+      buckets = [TokenBucket(rate=50,burst=2,path=pathlib.Path(tmp)/"bucket2") for _ in range(2)]
+      waits = [bucket.acquire() for bucket in buckets * 2]
+      self.assertEqual(waits[:2],[0.0,0.0])
+      self.assertTrue(all(w > 0 for w in waits[2:]))
+
+      slots = [Slots(1,pathlib.Path(tmp)/"slots") for _ in range(2)]
+      slot = slots[0].acquire()
+      with ThreadPoolExecutor(1) as pool:
+        other = pool.submit(slots[1].acquire)
+        time.sleep(0.05)
+        self.assertFalse(other.done())
+        slots[0].release(slot)
+        slots[1].release(other.result(timeout=1))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,162 @@
+from app.database.db import make_engine,make_async_engine,session_scope
+from app.database.orm import Dataset,ModelML
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app import jobs
+from app.config import Config
+from app.database.schemas import DatasetRequestSchema
+from app.routes.dataset import create_datasets
+from fastapi import HTTPException
+from alembic import command
+from alembic.config import Config as AlembicConfig
+from alembic.migration import MigrationContext
+from alembic.autogenerate import compare_metadata
+from app.database.schemas import StatusProcess,TaskType
+from sqlmodel import SQLModel,select
+from concurrent.futures import ThreadPoolExecutor
+import unittest,tempfile,pathlib,time,asyncio
+
+
+class TestConcurrency(unittest.TestCase):
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.engine = make_engine(f"sqlite:///{pathlib.Path(self.tmp.name)/'data.db'}",pool_size=16,max_overflow=16,busy_timeout=30)
+    SQLModel.metadata.create_all(self.engine)
+    with session_scope(write=True,bind=self.engine) as db:
+      for i in range(8):
+        db.add(Dataset(name=f"Regression-{i}",description="",task_type=TaskType.Regression,features=["1"],target="2",
+                       start_date="20250901",end_date="20250930",time_start="00:00:00",time_end="23:59:00",interval=1))
+
+  def tearDown(self) -> None:
+    self.engine.dispose()
+    self.tmp.cleanup()
+
+  def test_pragmas(self):
+    with self.engine.connect() as conn:
+      self.assertEqual(conn.exec_driver_sql("PRAGMA journal_mode").scalar(),"wal")
+      self.assertEqual(conn.exec_driver_sql("PRAGMA synchronous").scalar(),1)
+      self.assertEqual(conn.exec_driver_sql("PRAGMA busy_timeout").scalar(),30_000)
+
+  def test_concurrent_readers_and_writers(self):
+    deadline = time.monotonic() + 2.0
+    def writer(i):
+      # a pull worker: one short read-then-write transaction per status transition
+      n,statuses = 0,(StatusProcess.RUNNING_PULL,StatusProcess.SUCCESS_PULL)
+      while time.monotonic() < deadline:
+        with session_scope(write=True,bind=self.engine) as db:
+          dataset = Dataset.get_by_name(f"Regression-{i % 8}",db)
+          dataset.status = statuses[n % 2]
+          dataset.interval = n % 60 + 1
+        n += 1
+      return n
+    def reader(_):
+      n = 0
+      while time.monotonic() < deadline:
+        with session_scope(bind=self.engine) as db:
+          self.assertEqual(len(db.exec(select(Dataset)).all()),8)
+          Dataset.page(db,limit=5)
+        n += 1
+      return n
+    with ThreadPoolExecutor(max_workers=24) as pool:
+      writes = [pool.submit(writer,i) for i in range(8)]
+      reads = [pool.submit(reader,i) for i in range(16)]
+      writes,reads = [f.result() for f in writes],[f.result() for f in reads]
+    self.assertTrue(all(writes) and all(reads))
+    with session_scope(bind=self.engine) as db:
+      self.assertTrue(all(d.status in (StatusProcess.RUNNING_PULL,StatusProcess.SUCCESS_PULL) for d in db.exec(select(Dataset)).all()))
+
+
+class TestAsync(unittest.TestCase):
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.url = f"sqlite:///{pathlib.Path(self.tmp.name)/'data.db'}"
+    self.engine = make_engine(self.url)
+    SQLModel.metadata.create_all(self.engine)
+    with session_scope(write=True,bind=self.engine) as db:
+      for i,tt in enumerate((TaskType.Regression,TaskType.Classification,TaskType.Regression)):
+        d = Dataset(name=f"{tt.name}-{i}",description="",task_type=tt,features=["1"],target="2",
+                    start_date="20250901",end_date="20250930",time_start="00:00:00",time_end="23:59:00",interval=1)
+        d.models = [ModelML(name=f"m{i}",algorithm="rf",evaluation={},path="",status=StatusProcess.SUCCESS_TRAIN)]
+        db.add(d)
+
+  def tearDown(self) -> None:
+    self.engine.dispose()
+    self.tmp.cleanup()
+
+  def run_async(self,fn):
+    async def main():
+      engine = make_async_engine(self.url)
+      try:
+        async with AsyncSession(engine,expire_on_commit=False) as db: return await fn(db)
+      finally: await engine.dispose()
+    return asyncio.run(main())
+
+  def test_queries(self):
+    async def fn(db):
+      d = await Dataset.aget_by_name("Regression-0",db)
+      self.assertEqual(d.to_response().models[0]["name"],"m0")
+      self.assertIsNone(await Dataset.aget_by_name("missing",db))
+      self.assertEqual((await Dataset.aget_by_name("Regression-2",db,Dataset.id)),3)
+      self.assertEqual(len(await Dataset.aget_by_task_type("Regression",db)),2)
+      self.assertEqual(len(await Dataset.aget_all(db)),3)
+      self.assertEqual((await Dataset.ato_responses([d],db))["recordsTotal"],3)
+      self.assertEqual((await ModelML.aget_by_name("m1",db)).to_response().dataset_name,"Classification-1")
+      page = await Dataset.apage(db,limit=2,sort="name")
+      self.assertEqual([r.names for r in page["data"]],["Classification-1","Regression-0"])
+      page = await Dataset.apage(db,after=page["next"],limit=2,sort="name")
+      self.assertEqual([r.names for r in page["data"]],["Regression-2"])
+      self.assertIsNone(page["next"])
+    self.run_async(fn)
+
+  def test_save_and_enqueue(self):
+    async def fn(db):
+      d = await Dataset(name="Regression-3",description="",task_type="Regression",features=["1"],target="2",start_date="20250901",
+                        end_date="20250930",time_start="00:00:00",time_end="23:59:00",interval=1).asave(db)
+      self.assertEqual(d.to_response().models,[])
+      job = await jobs.aenqueue(db,"pull",d,priority=2)
+      return job.id
+    job_id = self.run_async(fn)
+    with session_scope(bind=self.engine) as db:
+      self.assertEqual(Dataset.get_by_name("Regression-3",db).status,StatusProcess.QUEUED)
+      self.assertEqual(db.get(jobs.Job,job_id).priority,2)
+
+  def test_create_datasets(self):
+    payload = dict(task_type="Regression",features=["216998630","216998631"],target="216998632",start_date="20250901",end_date="20250902")
+    payloads = [DatasetRequestSchema(**payload) for _ in range(20)]
+    bad = [*payloads[:2],DatasetRequestSchema(**{**payload,"task_type":"Regresion"}),DatasetRequestSchema(**{**payload,"features":[]})]
+    async def fn(db):
+      with self.assertRaises(HTTPException) as e: await create_datasets(bad,db)
+      self.assertEqual([err["index"] for err in e.exception.detail],[2,3])
+      return [d.to_response() for d in await create_datasets(payloads,db,priority=3)]
+    dir = Config.dir
+    Config.dir = pathlib.Path(self.tmp.name)
+    try: created = self.run_async(fn)
+    finally: Config.dir = dir
+    self.assertEqual(len({d.names for d in created}),20)
+    self.assertTrue(all((pathlib.Path(self.tmp.name)/"storages"/d.names/"logs").is_dir() for d in created))
+    with session_scope(bind=self.engine) as db:
+      self.assertEqual(len(db.exec(select(Dataset).where(Dataset.status == StatusProcess.QUEUED)).all()),20)
+      queued = db.exec(select(jobs.Job)).all()
+      self.assertEqual(sorted(j.dataset_name for j in queued),sorted(d.names for d in created))
+      self.assertTrue(all(j.priority == 3 and j.kind == "pull" for j in queued))
+
+
+class TestMigrations(unittest.TestCase):
+  def test_upgrade_matches_models(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      url = f"sqlite:///{pathlib.Path(tmp)/'data.db'}"
+      engine = make_engine(url)
+      SQLModel.metadata.create_all(engine)
+      with engine.begin() as conn:
+        # a database created before the indexes existed
+        for name in ("ix_dataset_task_type_status","ix_dataset_status","ix_modelml_dataset_id_is_active","ix_modelml_status"):
+          conn.exec_driver_sql(f"DROP INDEX {name}")
+        for name in ("owner","heartbeat_at"): conn.exec_driver_sql(f"ALTER TABLE job DROP COLUMN {name}")
+      config = AlembicConfig(str(pathlib.Path(__file__).parents[1]/"alembic.ini"))
+      config.set_main_option("sqlalchemy.url",url)
+      command.upgrade(config,"head")
+      with engine.connect() as conn: self.assertEqual(compare_metadata(MigrationContext.configure(conn),SQLModel.metadata),[])
+      engine.dispose()
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,161 @@
+from app.database.orm import Job,Dataset
+from app.database.schemas import StatusProcess,TaskType
+from app.database import db as database
+from app import jobs
+from app.config import Config
+from app.database.db import make_engine,make_async_engine
+from app.routes.dataset import check_resume_dataset
+from fastapi import HTTPException
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import SQLModel,Session,create_engine
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import unittest,tempfile,pathlib,time,threading,asyncio
+
+
+class TestJobs(unittest.TestCase):
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.engine = create_engine(f"sqlite:///{pathlib.Path(self.tmp.name)/'jobs.db'}")
+    SQLModel.metadata.create_all(self.engine)
+    self.patch = mock.patch.object(database,"engine",self.engine)
+    self.patch.start()
+    with Session(self.engine) as db:
+      for name in ["a","b","c"]:
+        db.add(Dataset(name=name,task_type=TaskType.Regression,features=["1"],target="2",start_date="20250901",
+                       end_date="20250901",time_start="00:00:00",time_end="23:59:00",interval=0,top_model=None))
+      db.commit()
+
+  def tearDown(self) -> None:
+    self.patch.stop()
+    self.engine.dispose()
+    self.tmp.cleanup()
+
+  def enqueue(self,name,priority=0,**params):
+    with Session(self.engine) as db:
+      with mock.patch.object(jobs.DISPATCHER,"wake"):
+        return jobs.enqueue(db,"pull",Dataset.get_by_name(name,db),priority=priority,**params).id
+
+  def test_claim_by_priority(self):
+    a,b,c = self.enqueue("a"),self.enqueue("b",priority=5),self.enqueue("c")
+    with Session(self.engine) as db:
+      self.assertEqual(Dataset.get_by_name("a",db).status,StatusProcess.QUEUED)
+      self.assertEqual([Job.claim_next(db).id for _ in range(3)],[b,a,c])
+      self.assertIsNone(Job.claim_next(db))
+      self.assertEqual(Job.get_by_id(a,db).status,StatusProcess.RUNNING_PULL)
+
+  def test_cancel_queued(self):
+    a = self.enqueue("a")
+    with Session(self.engine) as db:
+      self.assertEqual(jobs.cancel(db,a).status,StatusProcess.CANCELLED)
+      self.assertEqual(Dataset.get_by_name("a",db).status,StatusProcess.CANCELLED)
+      self.assertIsNone(Job.claim_next(db))
+
+  def test_dispatch_and_progress(self):
+    calls = []
+    def runner(dataset_name,progress,**params):
+      calls.append((dataset_name,params))
+      progress(0.5)
+    ids = [self.enqueue("a",resume=True),self.enqueue("b")]
+    dispatcher = jobs.JobDispatcher(workers=2,poll=0.05,executor=ThreadPoolExecutor(2))
+    with mock.patch.object(jobs,"_runner",return_value=runner):
+      dispatcher.start()
+      deadline = time.time() + 5
+      while time.time() < deadline:
+        with Session(self.engine) as db:
+          if all(Job.get_by_id(i,db).status == StatusProcess.SUCCESS_PULL for i in ids): break
+        time.sleep(0.05)
+      dispatcher.stop(wait=True)
+    self.assertEqual(sorted(calls),[("a",{"resume":True}),("b",{})])
+    with Session(self.engine) as db:
+      for i in ids:
+        job = Job.get_by_id(i,db)
+        self.assertEqual((job.status,job.progress),(StatusProcess.SUCCESS_PULL,1.0))
+
+  def test_concurrent_dispatchers(self):
+    # the engine the app uses (WAL, BEGIN IMMEDIATE for writes): claims must wait for the lock, not fail
+    engine = make_engine(f"sqlite:///{pathlib.Path(self.tmp.name)/'jobs.db'}")
+    ids = [self.enqueue(name) for name in ["a","b","c"] * 8]
+    dispatchers = [jobs.JobDispatcher(workers=len(ids),executor=ThreadPoolExecutor(2)) for _ in range(4)]
+    barrier = threading.Barrier(len(dispatchers))
+    def dispatch(dispatcher):
+      dispatcher.owner = f"host:{id(dispatcher)}"
+      barrier.wait()
+      return dispatcher.dispatch()
+    with mock.patch.object(database,"engine",engine),mock.patch.object(jobs,"_runner",return_value=lambda *a,**k: None):
+      try:
+        with ThreadPoolExecutor(len(dispatchers)) as pool: submitted = list(pool.map(dispatch,dispatchers))
+      finally:
+        for dispatcher in dispatchers: dispatcher.executor.shutdown(wait=True)
+    engine.dispose()
+    self.assertEqual(sum(submitted),len(ids))
+
+  def test_cancel_running(self):
+    started,release = threading.Event(),threading.Event()
+    def runner(dataset_name,progress,**params):
+      started.set()
+      release.wait(5)
+      progress(1.0)
+    a = self.enqueue("a")
+    with Session(self.engine) as db: Job.claim_next(db)
+    with mock.patch.object(jobs,"_runner",return_value=runner):
+      worker = threading.Thread(target=jobs.run_job,args=(a,))
+      worker.start()
+      started.wait(5)
+      with Session(self.engine) as db: jobs.cancel(db,a)
+      release.set()
+      worker.join(5)
+    with Session(self.engine) as db: self.assertEqual(Job.get_by_id(a,db).status,StatusProcess.CANCELLED)
+
+  def test_requeue_running(self):
+    a = self.enqueue("a")
+    with Session(self.engine) as db:
+      Job.claim_next(db,"host:1")
+      self.assertEqual(Job.requeue_running(db),0)
+      Job.heartbeat([a],"host:1",db)
+      self.assertEqual(Job.requeue_running(db,lease=0),1)
+      job = Job.claim_next(db)
+      self.assertEqual((job.id,job.params),(a,{"resume":True}))
+
+  def test_warn_unserved(self):
+    self.assertEqual(jobs.warn_unserved(),0)
+    self.enqueue("a")
+    with self.assertLogs("jobs","WARNING"): self.assertEqual(jobs.warn_unserved(),1)
+
+  def test_resume_without_live_job(self):
+    a = self.enqueue("a")
+    self.assertTrue(self.live("a"))
+    with Session(self.engine) as db:
+      Job.claim_next(db,"host:1")
+      dataset = Dataset.get_by_name("a",db)
+      dataset.status = StatusProcess.RUNNING_PULL
+      db.commit()
+      db.refresh(dataset)
+    self.assertTrue(self.live("a"))
+    with self.assertRaises(HTTPException): check_resume_dataset(dataset,live=True)
+    with mock.patch.object(Config,"job_lease",0):
+      self.assertFalse(self.live("a"))
+      check_resume_dataset(dataset,live=False)
+      self.abandon("a")
+    with Session(self.engine) as db:
+      self.assertEqual(Job.get_by_id(a,db).status,StatusProcess.ERROR_PULL)
+      self.assertEqual(Job.requeue_running(db,lease=0),0)
+
+  def run_async(self,method,name):
+    async def main():
+      engine = make_async_engine(f"sqlite:///{pathlib.Path(self.tmp.name)/'jobs.db'}")
+      try:
+        async with AsyncSession(engine) as db:
+          result = await method(name,db)
+          await db.commit()
+          return result
+      finally: await engine.dispose()
+    return asyncio.run(main())
+
+  def live(self,name) -> bool: return self.run_async(Job.ahas_live,name)
+
+  def abandon(self,name): return self.run_async(Job.aabandon_expired,name)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,43 @@
+from app.manifest import PullManifest
+import unittest,tempfile,pathlib
+
+
+class TestPullManifest(unittest.TestCase):
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.path = pathlib.Path(self.tmp.name)/"pull_manifest.json"
+    self.params = dict(columns=["1","2"],start_date="20250901",end_date="20250902")
+    self.units = [(c,d) for c in ["1","2"] for d in ["20250901","20250902"]]
+
+  def tearDown(self) -> None: self.tmp.cleanup()
+
+  def test_resume(self):
+    manifest = PullManifest(self.path)
+    self.assertFalse(manifest.start(self.params))
+    manifest.mark_done("1","20250901",10)
+    manifest.mark_failed("2","20250902","timeout")
+    manifest.save(force=True)
+
+    manifest = PullManifest(self.path)
+    self.assertTrue(manifest.start(self.params,resume=True))
+    self.assertEqual(len(manifest.pending(self.units)),3)
+    self.assertEqual(manifest.failed,{"2":{"20250902":"timeout"}})
+    manifest.mark_done("2","20250902",0)
+    self.assertEqual(manifest.failed,{"2":{}})
+    self.assertEqual(manifest.rows("1"),10)
+
+  def test_reset(self):
+    manifest = PullManifest(self.path)
+    manifest.start(self.params)
+    manifest.mark_done("1","20250901",10)
+    self.assertFalse(PullManifest(self.path).start(dict(self.params,end_date="20250903"),resume=True))
+    manifest = PullManifest(self.path)
+    manifest.start(self.params)
+    manifest.mark_done("1","20250901",10)
+    manifest.finish()
+    self.assertFalse(PullManifest(self.path).start(self.params,resume=True))
+    self.assertFalse(PullManifest(self.path).start(self.params,resume=False))
+
+
+if __name__ == "__main__":
+  unittest.main()
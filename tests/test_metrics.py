@@ -0,0 +1,62 @@
+from fastapi import FastAPI,APIRouter,HTTPException
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from app.metrics import TimedRoute,endpoint_of,render,prune
+from app.client import HistorianClient
+from app.config import Config
+from tests.fake_historian import FakeHistorian
+import unittest,tempfile,pathlib,subprocess,sys,os,uuid
+
+
+def sample(name:str,**labels) -> float: return REGISTRY.get_sample_value(name,labels) or 0.0
+
+
+class TestMetrics(unittest.TestCase):
+  def test_endpoint_of(self):
+    self.assertEqual(endpoint_of(f"{Config.url}/tags/get-history"),"get-history")
+    self.assertEqual(endpoint_of(f"{Config.url}/data_point"),"data_point")
+
+  def test_historian_metrics(self):
+    client = HistorianClient(rate=1000,burst=100,max_inflight=4,threshold=5,reset_timeout=1,max_backoff=0.01)
+    before = sample("historian_request_seconds_count",endpoint="data_point")
+    with FakeHistorian() as fake:
+      self.assertEqual(client.post(f"{fake.url}/data_point",data=dict(point_id="a")).status_code,200)
+      fake.error_rate = 1.0
+      self.assertEqual(client.post(f"{fake.url}/data_point",data=dict(point_id="a")).status_code,500)
+    self.assertEqual(sample("historian_request_seconds_count",endpoint="data_point") - before,2)
+    self.assertGreater(sample("historian_response_bytes_sum",endpoint="data_point"),0)
+    self.assertGreaterEqual(sample("historian_requests_total",endpoint="data_point",outcome="500"),1)
+
+  def test_route_latency(self):
+    router = APIRouter(route_class=TimedRoute)
+    @router.get("/items/{item}")
+    async def get_item(item:str):
+      if item == "missing": raise HTTPException(status_code=404)
+      return {"item":item}
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    client.get("/items/a")
+    client.get("/items/missing")
+    self.assertEqual(sample("http_request_seconds_count",method="GET",route="/items/{item}",status="200"),1)
+    self.assertEqual(sample("http_request_seconds_count",method="GET",route="/items/{item}",status="404"),1)
+    self.assertIn(b"http_request_seconds_bucket",render().body)
+
+  def test_worker_metrics(self):
+    # a job worker is a separate process: its values reach `render` through the shared directory
+    endpoint = f"worker-{uuid.uuid4().hex[:8]}"
+    code = f"from app.metrics import HISTORIAN_RETRIES; HISTORIAN_RETRIES.labels('{endpoint}').inc(3)"
+    subprocess.run([sys.executable,"-c",code],check=True,cwd=Config.dir)
+    self.assertIn(f'historian_retries_total{{endpoint="{endpoint}"}} 3.0'.encode(),render().body)
+
+  def test_prune(self):
+    dead = subprocess.Popen([sys.executable,"-c","pass"])
+    dead.wait()
+    with tempfile.TemporaryDirectory() as tmp:
+      for name in (f"counter_{dead.pid}.db",f"gauge_mostrecent_{dead.pid}.db",f"counter_{os.getpid()}.db"): (pathlib.Path(tmp)/name).touch()
+      self.assertEqual(prune(tmp),2)
+      self.assertEqual([f.name for f in pathlib.Path(tmp).iterdir()],[f"counter_{os.getpid()}.db"])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -2,7 +2,10 @@ from scipy.stats import f
 from app.database.orm import Dataset,ModelML
 from app.database.schemas import StatusProcess,TaskType
 from app.database.db import get_session
-import unittest,json,uuid,requests as req,json
+from sqlmodel import SQLModel,Session,create_engine,select,func
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+import unittest,json,uuid,requests as req,json,sqlalchemy as sa
 
 
 def create_clustering():
@@ -45,6 +48,84 @@ class TestDatasetDummy(unittest.TestCase):
         print(f"Dataset ERROR : {res.text}!")
 
 
+def make_dataset(i:int,task_type:TaskType = TaskType.Classification,status:StatusProcess = StatusProcess.SUCCESS_PULL) -> Dataset:
+  return Dataset(name=f"{task_type}-{i:04d}",description=f"AHU {i % 3}",task_type=task_type,status=status,
+                 features=["216998630"],target="216998631",start_date=f"202509{1 + i % 28:02d}",end_date="20250930",
+                 time_start="00:00:00",time_end="23:59:00",interval=1,is_valid=True)
+
+
+class TestDatasetPage(unittest.TestCase):
+  def setUp(self) -> None:
+    self.engine = create_engine("sqlite://",connect_args={"check_same_thread":False},poolclass=StaticPool)
+    SQLModel.metadata.create_all(self.engine)
+    self.db = Session(self.engine)
+    for i in range(30):
+      d = make_dataset(i,TaskType.Regression if i % 2 else TaskType.Classification,
+                       StatusProcess.ERROR_PULL if i % 5 == 0 else StatusProcess.SUCCESS_PULL)
+      d.models = [ModelML(name=f"m{i}-{j}",algorithm="rf",evaluation={},path="",status=StatusProcess.SUCCESS_TRAIN) for j in range(3)]
+      self.db.add(d)
+    self.db.commit()
+    self.db.expunge_all()
+    self.queries = 0
+    event.listen(self.engine,"before_cursor_execute",self.count)
+
+  def tearDown(self) -> None:
+    self.db.close()
+    self.engine.dispose()
+
+  def count(self,*_): self.queries += 1
+
+  def test_keyset_pages(self):
+    seen,after = [],None
+    while True:
+      page = Dataset.page(self.db,after=after,limit=7)
+      seen += [d.names for d in page["data"]]
+      after = page["next"]
+      if not after: break
+    self.assertEqual(len(seen),30)
+    self.assertEqual(len(set(seen)),30)
+    self.assertEqual(page["recordsTotal"],30)
+    names = [d.names for d in Dataset.page(self.db,limit=30,sort="start_date",desc=True)["data"]]
+    first = Dataset.page(self.db,limit=10,sort="start_date",desc=True)
+    self.assertEqual([d.names for d in Dataset.page(self.db,after=first["next"],limit=20,sort="start_date",desc=True)["data"]],names[10:])
+
+  def test_filters(self):
+    page = Dataset.page(self.db,limit=50,status=StatusProcess.ERROR_PULL,task_type=TaskType.Classification)
+    self.assertEqual(page["recordsFiltered"],3)
+    self.assertEqual(page["recordsTotal"],30)
+    self.assertEqual(Dataset.page(self.db,search="ahu 1")["recordsFiltered"],10)
+    self.assertEqual(Dataset.page(self.db,date_to="20250905")["recordsFiltered"],sum(1 + i % 28 <= 5 for i in range(30)))
+    with self.assertRaises(ValueError): Dataset.page(self.db,after="not-a-cursor")
+
+  def test_constant_queries(self):
+    page = Dataset.page(self.db,limit=25)
+    self.assertEqual(self.queries,3)
+    self.assertEqual(len(page["data"][0].models),3)
+    self.assertEqual(page["data"][0].models[0]["description"],"Random Forest Classifier")
+
+  def test_task_type_family(self):
+    self.assertEqual(TaskType.family("Classification"),[TaskType.Classification,TaskType.ClassificationDummy])
+    self.assertEqual(TaskType.family("RegressionDummy"),[TaskType.RegressionDummy])
+    self.assertEqual(len(TaskType.family("Dummy")),5)
+    with self.assertRaises(KeyError): TaskType.family("Class")
+    self.db.add(make_dataset(30,TaskType.ClassificationDummy,StatusProcess.SUCCESS_PULL))
+    self.db.commit()
+    self.assertEqual(len(Dataset.get_by_task_type("Classification",self.db)),16)
+    self.assertEqual(len(Dataset.get_by_task_type("ClassificationDummy",self.db)),1)
+    self.assertEqual(len(Dataset.get_by_task_type("Dummy",self.db)),1)
+    query = Dataset._stmt(Dataset.id).where(Dataset.task_type.in_(TaskType.family("Regression")))
+    with self.engine.connect() as conn:
+      plan = " ".join(str(row[-1]) for row in conn.execute(sa.text(f"EXPLAIN QUERY PLAN {query.compile(compile_kwargs={'literal_binds':True})}")))
+    self.assertIn("USING COVERING INDEX ix_dataset_task_type_status",plan)
+
+  def test_delete_by_task_type(self):
+    names = Dataset.delete_by_task_type("Regression",self.db)
+    self.assertEqual(len(names),15)
+    self.assertEqual(self.db.exec(select(func.count(Dataset.id))).one(),15)
+    self.assertEqual(self.db.exec(select(func.count(ModelML.id))).one(),45)
+    self.assertEqual(Dataset.delete_by_task_type("Regression",self.db),[])
+
+
 if __name__ == "__main__":
   unittest.main()
 
@@ -0,0 +1,56 @@
+from app.storage import DatasetStore
+from app.config import Config
+from app import projection
+from unittest import mock
+import unittest,tempfile,pathlib,numpy as np,pandas as pd
+
+
+def make_frame(periods:int,seed:int = 4) -> pd.DataFrame:
+  rng = np.random.default_rng(seed)
+  base = rng.normal(size=periods)
+  dt = pd.date_range("2025-09-10",periods=periods,freq="min",tz=Config.utc)
+  return pd.DataFrame({"1":base,"2":base * 2 + rng.normal(scale=0.1,size=periods),"3":rng.normal(size=periods),"dt":dt})
+
+
+class TestProjection(unittest.TestCase):
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.store = DatasetStore(pathlib.Path(self.tmp.name))
+    self.store.write(make_frame(2000))
+    projection._MEMO.clear()
+
+  def tearDown(self) -> None: self.tmp.cleanup()
+
+  def test_full_and_incremental(self):
+    full = projection.projection(self.store,["1","2","3"],2)
+    self.assertEqual(full["points"].shape,(2000,2))
+    self.assertEqual(full["points"].dtype,np.float32)
+    self.assertGreater(full["ratio"][0],0.6)
+    projection._MEMO.clear()
+    for path in (self.store.root/"pca").glob("*.npz"): path.unlink()
+    with mock.patch.object(projection,"FULL_FIT_ROWS",100),mock.patch.object(projection,"CHUNK_ROWS",301):
+      incremental = projection.projection(self.store,["1","2","3"],2)
+    np.testing.assert_allclose(incremental["ratio"],full["ratio"],atol=1e-6)
+    np.testing.assert_allclose(np.abs(incremental["points"]),np.abs(full["points"]),atol=1e-3)
+
+  def test_cached_per_version(self):
+    first = projection.projection(self.store,["1","2"],2)
+    self.assertEqual(len(list((self.store.root/"pca").glob("*.npz"))),1)
+    self.assertTrue(np.isnan(first["ratio"]).all())
+    self.assertIs(projection.projection(self.store,["1","2"],2),first)
+    projection._MEMO.clear()
+    np.testing.assert_array_equal(projection.projection(self.store,["1","2"],2)["points"],first["points"])
+    self.store.append(make_frame(100,seed=5).assign(dt=lambda d: d["dt"] + pd.Timedelta(days=5)))
+    self.assertEqual(len(projection.projection(self.store,["1","2"],2)["points"]),2100)
+    self.assertEqual(len(list((self.store.root/"pca").glob("*.npz"))),1)
+
+  def test_downsample(self):
+    np.testing.assert_array_equal(projection.downsample(10,20),np.arange(10))
+    idx = projection.downsample(10_000,500)
+    self.assertEqual(len(idx),500)
+    self.assertTrue((np.diff(idx) > 0).all())
+    np.testing.assert_array_equal(idx,projection.downsample(10_000,500))
+
+
+if __name__ == "__main__":
+  unittest.main()
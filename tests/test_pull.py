@@ -1,22 +1,342 @@
-from app.pull import get_history,get_realtime
-import unittest 
+from app.pull import get_history,get_realtime,get_realtime_bulk,decode_history,pull_real_data,pull_to_disk,pulling,extending,DatasetDeleted,PeakRSS,fetch_tag_day
+from app.config import Config
+from app.client import CLIENT,TokenBucket
+from app.storage import DatasetStore
+from app.tagstore import TagStore
+from app.manifest import PullManifest
+from tests.fake_historian import FakeHistorian
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from app.database.orm import Dataset
+from app.database.schemas import StatusProcess,TaskType
+from app.database import db as database
+from app.routes.dataset import check_extend_dataset
+from app import logger as app_logger
+from sqlmodel import SQLModel,Session,create_engine
+from unittest import mock
+from fastapi import HTTPException
+import unittest,tempfile,pathlib,time,numpy as np,pandas as pd
 
 
 class TestPull(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls) -> None:
+    cls.fake = FakeHistorian().start()
+    cls.url,Config.url = Config.url,cls.fake.url
+
+  @classmethod
+  def tearDownClass(cls) -> None:
+    cls.fake.stop()
+    Config.url = cls.url
+
   def setUp(self) -> None:
-    self.payload_history = dict(
-      row_id = "216998630",
-      current_date = "20250910",
-    )
-    self.payload_realtime = dict(
-      point_id = "5b0fe6d50488fbaa219972e272f1c14e",
-    )
+    self.fake.error_rate = self.fake.timeout_rate = self.fake.empty_rate = 0.0
+    CLIENT.breaker.record_success()
+
   def test_get_history(self):
     data = get_history(row_id="216998630",current_date="20250910",to_dataframe=True)
-    print(data)
+    self.assertEqual(len(data),1440)
+    self.assertEqual(str(data.index.dtype),"datetime64[ns, UTC+07:00]")
+    self.assertEqual(data.index[0].date(),datetime(2025,9,10).date())
+    self.assertTrue(data.equals(get_history(row_id="216998630",current_date="20250910",to_dataframe=True)))
+    dt,values = get_history(row_id="216998630",current_date="20250910",time_start="08:00:00",time_end="08:59:00")
+    self.assertEqual(len(dt),60)
 
+  def test_get_history_failures(self):
+    self.fake.error_rate = 1.0
+    with self.assertRaises(ValueError): get_history(row_id="216998630",current_date="20250910")
+    self.fake.error_rate,self.fake.timeout_rate,self.fake.stall = 0.0,1.0,0.5
+    failures = CLIENT.stats()["failures"]
+    with self.assertRaises(ValueError): get_history(row_id="216998630",current_date="20250910",max_retries=2,retry_delay=0.01,timeout=0.1)
+    self.assertEqual(CLIENT.stats()["failures"] - failures,2)
+    self.fake.timeout_rate,self.fake.empty_rate = 0.0,1.0
+    self.assertTrue(get_history(row_id="216998630",current_date="20250910",to_dataframe=True).empty)
 
-if __name__ == "__main__":
-  unittest.main()
+  def test_get_realtime(self):
+    value = get_realtime(point_id="5b0fe6d50488fbaa219972e272f1c14e")
+    self.assertIsInstance(value,float)
+    self.assertTrue(20 <= value < 31)
+
+  def test_get_realtime_deadline(self):
+    self.fake.timeout_rate,self.fake.stall = 1.0,2.0
+    t0 = time.perf_counter()
+    with self.assertRaises(ValueError): get_realtime("p",max_retries=5,retry_delay=0.01,timeout=5,deadline=t0 + 0.3)
+    self.assertLess(time.perf_counter() - t0,1.0)
+
+  def test_get_realtime_bulk_throttled(self):
+    # one token per second: the first point gets it, the others time out waiting instead of outliving the deadline
+    with mock.patch.object(CLIENT,"bucket",TokenBucket(rate=1,burst=1)):
+      snapshot = get_realtime_bulk(["p0","p1","p2"],deadline=0.3,max_retries=3)
+    self.assertEqual(sum(v is not None for v in snapshot["values"]),1)
+    self.assertEqual(len(snapshot["errors"]),2)
+    self.assertTrue(all("Timed out" in e for e in snapshot["errors"].values()))
+    self.assertLess(snapshot["elapsed_ms"],1000)
+
+  def test_get_realtime_bulk_partial(self):
+    self.fake.error_rate = 0.5
+    points = [f"p{i}" for i in range(20)]
+    snapshot = get_realtime_bulk(points,deadline=5,max_retries=1)
+    values = dict(zip(snapshot["points"],snapshot["values"]))
+    self.assertEqual(snapshot["points"],points)
+    self.assertTrue(snapshot["errors"] and len(snapshot["errors"]) < len(points))
+    self.assertEqual({p for p,v in values.items() if v is None},set(snapshot["errors"]))
+
+  def test_get_realtime_bulk_deadline(self):
+    self.fake.timeout_rate,self.fake.stall = 1.0,2.0
+    snapshot = get_realtime_bulk(["p0","p1"],deadline=0.3,max_retries=3)
+    self.assertEqual(snapshot["values"],[None,None])
+    self.assertEqual(set(snapshot["errors"]),{"p0","p1"})
+    self.assertLess(snapshot["elapsed_ms"],1000)
+
+  def test_pull_real_data(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      df = pull_real_data(["216998630","216998631"],"20250910","20250911","00:00:00","23:59:00",step=300,tags=TagStore(tmp))
+      self.assertEqual(TagStore(tmp).days("216998631"),["20250910","20250911"])
+    self.assertEqual(len(df),2 * 288)
+    self.assertEqual(list(df.columns),["216998630","216998631","dt"])
+    self.assertFalse(df[["216998630","216998631"]].iloc[1:].isna().any().any())
+
+  def test_pull_to_disk(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      stats = pull_to_disk(["216998630","216998631"],"20250910","20250911","00:00:00","23:59:00",tmp,step=300,
+                           tags=TagStore(pathlib.Path(tmp)/"tags"))
+      store = DatasetStore(tmp)
+      self.assertEqual(stats["n_rows"],2 * 288)
+      self.assertEqual(store.format,"parquet")
+      self.assertEqual(store.columns(),["216998630","216998631","dt"])
+      self.assertEqual(len(store.read(columns=["216998631"],start="2025-09-11 00:00")),288)
+      self.assertTrue(store.profile.exists())
+      self.assertFalse(stats["is_outlier"])
+
+  def test_pull_to_disk_missing_values(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      tags = TagStore(pathlib.Path(tmp)/"tags")
+      tags.put("216998631","20250910",pd.DataFrame())
+      stats = pull_to_disk(["216998630","216998631"],"20250910","20250911","00:00:00","23:59:00",tmp,step=300,tags=tags)
+      df = DatasetStore(tmp).read()
+      # the day without data stays empty: ffill carries values forward only
+      self.assertTrue(df["216998631"].iloc[:288].isna().all())
+      self.assertEqual(stats["missing_values"],df.isna().sum().sum().item())
+
+  def test_peak_rss(self):
+    peak = PeakRSS()
+    before = peak.peak
+    data = np.ones(32 * 1024**2 // 8)
+    self.assertGreaterEqual(peak.sample(),before + data.nbytes // 2)
+    del data
+    self.assertGreaterEqual(peak.sample(),before)
+    self.assertTrue(str(peak).endswith(" MB"))
+
+  def test_pull_to_disk_shares_tags(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      tmp = pathlib.Path(tmp)
+      tags = TagStore(tmp/"tags")
+      pull_to_disk(["216998630","216998631"],"20250910","20250911","00:00:00","23:59:00",tmp/"a",step=300,tags=tags)
+      self.assertEqual(tags.days("216998630"),["20250910","20250911"])
+      self.assertEqual(tags.path("216998630","20250910").parent.name,"month=2025-09")
+      n = len(self.fake.requests)
+      stats = pull_to_disk(["216998631","216998632"],"20250911","20250911","08:00:00","08:59:00",tmp/"b",step=60,tags=tags)
+      self.assertEqual(len(self.fake.requests) - n,1)
+      self.assertEqual(stats["n_rows"],60)
+      df = DatasetStore(tmp/"b").read()
+      self.assertEqual(df["dt"].iloc[0].hour,8)
+      self.assertFalse(df[["216998631","216998632"]].iloc[1:].isna().any().any())
+
+  def test_fetch_today_once(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      tags = TagStore(tmp)
+      today = datetime.now(tz=Config.utc).strftime("%Y%m%d")
+      n = len(self.fake.requests)
+      with ThreadPoolExecutor(4) as pool: list(pool.map(lambda _: fetch_tag_day(tags,"216998630",today),range(4)))
+      self.assertEqual(len(self.fake.requests) - n,1)
+      with mock.patch.object(Config,"tag_refetch_after",0): fetch_tag_day(tags,"216998630",today)
+      self.assertEqual(len(self.fake.requests) - n,2)
+      self.assertEqual(list(pathlib.Path(tmp).rglob("*.lock")),[])
+
+  def test_concurrent_pulls_fetch_shared_tags_once(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      tmp = pathlib.Path(tmp)
+      tags = TagStore(tmp/"tags")
+      n = len(self.fake.requests)
+      columns = [["216998630","216998631","216998632"],["216998631","216998632","216998633"],["216998632","216998630"]]
+      with ThreadPoolExecutor(max_workers=3) as pool:
+        stats = list(pool.map(lambda i: pull_to_disk(columns[i],"20250910","20250911","00:00:00","23:59:00",tmp/str(i),step=300,tags=tags),range(3)))
+      self.assertEqual(len(self.fake.requests) - n,4 * 2)
+      self.assertTrue(all(s["n_rows"] == 576 for s in stats))
+
+  def test_decode_history(self):
+    body = b'[[1757437200000, 21.5], [1757437201000, null], [1757437202000, "22.25"]]'
+    df = decode_history(body,216998630)
+    self.assertEqual(str(df.index.dtype),"datetime64[ns, UTC+07:00]")
+    self.assertEqual(df.index[0].to_pydatetime(),datetime.fromtimestamp(1757437200,tz=Config.utc))
+    self.assertEqual(df[216998630].dtype,np.float64)
+    np.testing.assert_array_equal(df[216998630].to_numpy(),[21.5,np.nan,22.25])
+    self.assertEqual(decode_history(body,1,np.float32)[1].dtype,np.float32)
+    self.assertTrue(decode_history(b"[]",1).empty)
+
+
+class TestPulling(unittest.TestCase):
+  """`pulling`/`extending` against the fake historian, with the database and storages in a temporary directory."""
+  @classmethod
+  def setUpClass(cls) -> None:
+    cls.fake = FakeHistorian().start()
+    cls.url,Config.url = Config.url,cls.fake.url
+
+  @classmethod
+  def tearDownClass(cls) -> None:
+    cls.fake.stop()
+    Config.url = cls.url
 
+  def setUp(self) -> None:
+    self.fake.error_rate = self.fake.timeout_rate = self.fake.empty_rate = 0.0
+    CLIENT.breaker.record_success()
+    self.tmp = tempfile.TemporaryDirectory()
+    self.dir = pathlib.Path(self.tmp.name)
+    self.engine = create_engine(f"sqlite:///{self.dir/'data.db'}")
+    SQLModel.metadata.create_all(self.engine)
+    self.patches = [mock.patch.object(database,"engine",self.engine),mock.patch.object(Config,"dir",self.dir),
+                    mock.patch.object(app_logger,"DIR",self.dir)]
+    for p in self.patches: p.start()
+    self.add("a")
+
+  def tearDown(self) -> None:
+    for p in self.patches: p.stop()
+    self.engine.dispose()
+    self.tmp.cleanup()
+
+  def add(self,name:str,**fields):
+    with Session(self.engine) as db:
+      db.add(Dataset(**{**dict(name=name,description="",task_type=TaskType.Regression,features=["216998630"],target="216998631",
+                               start_date="20250910",end_date="20250911",time_start="00:00:00",time_end="23:59:00",interval=5,
+                               status=StatusProcess.QUEUED),**fields}))
+      db.commit()
+
+  def get(self,name:str):
+    with Session(self.engine) as db: return Dataset.get_by_name(name,db)
+
+  def test_pulling(self):
+    pulling("a")
+    dataset = self.get("a")
+    self.assertEqual(dataset.status,StatusProcess.SUCCESS_PULL)
+    self.assertTrue(dataset.is_valid)
+    self.assertEqual(dataset.meta["n_rows"],2 * 288)
+    stored = DatasetStore(self.dir/"storages"/"a").read()
+    self.assertEqual((dataset.meta["missing_values"],dataset.meta["missing_after_fill"]),(stored.isna().sum().sum().item(),True))
+
+  def test_pulling_keeps_concurrent_changes(self):
+    def progress(_):
+      with Session(self.engine) as db:
+        Dataset.get_by_name("a",db).description = "edited"
+        db.commit()
+    pulling("a",progress=progress)
+    dataset = self.get("a")
+    self.assertEqual((dataset.description,dataset.status),("edited",StatusProcess.SUCCESS_PULL))
+
+  def test_pulling_deleted_dataset(self):
+    def progress(_):
+      with Session(self.engine) as db:
+        dataset = Dataset.get_by_name("a",db)
+        if dataset:
+          db.delete(dataset)
+          db.commit()
+    with self.assertRaises(DatasetDeleted): pulling("a",progress=progress)
+    self.assertIsNone(self.get("a"))
+
+
+  def queue(self,name:str) -> str:
+    """Mark `name` QUEUED like `jobs.enqueue` and return its previous status."""
+    with Session(self.engine) as db:
+      dataset = Dataset.get_by_name(name,db)
+      status,dataset.status = dataset.status.name,StatusProcess.QUEUED
+      db.commit()
+    return status
+
+  def test_extending_failure_restores_status(self):
+    pulling("a")
+    self.fake.error_rate = 1.0
+    with self.assertRaises(Exception): extending("a","20250913",status=self.queue("a"))
+    with self.assertRaises(ValueError): extending("a","20250911",status=self.queue("a"))
+    dataset = self.get("a")
+    self.assertEqual((dataset.status,dataset.end_date),(StatusProcess.SUCCESS_PULL,"20250911"))
+    check_extend_dataset(dataset,"20250913")
 
+  def test_extending_rejects_today(self):
+    pulling("a")
+    today = datetime.now(tz=Config.utc).strftime("%Y%m%d")
+    with self.assertRaises(ValueError): extending("a",today,status=self.queue("a"))
+    dataset = self.get("a")
+    self.assertEqual((dataset.status,dataset.end_date),(StatusProcess.SUCCESS_PULL,"20250911"))
+    with self.assertRaises(HTTPException) as ctx: check_extend_dataset(dataset,today)
+    self.assertEqual(ctx.exception.status_code,422)
+
+  def assertSameAsPull(self,name:str):
+    """`name` holds the data and meta of a fresh pull of its whole range."""
+    dataset = self.get(name)
+    self.add("fresh",start_date=dataset.start_date,end_date=dataset.end_date)
+    pulling("fresh")
+    fresh = self.get("fresh")
+    keys = ("n_rows","missing_values","size_of")
+    self.assertEqual({k:dataset.meta[k] for k in keys},{k:fresh.meta[k] for k in keys})
+    pd.testing.assert_frame_equal(DatasetStore(self.dir/"storages"/name).read(),DatasetStore(self.dir/"storages"/"fresh").read())
+
+  def test_extending_appends(self):
+    pulling("a")
+    n = len(self.fake.requests)
+    extending("a","20250912",status=self.queue("a"))
+    dataset = self.get("a")
+    self.assertEqual((dataset.status,dataset.end_date,dataset.meta["n_rows"]),(StatusProcess.SUCCESS_PULL,"20250912",3 * 288))
+    self.assertEqual(len(self.fake.requests) - n,2)
+    self.assertEqual(len(DatasetStore(self.dir/"storages"/"a").parts()),2)
+    self.assertSameAsPull("a")
+
+  def test_extending_recounts_legacy_meta(self):
+    pulling("a")
+    with Session(self.engine) as db:
+      dataset = Dataset.get_by_name("a",db)
+      dataset.meta = {**dataset.meta,"missing_values":10**6,"missing_after_fill":None}
+      db.commit()
+    extending("a","20250912",status=self.queue("a"))
+    meta = self.get("a").meta
+    stored = DatasetStore(self.dir/"storages"/"a").read()
+    self.assertEqual((meta["missing_values"],meta["missing_after_fill"]),(stored.isna().sum().sum().item(),True))
+
+  def test_extending_fills_gaps(self):
+    pulling("a")
+    # a unit that failed during the pull: missing from the tag store while the stored rows are filled over it
+    TagStore(self.dir/"storages"/"tags").path("216998631","20250910").unlink()
+    n = len(self.fake.requests)
+    extending("a","20250912",status=self.queue("a"))
+    self.assertEqual(self.get("a").end_date,"20250912")
+    self.assertEqual(len(self.fake.requests) - n,3)
+    self.assertSameAsPull("a")
+
+  def test_extending_retries_units(self):
+    pulling("a")
+    calls,get = [],get_history
+    def flaky(row_id,*args,**kwargs):
+      calls.append(row_id)
+      if calls.count(row_id) == 1 and row_id == 216998631: raise ValueError("historian unavailable")
+      return get(row_id,*args,**kwargs)
+    with mock.patch("app.pull.get_history",flaky),mock.patch.object(Config,"pull_retry_delay",0):
+      extending("a","20250912",status=self.queue("a"))
+    self.assertEqual(self.get("a").end_date,"20250912")
+    self.assertEqual(calls.count(216998631),2)
+    self.assertSameAsPull("a")
+
+  def test_extending_fails_on_missing_units(self):
+    pulling("a")
+    get = get_history
+    def failing(row_id,*args,**kwargs):
+      if row_id == 216998631: raise ValueError("historian unavailable")
+      return get(row_id,*args,**kwargs)
+    with mock.patch("app.pull.get_history",failing),mock.patch.object(Config,"pull_retry_delay",0):
+      with self.assertRaises(ValueError): extending("a","20250912",status=self.queue("a"))
+    dataset = self.get("a")
+    self.assertEqual((dataset.status,dataset.end_date,dataset.meta["n_rows"]),(StatusProcess.SUCCESS_PULL,"20250911",2 * 288))
+    self.assertEqual(len(DatasetStore(self.dir/"storages"/"a").parts()),1)
+    manifest = PullManifest(self.dir/"storages"/"a"/"pull_manifest.json")
+    self.assertEqual(list(manifest.failed["216998631"]),["20250912"])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,74 @@
+from app.storage import DatasetStore
+from app.series import series,rollup_series,window_buckets,downsample_indices
+from app.tagstore import TagStore
+from app.config import Config
+import unittest,tempfile,pathlib,numpy as np,pandas as pd
+
+
+class TestSeries(unittest.TestCase):
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.store = DatasetStore(pathlib.Path(self.tmp.name))
+    n = 86_400
+    dt = pd.date_range("2025-09-10",periods=n,freq="s",tz=Config.utc)
+    wave = np.sin(np.linspace(0,20 * np.pi,n))
+    wave[50_000] = 10.0
+    self.df = pd.DataFrame({"1":wave,"2":np.linspace(0,1,n),"dt":dt})
+    self.df.loc[1000:1999,"2"] = np.nan
+    self.store.write(self.df)
+
+  def tearDown(self) -> None: self.tmp.cleanup()
+
+  def test_series(self):
+    out = series(self.store,["1","2"],n_out=500)
+    self.assertEqual(out["n_rows"],86_400)
+    s1 = out["series"]["1"]
+    self.assertLessEqual(len(s1["dt"]),500)
+    self.assertEqual(len(s1["dt"]),len(s1["values"]))
+    self.assertTrue((np.diff(s1["dt"]) > 0).all())
+    self.assertIn(10.0,s1["values"])
+    self.assertEqual(s1["dt"][0],self.df["dt"].iloc[0].value // 1_000_000)
+    self.assertIn(None,out["series"]["2"]["values"])
+
+  def test_time_range(self):
+    out = series(self.store,["1"],start="2025-09-10 12:00",end="2025-09-10 12:59:59",n_out=100)
+    self.assertEqual(out["n_rows"],3600)
+    dt = pd.to_datetime(out["series"]["1"]["dt"],unit="ms",utc=True).tz_convert(Config.utc)
+    self.assertTrue((dt.hour == 12).all())
+
+  def test_rollup_series(self):
+    tags = TagStore(pathlib.Path(self.tmp.name)/"tags")
+    day = self.df.set_index("dt")[["1"]]
+    tags.put("1","20250910",day)
+    start,end = pd.Timestamp("2025-09-10 00:00",tz=Config.utc),pd.Timestamp("2025-09-10 23:59:59",tz=Config.utc)
+    self.assertIsNone(rollup_series(tags,["1"],start,end,n_out=5000))
+    self.assertIsNone(rollup_series(tags,["1"],start,end + pd.Timedelta(days=1),n_out=100))
+    out = rollup_series(tags,["1"],start,end,n_out=50)
+    self.assertEqual(out["level"],"15min")
+    self.assertEqual(out["n_rows"],96)
+    s1 = out["series"]["1"]
+    self.assertLessEqual(len(s1["dt"]),50)
+    self.assertIn(10.0,s1["max"])
+    self.assertTrue(all(lo <= v <= hi for lo,v,hi in zip(s1["min"],s1["values"],s1["max"])))
+    window = rollup_series(tags,["1"],start,end,n_out=5,step=900,time_start="08:00:00",time_end="12:00:00")
+    self.assertEqual(window["level"],"1h")
+    self.assertEqual(window["n_rows"],5)
+
+  def test_rollup_level_from_window(self):
+    tags = TagStore(pathlib.Path(self.tmp.name)/"tags")
+    dates = pd.date_range("2025-09-01",periods=30,freq="D",tz=Config.utc)
+    for date in dates:
+      dt = pd.date_range(date,periods=1440,freq="min")
+      tags.put("1",date.strftime("%Y%m%d"),pd.DataFrame({"1":np.arange(1440.0)},index=dt.rename("dt")))
+    start,end = dates[0],dates[-1] + pd.Timedelta("23:59:59")
+    self.assertEqual(window_buckets(start,end,900,"08:00:00","12:00:00"),30 * 17)
+    out = rollup_series(tags,["1"],start,end,n_out=500,time_start="08:00:00",time_end="12:00:00")
+    self.assertEqual((out["level"],out["n_rows"]),("15min",30 * 17))
+    self.assertEqual(rollup_series(tags,["1"],start,end,n_out=500)["level"],"1h")
+
+  def test_short_series(self):
+    np.testing.assert_array_equal(downsample_indices(np.arange(5),np.ones(5),10),np.arange(5))
+
+
+if __name__ == "__main__":
+  unittest.main()
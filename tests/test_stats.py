@@ -0,0 +1,72 @@
+from app.stats import Profile,QuantileSketch,dataset_profile
+from app.storage import DatasetStore
+import unittest,tempfile,json,numpy as np,pandas as pd
+
+
+def make_frame(n:int = 20_000,seed:int = 0) -> pd.DataFrame:
+  rng = np.random.default_rng(seed)
+  df = pd.DataFrame({"a":rng.normal(100,5,n),"b":rng.exponential(2,n)})
+  df["c"] = df["a"] * 0.3 + rng.normal(0,1,n)
+  df.loc[rng.random(n) < 0.1,"b"] = np.nan
+  df["dt"] = pd.date_range("2025-09-10",periods=n,freq="min")
+  return df
+
+
+class TestProfile(unittest.TestCase):
+  def assert_matches(self,profile:Profile,df:pd.DataFrame):
+    ref = df.drop(columns="dt").describe()
+    out = pd.DataFrame(profile.describe())[ref.columns]
+    for stat in ("count","mean","std","min","max"): np.testing.assert_allclose(out.loc[stat],ref.loc[stat],rtol=1e-9)
+    for stat in ("25%","50%","75%"): np.testing.assert_allclose(out.loc[stat],ref.loc[stat],atol=0.05 * ref.loc["std"].max())
+    np.testing.assert_allclose(pd.DataFrame(profile.correlation()).loc[ref.columns,ref.columns],df.drop(columns="dt").corr(),atol=1e-9)
+    self.assertEqual(profile.nulls,df.drop(columns="dt").isna().sum().to_dict())
+
+  def test_streaming_matches_pandas(self):
+    df = make_frame()
+    profile = Profile()
+    for chunk in np.array_split(df.index,17): profile.update(df.loc[chunk])
+    self.assertEqual(profile.n_rows,len(df))
+    self.assert_matches(profile,df)
+
+  def test_merge(self):
+    df = make_frame()
+    profile = Profile.from_frame(df.iloc[:5000])
+    profile.merge(Profile.from_frame(df.iloc[5000:].assign(a=lambda d: d["a"] + 5)))
+    expected = pd.concat([df.iloc[:5000],df.iloc[5000:].assign(a=lambda d: d["a"] + 5)])
+    self.assert_matches(profile,expected)
+
+  def test_roundtrip_and_histograms(self):
+    profile = Profile.from_frame(make_frame())
+    restored = Profile.from_dict(json.loads(json.dumps(profile.to_dict())))
+    self.assertEqual(restored.describe(),profile.describe())
+    hist = restored.histograms(bins=10)["b"]
+    self.assertEqual(len(hist["edges"]),11)
+    self.assertAlmostEqual(sum(hist["counts"]),profile.count[1],delta=10)
+
+  def test_outliers(self):
+    df = make_frame()
+    self.assertFalse(Profile.from_frame(df[["a","dt"]]).has_outliers())
+    df.loc[10,"a"] = 1e6
+    self.assertTrue(Profile.from_frame(df[["a","dt"]]).has_outliers())
+
+  def test_sketch_is_bounded(self):
+    sketch = QuantileSketch(k=64)
+    for _ in range(50): sketch.update(np.random.default_rng(1).random(10_000))
+    self.assertLess(sum(len(l) for l in sketch.levels),64 * len(sketch.levels) + 1)
+    self.assertAlmostEqual(sketch.quantiles([0.5])[0],0.5,delta=0.05)
+
+  def test_dataset_profile(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      store = DatasetStore(tmp)
+      df = make_frame()
+      store.write(df)
+      self.assertFalse(store.profile.exists())
+      self.assert_matches(dataset_profile(store),df)
+      self.assertTrue(store.profile.exists())
+      store.append(make_frame(10,seed=1).assign(dt=pd.date_range("2026-01-01",periods=10,freq="min")))
+      self.assertFalse(store.profile.exists())
+      self.assertEqual(dataset_profile(store).n_rows,len(df) + 10)
+
+
+if __name__ == "__main__":
+  unittest.main()
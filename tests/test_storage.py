@@ -0,0 +1,98 @@
+from app.storage import DatasetStore
+from app.config import Config
+import unittest,tempfile,pathlib,numpy as np,pandas as pd
+
+
+def make_frame(start:str,periods:int) -> pd.DataFrame:
+  dt = pd.date_range(start,periods=periods,freq="h",tz=Config.utc)
+  return pd.DataFrame({"1":np.arange(periods,dtype=float),"2":np.arange(periods) * 2.0,"dt":dt})
+
+
+class TestDatasetStore(unittest.TestCase):
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.store = DatasetStore(pathlib.Path(self.tmp.name))
+
+  def tearDown(self) -> None: self.tmp.cleanup()
+
+  def test_write_and_read(self):
+    self.assertFalse(self.store.exists())
+    df = make_frame("2025-09-10",48)
+    with self.store.writer() as w:
+      w.write(df.iloc[:24])
+      w.write(df.iloc[24:])
+    self.assertEqual(self.store.format,"parquet")
+    self.assertEqual(self.store.columns(),["1","2","dt"])
+    self.assertEqual(self.store.num_rows(),48)
+    out = self.store.read()
+    self.assertEqual(str(out["dt"].dtype),"datetime64[ns, UTC+07:00]")
+    pd.testing.assert_frame_equal(out,df)
+    self.assertEqual(list(self.store.read(columns=["2"]).columns),["2"])
+    self.assertEqual(self.store.read(columns=["1"],index=True).index.name,"dt")
+
+  def test_time_range(self):
+    self.store.write(make_frame("2025-09-10",48))
+    out = self.store.read(columns=["1"],start="2025-09-11 00:00",end="2025-09-11 02:00")
+    self.assertEqual(out["1"].tolist(),[24.0,25.0,26.0])
+    self.assertEqual(len(self.store.read(start=pd.Timestamp("2025-09-11 22:00",tz=Config.utc))),2)
+
+  def test_append(self):
+    self.store.write(make_frame("2025-09-10",24))
+    self.store.append(make_frame("2025-09-11",24))
+    self.assertEqual(len(self.store.parts()),2)
+    self.assertEqual(self.store.read()["1"].tolist(),list(range(24)) * 2)
+
+  def test_failed_write_keeps_data(self):
+    self.store.write(make_frame("2025-09-10",24))
+    with self.assertRaises(RuntimeError):
+      with self.store.writer() as w:
+        w.write(make_frame("2025-09-12",24))
+        raise RuntimeError("interrupted")
+    self.assertEqual(self.store.read()["dt"].iloc[0],pd.Timestamp("2025-09-10",tz=Config.utc))
+
+  def test_csv_fallback_and_migrate(self):
+    make_frame("2025-09-10",48).to_csv(self.store.csv,index=False)
+    self.assertEqual(self.store.format,"csv")
+    self.assertEqual(self.store.num_rows(),48)
+    self.assertEqual(self.store.read(columns=["2"],start="2025-09-11 23:00")["2"].tolist(),[94.0])
+    self.assertTrue(self.store.migrate(chunksize=10))
+    self.assertEqual(self.store.format,"parquet")
+    self.assertFalse(self.store.csv.exists())
+    self.assertEqual(self.store.num_rows(),48)
+    self.assertFalse(self.store.migrate())
+
+  def test_sample(self):
+    df = make_frame("2025-09-10",24 * 10)
+    with self.store.writer() as w:
+      for day in range(10): w.write(df.iloc[day * 24:(day + 1) * 24])
+    out = self.store.sample(5,seed=1)
+    self.assertEqual(len(out),5)
+    self.assertTrue(out.index.is_monotonic_increasing)
+    pd.testing.assert_frame_equal(out,df.loc[out.index])
+    pd.testing.assert_frame_equal(self.store.sample(5,seed=1),out)
+    self.assertEqual(len(self.store.sample(1000)),240)
+    window = self.store.sample(50,seed=2,columns=["1","dt"],start="2025-09-12 12:00",end="2025-09-13 06:00")
+    self.assertEqual(len(window),19)
+    self.assertEqual(window["1"].tolist(),list(range(60,79)))
+
+  def test_sample_stratified(self):
+    df = make_frame("2025-09-10",200).assign(label=lambda d: np.where(np.arange(200) < 180,"a","b"))
+    self.store.write(df)
+    out = self.store.sample(10,seed=0,stratify="label")
+    self.assertEqual(out["label"].value_counts().to_dict(),{"a":9,"b":1})
+    self.assertEqual(self.store.sample(2,seed=0,stratify="label")["label"].tolist().count("b"),1)
+
+  def test_sample_csv(self):
+    df = make_frame("2025-09-10",100).assign(label=lambda d: np.arange(100) % 2)
+    df.to_csv(self.store.csv,index=False)
+    out = self.store.sample(7,seed=3)
+    self.assertEqual(len(out),7)
+    np.testing.assert_array_equal(out["1"].to_numpy(),df.loc[out.index,"1"].to_numpy())
+    self.assertTrue((self.store.root/"data.csv.idx.npy").exists())
+    window = self.store.sample(100,start="2025-09-13 00:00")
+    self.assertEqual(window.index.tolist(),list(range(72,100)))
+    self.assertEqual(self.store.sample(10,seed=0,stratify="label")["label"].sum(),5)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,109 @@
+from app.tagstore import TagStore,rollup,level_for
+from app import tagstore
+from app.align import align_day,make_grid
+from app.config import Config
+from datetime import datetime
+from app.helpers import FMT_DT
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import unittest,tempfile,time,numpy as np,pandas as pd
+
+
+def make_day(date:str,row_id:int = 216998630) -> pd.DataFrame:
+  dt = pd.date_range(pd.Timestamp(date,tz=Config.utc),periods=86_400,freq="s",name="dt")
+  return pd.DataFrame({row_id:np.arange(86_400,dtype=float)},index=dt)
+
+
+class TestTagStore(unittest.TestCase):
+  def setUp(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.tags = TagStore(self.tmp.name)
+
+  def tearDown(self) -> None: self.tmp.cleanup()
+
+  def test_put_and_get(self):
+    self.assertIsNone(self.tags.get("216998630","20250910"))
+    self.tags.put("216998630","20250910",make_day("2025-09-10"))
+    self.assertTrue(self.tags.has(216998630,"20250910"))
+    self.assertEqual(self.tags.rows("216998630","20250910"),86_400)
+    df = self.tags.get("216998630","20250910","08:00:00","08:59:59")
+    self.assertEqual(len(df),3600)
+    self.assertEqual(list(df.columns),["value"])
+    self.assertEqual(df.index[0],pd.Timestamp("2025-09-10 08:00",tz=Config.utc))
+    self.assertEqual(str(df.index.dtype),"datetime64[ns, UTC+07:00]")
+    self.assertEqual(self.tags.stats()["days"],1)
+
+  def test_empty_and_incomplete_days(self):
+    self.tags.put("216998630","20250911",pd.DataFrame())
+    self.assertTrue(self.tags.has("216998630","20250911"))
+    self.assertTrue(self.tags.get("216998630","20250911").empty)
+    today = datetime.now(tz=Config.utc).strftime(FMT_DT)
+    self.tags.put("216998630",today,make_day(today))
+    self.assertFalse(self.tags.has("216998630",today))
+    self.assertEqual(self.tags.missing([("216998630","20250911"),("216998630",today),("216998631","20250911")]),
+                     [("216998630",today),("216998631","20250911")])
+    self.assertEqual(self.tags.days("216998630"),sorted(["20250911",today]))
+
+  def test_fresh(self):
+    today = datetime.now(tz=Config.utc).strftime(FMT_DT)
+    self.assertFalse(self.tags.fresh("216998630",today,60))
+    self.tags.put("216998630",today,pd.DataFrame())
+    self.assertTrue(self.tags.fresh("216998630",today,60))
+    self.assertFalse(self.tags.fresh("216998630",today,0))
+    self.tags.put("216998630","20250910",pd.DataFrame())
+    self.assertTrue(self.tags.fresh("216998630","20250910",0))
+
+  def test_lock(self):
+    for fcntl in (tagstore.fcntl,None):
+      with mock.patch.object(tagstore,"fcntl",fcntl):
+        inside,overlaps = [0],[]
+        def hold(_):
+          with self.tags.lock("216998630","20250910"):
+            inside[0] += 1
+            overlaps.append(inside[0])
+            time.sleep(0.01)
+            inside[0] -= 1
+        with ThreadPoolExecutor(8) as pool: list(pool.map(hold,range(32)))
+        self.assertEqual(set(overlaps),{1})
+    self.assertEqual(list(self.tags.root.rglob("*.lock")),[])
+
+  def test_rollups(self):
+    df = make_day("2025-09-10")
+    df.iloc[59:61] = np.nan
+    r = rollup(df,60)
+    self.assertEqual(len(r),1441)
+    self.assertEqual(r.index[1],pd.Timestamp("2025-09-10 00:01",tz=Config.utc))
+    self.assertEqual(r.iloc[1][["min","max","last","count"]].tolist(),[1.0,58.0,58.0,58])
+    self.assertEqual(r["last_dt"].iloc[1],pd.Timestamp("2025-09-10 00:00:58",tz=Config.utc))
+    self.assertEqual(r["count"].sum(),86_398)
+    self.assertEqual(rollup(df,3600)["max"].iloc[-1],86_399)
+    self.assertEqual(level_for(3600,"00:00:00","23:59:59"),"1h")
+    self.assertEqual(level_for(3600,"00:00:00","23:59:00"),"1min")
+    self.assertEqual(level_for(900,"08:00:00","17:00:00"),"15min")
+    self.assertIsNone(level_for(30))
+    self.assertIsNone(level_for(60,"08:00:30","17:00:00"))
+
+  def test_rollup_alignment_matches_raw(self):
+    rng = np.random.default_rng(4)
+    for date in ("20250910","20250911"):
+      day = pd.Timestamp(date,tz=Config.utc)
+      ts = np.sort(rng.choice(86_400,size=20_000,replace=False))
+      values = rng.normal(size=len(ts))
+      values[rng.random(len(ts)) < 0.05] = np.nan
+      self.tags.put("1",date,pd.DataFrame({1:values},index=(day + pd.to_timedelta(ts,unit="s")).rename("dt")))
+    (self.tags.rollup_path("1","20250911","15min")).unlink()
+    for step,start,end,fill,staleness in ((60,"00:00:00","23:59:00","ffill",None),(900,"08:00:00","17:00:00","ffill",120),
+                                          (3600,"00:00:00","23:59:59","none",None)):
+      level,raw,rolled = level_for(step,start,end),None,None
+      self.assertIsNotNone(level)
+      for date in ("20250910","20250911"):
+        grid = make_grid(date,start,end,step)
+        a,raw = align_day({"1":self.tags.samples("1",date,start,end)},["1"],grid,fill,staleness,raw)
+        b,rolled = align_day({"1":self.tags.samples("1",date,start,end,level)},["1"],grid,fill,staleness,rolled)
+        pd.testing.assert_frame_equal(a,b)
+        self.assertEqual(raw,rolled)
+    self.assertTrue(self.tags.rollup_path("1","20250911","15min").exists())
+
+
+if __name__ == "__main__":
+  unittest.main()